@@ -1,22 +1,38 @@
 import math
 import pandas as pd
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List
 import numpy as np
-from app.pydantic_config import RouteResponse
+from app.reference_data import ReferenceData, get_reference_data, station_row_index
+from app.brain import PlanStep, plan_start
+from app.config import distance_dtype
+from app.road_network import RoadNetwork
+from app.spatial_index import StationGridIndex
+from app.station_matrix import StationMatrix, average_speed_kmh
 
 
-def validate_input(origin, stop, truck_model, start_time):
+def _as_stop_list(stops):
+    """ A single stop or a list of stops as a list without duplicates """
+    return [stops] if isinstance(stops, str) else list(dict.fromkeys(stops))
+
+def validate_input(origin, stop, truck_model, start_time, reference: ReferenceData = None):
     """ 1. Validate if input parameters are valid as per the city and truck model specifications
         2. Return the city choices, truck specifications and combined charge points datasets
+        stop: a single stop or the list of all stops
+        reference: snapshot of the reference data to use, defaults to the one loaded at startup
     """
-    city_choices= json.load(open("./data/city_choices.json"))
-    if origin not in city_choices.keys() or stop not in city_choices.keys():
+    reference = reference or get_reference_data()
+    city_choices= reference.city_choices
+    if origin not in city_choices.keys() or any(s not in city_choices.keys() for s in _as_stop_list(stop)):
         print("Invalid city choice. Please choose from the available cities.")
         raise ValueError("Invalid city choice. Please choose from the available cities.")
-    truck_spec = json.load(open("./data/truck_specs.json"))
+    truck_spec = reference.truck_specs
+    if truck_model not in truck_spec:
+        print("Invalid truck model. Please choose from the available truck models.")
+        raise ValueError(f"Invalid truck model {truck_model}. Please choose from the available truck models.")
 
-    combined_charge_points = pd.read_csv("./data/combined_charge_points.csv")
+    combined_charge_points = reference.charge_points
     truck_model = truck_spec[truck_model]
 
     today_date = datetime.now().date()
@@ -41,93 +57,140 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     return rad * c
 
-def filter_stations(origins, df, max_distance):
+def haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float64):
+    """ Vectorized haversine formula
+        Return the (len(lat1), len(lat2)) matrix of distances in km between every point of the first and every point of the second set.
+        dtype: np.float32 halves the memory of the matrix for large station sets
+    """
+    lat1 = np.asarray(lat1, dtype=dtype)[:, None]
+    lon1 = np.asarray(lon1, dtype=dtype)[:, None]
+    lat2 = np.asarray(lat2, dtype=dtype)[None, :]
+    lon2 = np.asarray(lon2, dtype=dtype)[None, :]
+
+    # distance between latitudes and longitudes
+    dLat = (lat2 - lat1) * np.pi / 180.0
+    dLon = (lon2 - lon1) * np.pi / 180.0
+
+    # apply formulae, reusing the (n, m) buffer to keep a single matrix allocation alive
+    a = np.sin(dLat / 2) ** 2
+    a += np.sin(dLon / 2) ** 2 * np.cos(lat1 * np.pi / 180.0) * np.cos(lat2 * np.pi / 180.0)
+    np.minimum(a, 1, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2
+    a *= 6371
+    return a
+
+def filter_stations(origins, df, max_distance, station_index: StationGridIndex = None):
     """
     Filter stations within `max_distance` km of any origin based on haversine distance. 
+    station_index: spatial index over the rows of `df`, built on the fly if not given
+    The index of the result is the row position of each station in `df`, to look up per-station arrays of the whole table.
     """
-    filtered_stations = []
-
-    for index, row in df.iterrows():
-        station_lat, station_lon = row["latitude"], row["longitude"]
-
-        # Check against all origins
-        for origin in origins:
-            o_lat = origin["point"]["latitude"]
-            o_lon = origin["point"]["longitude"]
-            distance = haversine(o_lat, o_lon, station_lat, station_lon)
-
-            if distance <= max_distance:
-                filtered_stations.append(row)
-                break  # No need to check other origins for this station
-
-    return pd.DataFrame(filtered_stations).reset_index(drop=True)
+    if station_index is None:
+        station_index = StationGridIndex(df["latitude"].to_numpy(), df["longitude"].to_numpy())
+    o_lat = [origin["point"]["latitude"] for origin in origins]
+    o_lon = [origin["point"]["longitude"] for origin in origins]
+    positions = station_index.query_radius(o_lat, o_lon, max_distance)
+    stations = df.iloc[positions]
+    stations.index = positions
+    return stations
+
+def travel_time_matrix(distances):
+    """ Travel times (minutes) of haversine distances (km) at the planning speed """
+    return distances / average_speed_kmh * 60
 
 def create_matrix_new(matrix, origin, stop, filtered_station_df):
-    """ Matrix (list of lists) having distances mapped into a dataframe with origin, stop and filtered stations as index and columns
+    """ Matrix (2D array) having distances wrapped into a dataframe with origin, stop(s) and filtered stations as index and columns
+        The array is wrapped as is, without copying it
     """
-    num_origins = len(matrix)
-    num_destinations = len(matrix[0])
-    distance_matrix = [[None for _ in range(num_destinations)] for _ in range(num_origins)]
-    # Populate the matrix with the response data
-    for i in range(num_origins):    
-        for j in range(num_destinations):
-            distance_matrix[i][j] = matrix[i][j]       
-
-    return pd.DataFrame(distance_matrix, index=[origin, stop] + [int(row['ID']) for _, row in filtered_station_df.iterrows()], 
-                        columns=[origin, stop] + [int(row['ID']) for _, row in filtered_station_df.iterrows()])
-
-async def input_from_user(origin, stop, city_choices, combined_charge_points, truck_model):
+    station_ids = filtered_station_df["ID"].astype(int).tolist() if len(filtered_station_df) else []
+    labels = [origin] + _as_stop_list(stop) + station_ids
+    return pd.DataFrame(np.asarray(matrix), index=labels, columns=labels, copy=False)
+
+def add_location(distance_matrix, time_matrix, filtered_station_df, city_choices, label, road_network: RoadNetwork = None):
+    """ Copies of the distance and time matrices from build_distance_matrix with one more location in front, e.g. the current position of a truck.
+        Only the distances and times of the new location are computed, its coordinates and the ones of the cities are taken from `city_choices`
+        road_network: road distances and truck travel times to and from the new location instead of haversine ones
+    """
+    n_cities = len(distance_matrix) - len(filtered_station_df)
+    dtype = distance_matrix.to_numpy().dtype
+    if road_network is None:
+        latitudes = [city_choices[city][0] for city in distance_matrix.index[:n_cities]]
+        longitudes = [city_choices[city][1] for city in distance_matrix.index[:n_cities]]
+        if len(filtered_station_df):
+            latitudes = np.concatenate((latitudes, filtered_station_df["latitude"].to_numpy(dtype=np.float64)))
+            longitudes = np.concatenate((longitudes, filtered_station_df["longitude"].to_numpy(dtype=np.float64)))
+        distances_to = distances_from = haversine_matrix([city_choices[label][0]], [city_choices[label][1]], latitudes, longitudes, dtype=dtype)[0]
+        times_to, times_from = travel_time_matrix(distances_to), travel_time_matrix(distances_from)
+    else:
+        positions = road_network.positions(distance_matrix.index[:n_cities], filtered_station_df["ID"])
+        distances_to, distances_from, times_to, times_from = road_network.point_distances(city_choices[label][0], city_choices[label][1], positions)
+
+    labels = [label] + list(distance_matrix.index)
+    matrices = []
+    for existing, to, back in ((distance_matrix, distances_to, distances_from), (time_matrix, times_to, times_from)):
+        matrix = np.empty((len(existing) + 1, len(existing) + 1), dtype=dtype)
+        matrix[0, 0] = 0
+        matrix[0, 1:] = to
+        matrix[1:, 0] = back
+        matrix[1:, 1:] = existing.to_numpy()
+        matrices.append(pd.DataFrame(matrix, index=labels, columns=labels, copy=False))
+    return tuple(matrices)
+
+def build_distance_matrix(origin, stop, city_choices, combined_charge_points, truck_model, dtype=distance_dtype, station_index=None, station_matrix: StationMatrix = None,
+                          road_network: RoadNetwork = None):
     """ 1. Filter stations within truck range
-        2. Create distance matrix with origin, stop and filtered stations based on haversine distance
+        2. Create distance (km) and travel time (minutes) matrices with origin, stop(s) and filtered stations based on haversine distance
+        Return (distance matrix, time matrix, filtered stations).
+        stop: a single stop or the list of all stops of the tour
+        dtype: dtype of the distance matrix, float32 halves its memory
+        station_index: spatial index over `combined_charge_points`, e.g. the one of the reference data snapshot
+        station_matrix: precomputed station x station distances and times, only the origin and stop rows are computed if given
+        road_network: road distances and truck travel times (directed) looked up for all locations instead of haversine ones
     """ 
-    # Combine stop time with today's date
+    stops = [s for s in _as_stop_list(stop) if s != origin]
     origins= []
-    origins.append({
-        "point": {  "latitude": city_choices[origin][0], "longitude": city_choices[origin][1]}
-    })
-    origins.append({
-        "point": {  "latitude": city_choices[stop][0], "longitude": city_choices[stop][1]}
-    })
-
-    # Combine stop time with today's date
-    destinations= []
-    destinations.append({
-        "point": {  "latitude": city_choices[origin][0], "longitude": city_choices[origin][1]}
-    })
-    destinations.append({
-        "point": {  "latitude": city_choices[stop][0], "longitude": city_choices[stop][1]}
-    })
-
-    # filter stations within truck range
-    combined_charge_points= filter_stations(origins, combined_charge_points, max_distance=truck_model["Range_80%_km"])
-
-    for index, row in combined_charge_points.iterrows():
+    for city in [origin] + stops:
         origins.append({
-            "point": {
-                "latitude": row["latitude"],
-                "longitude": row["longitude"]
-            }
-        })
-        destinations.append({
-            "point": {
-                "latitude": row["latitude"],
-                "longitude": row["longitude"]
-            }
+            "point": {  "latitude": city_choices[city][0], "longitude": city_choices[city][1]}
         })
+    n_cities = len(origins)
 
-    origins_input = [(o["point"]["latitude"], o["point"]["longitude"]) for o in origins]
-    destinations_input = [(d["point"]["latitude"], d["point"]["longitude"]) for d in destinations]
-
-    # compute haversine distance between origins and destinations
-    matrix = []
-    for o_lat, o_lon in origins_input:
-        row = []
-        for d_lat, d_lon in destinations_input:
-            row.append(haversine(o_lat, o_lon, d_lat, d_lon))
-        matrix.append(row)
-    
-    df_dist = create_matrix_new(matrix, origin, stop, combined_charge_points)
-    return df_dist, combined_charge_points
+    # filter stations within truck range
+    combined_charge_points= filter_stations(origins, combined_charge_points, max_distance=truck_model["Range_80%_km"], station_index=station_index)
+
+    # origins and destinations are the same set: origin, stops and the filtered stations
+    latitudes = [o["point"]["latitude"] for o in origins]
+    longitudes = [o["point"]["longitude"] for o in origins]
+    if len(combined_charge_points):
+        latitudes = np.concatenate((latitudes, combined_charge_points["latitude"].to_numpy(dtype=np.float64)))
+        longitudes = np.concatenate((longitudes, combined_charge_points["longitude"].to_numpy(dtype=np.float64)))
+
+    if road_network is not None:
+        # every city and station is a location of the road network, the matrix is a lookup
+        positions = road_network.positions([origin] + stops, combined_charge_points["ID"])
+        matrix = road_network.submatrix(positions, dtype=dtype)
+        times = road_network.submatrix(positions, dtype=dtype, times=True)
+    elif station_matrix is None:
+        # compute haversine distance between all origins and destinations in one shot
+        matrix = haversine_matrix(latitudes, longitudes, latitudes, longitudes, dtype=dtype)
+        times = travel_time_matrix(matrix)
+    else:
+        # station to station distances and times come from the precomputed matrices, only origin/stop rows and columns are computed
+        matrix = np.empty((len(latitudes), len(latitudes)), dtype=dtype)
+        matrix[:n_cities, :] = haversine_matrix(latitudes[:n_cities], longitudes[:n_cities], latitudes, longitudes, dtype=dtype)
+        matrix[n_cities:, :n_cities] = haversine_matrix(latitudes[n_cities:], longitudes[n_cities:], latitudes[:n_cities], longitudes[:n_cities], dtype=dtype)
+        times = np.empty_like(matrix)
+        times[:n_cities, :] = travel_time_matrix(matrix[:n_cities, :])
+        times[n_cities:, :n_cities] = travel_time_matrix(matrix[n_cities:, :n_cities])
+        positions = station_matrix.positions(combined_charge_points["ID"])
+        station_matrix.submatrix(positions, out=matrix[n_cities:, n_cities:])
+        station_matrix.submatrix(positions, out=times[n_cities:, n_cities:], times=True)
+
+    df_dist = create_matrix_new(matrix, origin, stops, combined_charge_points)
+    df_time = create_matrix_new(times, origin, stops, combined_charge_points)
+    return df_dist, df_time, combined_charge_points
 
 
 def parse_duration(start, end):
@@ -137,43 +200,47 @@ def parse_duration(start, end):
     return int((t2 - t1).total_seconds() // 60)
 
 
-def transform(raw_data, city_choices, combined_charge_points) -> RouteResponse:
-    """ Transform raw_data from compute_schedule to RouteResponse format
+def transform(raw_data: List[PlanStep], city_choices, combined_charge_points, station_rows=None) -> dict:
+    """ Transform the plan steps from compute_schedule to the fields of a RouteResponse
+        station_rows: station ID -> row of `combined_charge_points`, e.g. the one of the reference data snapshot
+        The totals are the driven distance (km) and driving time (hours) of the drive steps of the plan.
     """
+    if station_rows is None:
+        station_rows = station_row_index(combined_charge_points["ID"])
+    station_lat = combined_charge_points["latitude"].to_numpy()
+    station_lon = combined_charge_points["longitude"].to_numpy()
     route = []
+    total_distance = 0
+    driving_ticks = 0
     for step in raw_data:
-        station = combined_charge_points[combined_charge_points["ID"] == step["to"]]
-        if station.empty:
+        row = station_rows.get(step.to) if not isinstance(step.to, str) else None
+        if row is None:
             # if the current step is at a customer stop
-            lat, lon = city_choices.get(step["to"], (None, None))
+            lat, lon = city_choices.get(step.to, (None, None))
         else:
             # if the current step is at a charging station
-            lat = station.iloc[0]["latitude"]
-            lon = station.iloc[0]["longitude"]
+            lat = station_lat[row]
+            lon = station_lon[row]
+        if step.action in ("drive_to_charger", "drive_to_load/unload"):
+            total_distance += float(step.distance_km)
+            driving_ticks += step.end - step.start
+        # plan times are microseconds since plan_start, shown in whole minutes
+        start_minute, end_minute = step.start // 60_000_000, step.end // 60_000_000
         route.append(
             {
-                "time": step["start"],
-                "location": str(step["to"]),  # you may map ID → station name/coords
+                "time": (plan_start + timedelta(minutes=start_minute)).strftime("%H:%M"),
+                "location": str(step.to),  # you may map ID → station name/coords
                 "latitude": lat,             # fill from station lookup if available
                 "longitude": lon,
                 "points": [],
-                "action": step["action"],
-                "duration": parse_duration(step["start"], step["end"]),
-                "SOC": round((step["SOC_kWh"])),
+                "action": step.action,
+                "duration": end_minute - start_minute,
+                "SOC": round(step.SOC_kWh),
                 "why": "",  # optionally add explainable logic
             }
         )
     return {
         "route": route,
-        "total_distance": 0,
-        "total_duration": 0,
+        "total_distance": total_distance,
+        "total_duration": driving_ticks / 3_600_000_000,
     }
-
-if __name__ == "__main__":
-
-    df= pd.read_csv("./data/combined_charge_points.csv")
-    df["price_€/kWh"] = (
-    df["price_€/kWh"]
-    .str.replace("€", "", regex=False)   # remove euro symbol
-    .astype(float))                    # convert to float
-    df.to_csv("./data/combined_charge_points.csv", index=False)
\ No newline at end of file
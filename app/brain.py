@@ -1,21 +1,56 @@
 import pandas as pd
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import datetime
 import numpy as np
-from typing import List
-from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.energy import EnergyModel, leg_speed_kmh
 
 
 """ Assumptions """
-consumption_rate = 1.2  # kWh/km
+consumption_rate = 1.2  # kWh/km, default of trucks without an energy model
+average_speed_kmh = 80  # travel times of plans without a time matrix
 time_stoppage_at_nodes= 45 # driver takes break at each node except final destination
 driving_cost_per_km = 0.05 # Driving cost per km
 
-class State(BaseModel):
-    currentTime: datetime = Field(default_factory=lambda: datetime(2025, 1, 1, 9, 0))
-    currentLocation: str = ""
-    currentBattery: int = 100
-    totalCost: float = 0.0
-    plan: List[str] = Field(default_factory=list) # A list of actions taken so far 
+plan_start = datetime(2025, 1, 1, 9, 0)  # plans start at 09:00, plan times are counted from here
+
+
+def ticks(minutes) -> int:
+    """ Duration in minutes as integer microseconds, rounded like timedelta(minutes=...) """
+    return round(minutes * 60_000_000)
+
+
+@dataclass
+class PlanStep:
+    """ One step of a plan, start and end in microseconds since plan_start """
+    __slots__ = ("action", "origin", "to", "start", "end", "SOC_kWh", "distance_km", "cost")
+    action: str
+    origin: object  # 'from': city name, station ID or "" for the start
+    to: object
+    start: int
+    end: int
+    SOC_kWh: float
+    distance_km: float
+    cost: float  # €
+
+
+class State:
+    """ Truck state while a plan is computed, currentTime in microseconds since plan_start """
+    __slots__ = ("currentTime", "currentLocation", "currentBattery", "totalCost", "plan")
+
+    def __init__(self, currentTime=0, currentLocation="", currentBattery=100, totalCost=0.0):
+        self.currentTime = currentTime
+        self.currentLocation = currentLocation
+        self.currentBattery = currentBattery
+        self.totalCost = totalCost
+        self.plan: List[PlanStep] = []  # steps taken so far
+
+    def add_step(self, action, origin, to, minutes, soc_kwh, distance_km=0, cost=0) -> PlanStep:
+        """ Append a step starting now and lasting `minutes`, the current time is not advanced """
+        step = PlanStep(action, origin, to, self.currentTime, self.currentTime + ticks(minutes), soc_kwh, distance_km, cost)
+        self.plan.append(step)
+        return step
 
 def pick_station_on_strategy(charging_stations, strategy= "time-optimal"):
     """ Pick strategy to select charging station to either minimize charging time or minmise cost of charging 
@@ -30,14 +65,48 @@ def pick_station_on_strategy(charging_stations, strategy= "time-optimal"):
         charging_stations= charging_stations.sort_values(by="max_power_kW", ascending=False)
     return charging_stations.iloc[0]
 
-def nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal"):
+def consumption_of(truck_spec, energy_model: Optional[EnergyModel] = None) -> float:
+    """ kWh/km of the truck at the planning speed, from its energy model or the curves of its spec """
+    return float((energy_model or EnergyModel.from_spec(truck_spec)).kwh_per_km())
+
+def leg_minutes(distances, times, rows, columns):
+    """ Travel minutes of the legs rows -> columns: from the time array, or the distances at average_speed_kmh without one """
+    if times is None:
+        return distances[rows, columns] / average_speed_kmh * 60
+    return times[rows, columns]
+
+def leg_energy(energy_model: EnergyModel, distances, times, rows, columns):
+    """ kWh of the legs rows -> columns (scalars or arrays of all candidate legs at once), each at its own average speed """
+    km = distances[rows, columns]
+    return energy_model.energy(km, leg_speed_kmh(km, leg_minutes(distances, times, rows, columns)))
+
+def station_power_and_price(charging_stations, station_power_kw=None, station_price=None):
+    """ Charging power (kW) and price (€/kWh) of the rows of `charging_stations`.
+        station_power_kw/station_price: arrays over the whole station table (ReferenceData), looked up with the row
+        positions filter_stations keeps as the index of `charging_stations`; without them the columns are read
+    """
+    if station_power_kw is None or station_price is None:
+        return charging_stations["max_power_kW"].to_numpy(), charging_stations["price_€/kWh"].to_numpy()
+    rows = charging_stations.index.to_numpy()
+    return station_power_kw[rows], station_price[rows]
+
+def nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal",
+                    energy_model: Optional[EnergyModel] = None, time_matrix: Optional[pd.DataFrame] = None):
     # remove charging stations already in path
     charging_stations = charging_stations[~charging_stations['station_name'].isin(charging_station_in_path)]
-    charging_stations['dist_to_origin'] = charging_stations['station_name'].apply(
+    charging_stations = charging_stations.assign(dist_to_origin=charging_stations['station_name'].apply(
         lambda x: distance_matrix.loc[origin, x]
-    )
+    ))
+    # energy to every station at the average speed of its leg
+    energy_model = energy_model or EnergyModel.from_spec({"Consumption_kWh_per_km": consumption_rate})
+    distances = charging_stations['dist_to_origin'].to_numpy(dtype=np.float64)
+    if time_matrix is None:
+        minutes = distances / average_speed_kmh * 60
+    else:
+        minutes = charging_stations['station_name'].apply(lambda x: time_matrix.loc[origin, x]).to_numpy(dtype=np.float64)
+    charging_stations = charging_stations.assign(energy_to_origin=energy_model.energy(distances, leg_speed_kmh(distances, minutes)))
     # filter out stations that are at origin or unreachable given the current charge
-    charging_stations = charging_stations[(charging_stations['dist_to_origin'] <= (truck_state.currentBattery / consumption_rate)) & (charging_stations['dist_to_origin'] > 0)]
+    charging_stations = charging_stations[(charging_stations['energy_to_origin'] <= truck_state.currentBattery) & (charging_stations['dist_to_origin'] > 0)]
     if charging_stations.empty:
         raise Exception("Infeasible route: No reachable charging stations available.")
     return pick_station_on_strategy(charging_stations, strategy)
@@ -45,7 +114,8 @@ def nearest_station(origin, distance_matrix, charging_stations, charging_station
 def compute_schedule(distance_matrix: pd.DataFrame, 
                      charging_stations: pd.DataFrame, 
                      origin: str,
-                     stops: List[str], tour: List, truck_spec) -> dict:
+                     stops: List[str], tour: List, truck_spec, energy_model: Optional[EnergyModel] = None,
+                     time_matrix: Optional[pd.DataFrame] = None) -> dict:
     """ Compute the schedule for the truck to visit all stops and return to origin
         distance_matrix: pd.DataFrame with distances between all points (including charging stations)
         charging_stations: pd.DataFrame with charging station details (latitude,longitude,max_power_kW,price_€/kWh,source)
@@ -53,60 +123,47 @@ def compute_schedule(distance_matrix: pd.DataFrame,
         stops: list of stops to visit
         tour: ordered list of locations to visit (including origin and stops)
         truck_spec: dict with truck specifications (battery capacity, consumption rate, etc.)
+        energy_model: consumption by payload and speed, defaults to the curves of truck_spec at its reference payload
+        time_matrix: pd.DataFrame with travel times (minutes) between all points, defaults to the distances at average_speed_kmh
     """
-    charging_stations.rename(columns={"ID": "station_name"}, inplace=True)
+    energy_model = energy_model or EnergyModel.from_spec(truck_spec)
+    charging_stations = charging_stations.rename(columns={"ID": "station_name"})
     locations= [origin] + stops
     for row in charging_stations.itertuples():
         locations.append(row.station_name)
     charging_station_in_path = []
-    time_matrix= distance_matrix / 80 * 60  # average speed 80 km/h
+    if time_matrix is None:
+        time_matrix = distance_matrix / average_speed_kmh * 60
     battery_capacity = truck_spec['Battery_capacity_80%_kWh'] # charging to 80% only for battery health
     battery_min = truck_spec['Battery_capacity_kWh'] * 0.1  # 10% minimum battery
     truck_state= State()
-    truck_state.plan.append({
-                'action': 'Start',
-                'from': "",
-                'to': origin,
-                'start': truck_state.currentTime.strftime("%H:%M"),
-                'end': truck_state.currentTime.strftime("%H:%M"),
-                'SOC_kWh': truck_state.currentBattery,
-                'distance_km': 0,
-                'cost_€': 0
-            })
+    truck_state.add_step('Start', "", origin, 0, truck_state.currentBattery, 0, 0)
     for i in range(len(tour) - 1):
         origin = tour[i]
         truck_state.currentLocation = origin
         dest = tour[i + 1]
 
         # Distance and time
-        dist = distance_matrix.loc[origin, dest]
-        travel_time = time_matrix.loc[origin, dest]
-        energy_needed = dist * consumption_rate
+        dist = float(distance_matrix.loc[origin, dest])
+        travel_time = float(time_matrix.loc[origin, dest])
+        energy_needed = float(energy_model.energy(dist, leg_speed_kmh(dist, travel_time)))
         leg_cost = dist * driving_cost_per_km
 
         # Battery check
         while truck_state.currentBattery - energy_needed < battery_min:
             # Pick nearest station
-            station = nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal")
+            station = nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal",
+                                      energy_model=energy_model, time_matrix=time_matrix)
             charging_station_in_path.append(station['station_name'])
-            detour_dist = distance_matrix.loc[origin, station['station_name']]
-            detour_energy = detour_dist * consumption_rate
+            detour_dist = float(distance_matrix.loc[origin, station['station_name']])
+            detour_energy = float(station['energy_to_origin'])
             detour_cost = detour_dist * driving_cost_per_km
-            travel_time_to_charger = time_matrix.loc[origin, station['station_name']]
+            travel_time_to_charger = float(time_matrix.loc[origin, station['station_name']])
 
             # Drive to charger
-            truck_state.plan.append({
-                'action': 'drive_to_charger',
-                'from': origin,
-                'to': station['station_name'],
-                'start': truck_state.currentTime.strftime("%H:%M"),
-                'end': (truck_state.currentTime + timedelta(minutes=travel_time_to_charger)).strftime("%H:%M"),
-                'SOC_kWh': truck_state.currentBattery - detour_energy,
-                'distance_km': detour_dist,
-                'cost_€': detour_cost
-            })
+            truck_state.add_step('drive_to_charger', origin, station['station_name'], travel_time_to_charger, truck_state.currentBattery - detour_energy, detour_dist, detour_cost)
             truck_state.currentBattery -= detour_energy
-            truck_state.currentTime += timedelta(minutes=travel_time_to_charger)
+            truck_state.currentTime += ticks(travel_time_to_charger)
 
             # Charging
             # TODO charges to full for simplicity. Adapt to need (check how much needed to reach next station or till end destination)
@@ -115,35 +172,188 @@ def compute_schedule(distance_matrix: pd.DataFrame,
             charging_cost = charge_needed * station['price_€/kWh']
             truck_state.currentBattery = battery_capacity
 
-            truck_state.plan.append({
-                'action': 'charging',
-                'from': station['station_name'],
-                'to': station['station_name'],
-                'start': truck_state.currentTime.strftime("%H:%M"),
-                'end': (truck_state.currentTime + timedelta(minutes=charge_time_min)).strftime("%H:%M"),
-                'SOC_kWh': truck_state.currentBattery,
-                'distance_km': np.nan,
-                'cost_€': charging_cost
-            })
-            truck_state.currentTime += timedelta(minutes=charge_time_min)
+            truck_state.add_step('charging', station['station_name'], station['station_name'], charge_time_min, truck_state.currentBattery, np.nan, charging_cost)
+            truck_state.currentTime += ticks(charge_time_min)
             origin = station['station_name']
             truck_state.currentLocation = origin
-            energy_needed= distance_matrix.loc[origin, dest]* consumption_rate
+            # the rest of the leg starts at the charger
+            dist = float(distance_matrix.loc[origin, dest])
+            travel_time = float(time_matrix.loc[origin, dest])
+            energy_needed = float(energy_model.energy(dist, leg_speed_kmh(dist, travel_time)))
+            leg_cost = dist * driving_cost_per_km
     
-        truck_state.plan.append({
-            'action': 'drive_to_load/unload',
-            'from': origin,
-            'to': dest,
-            'start': truck_state.currentTime.strftime("%H:%M"),
-            'end': (truck_state.currentTime + timedelta(minutes=travel_time)).strftime("%H:%M"),
-            'SOC_kWh': truck_state.currentBattery - energy_needed,
-            'distance_km': dist,
-            'cost_€': leg_cost
-        })
+        truck_state.add_step('drive_to_load/unload', origin, dest, travel_time, truck_state.currentBattery - energy_needed, dist, leg_cost)
         charging_station_in_path= [] # once the truck drives to a customer location, it can pick the same charging stations again
         truck_state.currentBattery -= energy_needed
         if dest== tour[-1]:  # if last destination, no need to add stoppage time
-            truck_state.currentTime += timedelta(minutes=travel_time)
+            truck_state.currentTime += ticks(travel_time)
+        else:
+            truck_state.currentTime += ticks(travel_time) + ticks(time_stoppage_at_nodes)
+    return truck_state
+
+
+def pick_station_index_on_strategy(power_kw, price, strategy="time-optimal"):
+    """ Array counterpart of pick_station_on_strategy: return the position of the station to pick among the candidates.
+        Uses argmax/argmin, ties are broken exactly like DataFrame.sort_values so both engines pick the same station.
+    """
+    if strategy == "cost-optimal":
+        values, ascending = price, True
+    else:
+        if strategy != "time-optimal":
+            print("Unknown strategy, defaulting to time-optimal")
+        values, ascending = power_kw, False
+    best = values.argmin() if ascending else values.argmax()
+    if np.count_nonzero(values == values[best]) == 1:
+        return best
+    # tie: replicate the (unstable) ordering of sort_values(kind="quicksort")
+    if ascending:
+        return values.argsort(kind="quicksort")[0]
+    return len(values) - 1 - values[::-1].argsort(kind="quicksort")[-1]
+
+def nearest_station_index(distances_from_origin, energy_from_origin, available, battery, power_kw, price, strategy="time-optimal"):
+    """ Array counterpart of nearest_station, return the row position of the picked charging station
+        distances_from_origin/energy_from_origin: distance (km) and energy (kWh, see leg_energy) from the current location to every charging station
+        available: mask of the charging stations not already in path
+    """
+    # filter out stations that are at origin or unreachable given the current charge
+    reachable = available & (energy_from_origin <= battery) & (distances_from_origin > 0)
+    candidates = np.flatnonzero(reachable)
+    if len(candidates) == 0:
+        raise Exception("Infeasible route: No reachable charging stations available.")
+    return candidates[pick_station_index_on_strategy(power_kw[candidates], price[candidates], strategy)]
+
+def nearest_free_station_index(distances_from_origin, energy_from_origin, available, battery, power_kw, price, arrival, charging_start,
+                               strategy="time-optimal"):
+    """ nearest_station_index among the stations with a free charger on arrival, or if all reachable ones are taken
+        the reachable station where charging can start first
+        arrival, charging_start: ticks of arrival and earliest charging start at every charging station
+    """
+    free = available & (charging_start == arrival)
+    reachable = available & (energy_from_origin <= battery) & (distances_from_origin > 0)
+    if (free & reachable).any():
+        return nearest_station_index(distances_from_origin, energy_from_origin, free, battery, power_kw, price, strategy)
+    candidates = np.flatnonzero(reachable)
+    if len(candidates) == 0:
+        raise Exception("Infeasible route: No reachable charging stations available.")
+    return candidates[charging_start[candidates].argmin()]
+
+def compute_schedule_fast(distance_matrix: pd.DataFrame, 
+                          charging_stations: pd.DataFrame, 
+                          origin: str,
+                          stops: List[str], tour: List, truck_spec, strategy="time-optimal",
+                          energy_model: Optional[EnergyModel] = None, start_soc=100, start_time=0, chargers=None, tariffs=None,
+                          station_power_kw=None, station_price=None, time_matrix: Optional[pd.DataFrame] = None) -> State:
+    """ Array-backed variant of compute_schedule producing the same plan.
+        Works on the integer-indexed distance array with a location -> index map instead of label lookups,
+        and does not modify `distance_matrix` or `charging_stations`.
+        start_soc/start_time: battery (kWh) and time (microseconds since plan_start) at the first location, to replan mid-tour
+        chargers: ChargerSlots shared with other trucks, stations with a free charger are preferred, else the truck waits
+                  at the one free first; the charging sessions are reserved in it
+        tariffs: TariffTable over the rows of `charging_stations`, charging is priced over the charging window and
+                 "cost-optimal" compares the stations by that price instead of their static price_€/kWh
+        station_power_kw/station_price: power and price arrays of the whole station table, see station_power_and_price
+        time_matrix: travel times (minutes) between all points, defaults to the distances at average_speed_kmh
+    """
+    energy_model = energy_model or EnergyModel.from_spec(truck_spec)
+    location_index = {location: i for i, location in enumerate(distance_matrix.index)}
+    distances = distance_matrix.to_numpy()
+    times = time_matrix.to_numpy() if time_matrix is not None else None
+    station_names = charging_stations["ID"].tolist()
+    station_columns = np.array([location_index[name] for name in station_names], dtype=np.intp)
+    power_kw, price = station_power_and_price(charging_stations, station_power_kw, station_price)
+    power_kw_values = power_kw.tolist()
+    price_values = price.tolist()
+    charger_rows = chargers.rows_of(station_names) if chargers is not None else None
+
+    def travel_minutes(i, j):
+        return float(leg_minutes(distances, times, i, j))
+
+    def travel_energy(i, j):
+        return float(leg_energy(energy_model, distances, times, i, j))
+
+    # energy of the tour legs in one evaluation, legs from a charger are evaluated when the truck charges
+    tour_rows = np.array([location_index[location] for location in tour], dtype=np.intp)
+    tour_energy = leg_energy(energy_model, distances, times, tour_rows[:-1], tour_rows[1:]).tolist()
+
+    battery_capacity = truck_spec['Battery_capacity_80%_kWh'] # charging to 80% only for battery health
+    battery_min = truck_spec['Battery_capacity_kWh'] * 0.1  # 10% minimum battery
+    truck_state= State(currentTime=start_time, currentBattery=start_soc)
+    truck_state.add_step('Start', "", origin, 0, truck_state.currentBattery, 0, 0)
+    for i in range(len(tour) - 1):
+        origin = tour[i]
+        truck_state.currentLocation = origin
+        dest = tour[i + 1]
+        o, d = location_index[origin], location_index[dest]
+        available = np.ones(len(station_names), dtype=bool)  # charging stations not yet visited on this leg
+
+        # Distance and time
+        dist = float(distances[o, d])
+        travel_time = travel_minutes(o, d)
+        energy_needed = tour_energy[i]
+        leg_cost = dist * driving_cost_per_km
+
+        # Battery check
+        while truck_state.currentBattery - energy_needed < battery_min:
+            # Pick nearest station
+            detours = distances[o, station_columns]
+            detour_energies = leg_energy(energy_model, distances, times, o, station_columns)
+            if chargers is None and tariffs is None:
+                k = nearest_station_index(detours, detour_energies, available, truck_state.currentBattery, power_kw, price, strategy=strategy)
+            else:
+                # arrival and charging time at every station at once
+                arrival = truck_state.currentTime + np.rint(leg_minutes(distances, times, o, station_columns) * 60_000_000).astype(np.int64)
+                charge_minutes = (battery_capacity - (truck_state.currentBattery - detour_energies)) / power_kw * 60
+                candidate_price = price
+                if tariffs is not None and strategy == "cost-optimal":
+                    candidate_price = tariffs.average_price(np.arange(len(station_names)), arrival / 60_000_000, charge_minutes)
+                if chargers is None:
+                    k = nearest_station_index(detours, detour_energies, available, truck_state.currentBattery, power_kw, candidate_price, strategy=strategy)
+                else:
+                    charging_start = chargers.earliest_start(charger_rows, arrival, np.rint(charge_minutes * 60_000_000).astype(np.int64))
+                    k = nearest_free_station_index(detours, detour_energies, available, truck_state.currentBattery, power_kw, candidate_price, arrival,
+                                                   charging_start, strategy=strategy)
+            available[k] = False
+            station_name = station_names[k]
+            s = station_columns[k]
+            detour_dist = float(distances[o, s])
+            detour_energy = float(detour_energies[k])
+            detour_cost = detour_dist * driving_cost_per_km
+            travel_time_to_charger = travel_minutes(o, s)
+
+            # Drive to charger
+            truck_state.add_step('drive_to_charger', origin, station_name, travel_time_to_charger, truck_state.currentBattery - detour_energy, detour_dist, detour_cost)
+            truck_state.currentBattery -= detour_energy
+            truck_state.currentTime += ticks(travel_time_to_charger)
+
+            # Charging, always up to the 80% cap; partial charging is left to the optimal engine
+            charge_needed = battery_capacity - truck_state.currentBattery
+            charge_time_min = (charge_needed / power_kw_values[k]) * 60
+            charging_cost = charge_needed * price_values[k]
+            if chargers is not None:
+                # wait for a charger, then hold it for the session
+                wait = int(charging_start[k] - arrival[k])
+                if wait > 0:
+                    truck_state.add_step('waiting_for_charger', station_name, station_name, wait / 60_000_000, truck_state.currentBattery, np.nan, 0)
+                    truck_state.currentTime += wait
+                chargers.reserve(charger_rows[k], truck_state.currentTime, ticks(charge_time_min))
+            if tariffs is not None:
+                charging_cost = charge_needed * float(tariffs.average_price(k, truck_state.currentTime / 60_000_000, charge_time_min))
+            truck_state.currentBattery = battery_capacity
+
+            truck_state.add_step('charging', station_name, station_name, charge_time_min, truck_state.currentBattery, np.nan, charging_cost)
+            truck_state.currentTime += ticks(charge_time_min)
+            origin, o = station_name, s
+            truck_state.currentLocation = origin
+            # the rest of the leg starts at the charger
+            dist = float(distances[o, d])
+            travel_time = travel_minutes(o, d)
+            energy_needed = travel_energy(o, d)
+            leg_cost = dist * driving_cost_per_km
+    
+        truck_state.add_step('drive_to_load/unload', origin, dest, travel_time, truck_state.currentBattery - energy_needed, dist, leg_cost)
+        truck_state.currentBattery -= energy_needed
+        if dest== tour[-1]:  # if last destination, no need to add stoppage time
+            truck_state.currentTime += ticks(travel_time)
         else:
-            truck_state.currentTime += timedelta(minutes=travel_time)+ timedelta(minutes=time_stoppage_at_nodes)
+            truck_state.currentTime += ticks(travel_time) + ticks(time_stoppage_at_nodes)
     return truck_state
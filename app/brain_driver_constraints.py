@@ -1,8 +1,10 @@
 import pandas as pd
-from datetime import datetime, timedelta
 import numpy as np
-from typing import List
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from app import brain
+from app.brain import leg_energy, leg_minutes, nearest_station_index, station_power_and_price, ticks
+from app.energy import EnergyModel
+from app.brain_optimal import plan_segments
 
 
 """ Assumptions """
@@ -15,17 +17,15 @@ MAX_CONTINUOUS_DRIVE = 4 * 60       # 4 hours
 MANDATORY_BREAK_TIME = 45       # 45 minutes
 MAX_DAILY_DRIVE = 9 * 60        # 9 hours
 
-class State(BaseModel):
-    currentTime: datetime = Field(default_factory=lambda: datetime(2025, 1, 1, 9, 0))
-    currentLocation: str = ""
-    currentBattery: int = 100
-    totalCost: float = 0.0
-    plan: List[str] = Field(default_factory=list) # A list of actions taken so far 
-    driving_time_since_break= 0
-    total_daily_driving_time= 0
-    total_tour_break_time= 0
-    
-    
+class State(brain.State):
+    """ Truck state with the driving and break times of the driver, in minutes """
+    __slots__ = ("driving_time_since_break", "total_daily_driving_time", "total_tour_break_time")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.driving_time_since_break = 0
+        self.total_daily_driving_time = 0
+        self.total_tour_break_time = 0
 
 def pick_station_on_strategy(charging_stations, strategy= "time-optimal"):
     """ Pick strategy to select charging station to either minimize charging time or minmise cost of charging 
@@ -43,19 +43,41 @@ def pick_station_on_strategy(charging_stations, strategy= "time-optimal"):
 def nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal"):
     # remove charging stations already in path
     charging_stations = charging_stations[~charging_stations['station_name'].isin(charging_station_in_path)]
-    charging_stations['dist_to_origin'] = charging_stations['station_name'].apply(
+    charging_stations = charging_stations.assign(dist_to_origin=charging_stations['station_name'].apply(
         lambda x: distance_matrix.loc[origin, x]
-    )
+    ))
     # filter out stations that are at origin or unreachable given the current charge
     charging_stations = charging_stations[(charging_stations['dist_to_origin'] <= (truck_state.currentBattery / consumption_rate)) & (charging_stations['dist_to_origin'] > 0)]
     if charging_stations.empty:
         raise Exception("Infeasible route: No reachable charging stations available.")
     return pick_station_on_strategy(charging_stations, strategy)
 
+def take_driver_break(truck_state, location, travel_time):
+    """ Append a mandatory break, or the daily rest if the daily driving time would be exceeded,
+        when driving `travel_time` more minutes would exceed the continuous driving limit
+    """
+    if truck_state.driving_time_since_break + travel_time > MAX_CONTINUOUS_DRIVE:
+        # Check if total daily driving time will be exceeded
+        if truck_state.total_daily_driving_time + travel_time > MAX_DAILY_DRIVE:
+            # End the day's driving and take a long rest
+            truck_state.add_step('daily_rest', location, location, 8 * 60, truck_state.currentBattery)
+            truck_state.currentTime += ticks(8 * 60)
+            truck_state.total_daily_driving_time = 0 # Reset daily timer for the next day
+            truck_state.driving_time_since_break = 0
+            truck_state.total_tour_break_time += 8 * 60
+        else:
+            # Take a mandatory 45-minute break
+            truck_state.add_step('driver_break', location, location, MANDATORY_BREAK_TIME, truck_state.currentBattery)
+            truck_state.currentTime += ticks(MANDATORY_BREAK_TIME)
+            truck_state.total_tour_break_time += MANDATORY_BREAK_TIME
+            truck_state.driving_time_since_break = 0
+
 def compute_schedule(distance_matrix: pd.DataFrame, 
                      charging_stations: pd.DataFrame, 
                      origin: str,
-                     stops: List[str], tour: List, truck_spec) -> dict:
+                     stops: List[str], tour: List, truck_spec, strategy="time-optimal", energy_model: Optional[EnergyModel] = None,
+                     start_soc=100, start_time=0, tariffs=None, station_power_kw=None, station_price=None,
+                     time_matrix: Optional[pd.DataFrame] = None) -> dict:
     """ Compute the schedule for the truck to visit all stops and return to origin
         distance_matrix: pd.DataFrame with distances between all points (including charging stations)
         charging_stations: pd.DataFrame with charging station details (latitude,longitude,max_power_kW,price_€/kWh,source)
@@ -63,137 +85,145 @@ def compute_schedule(distance_matrix: pd.DataFrame,
         stops: list of stops to visit
         tour: ordered list of locations to visit (including origin and stops)
         truck_spec: dict with truck specifications (battery capacity, consumption rate, etc.)
+        strategy: "time-optimal" or "cost-optimal" charging station selection
+        energy_model: consumption by payload and speed, defaults to the curves of truck_spec at its reference payload
+        start_soc/start_time: battery (kWh) and time (microseconds since plan_start) at the first location, to replan mid-tour
+        tariffs: TariffTable over the rows of `charging_stations`, charging is priced over the charging window
+        station_power_kw/station_price: power and price arrays of the whole station table, see station_power_and_price
+        time_matrix: travel times (minutes) between all points, defaults to the distances at average_speed_kmh
     """
-    charging_stations.rename(columns={"ID": "station_name"}, inplace=True)
-    locations= [origin] + stops
-    for row in charging_stations.itertuples():
-        locations.append(row.station_name)
-    charging_station_in_path = []
-    time_matrix= distance_matrix / 80 * 60  # average speed 80 km/h
+    energy_model = energy_model or EnergyModel.from_spec(truck_spec)
+    # location -> row of the distance array instead of label lookups in the DataFrame
+    location_index = {location: i for i, location in enumerate(distance_matrix.index)}
+    distances = distance_matrix.to_numpy()
+    times = time_matrix.to_numpy() if time_matrix is not None else None
+    station_names = charging_stations["ID"].tolist()
+    station_columns = np.array([location_index[name] for name in station_names], dtype=np.intp)
+    power_kw, price = station_power_and_price(charging_stations, station_power_kw, station_price)
+
+    def travel_minutes(i, j):
+        return float(leg_minutes(distances, times, i, j))
+
+    def travel_energy(i, j):
+        return float(leg_energy(energy_model, distances, times, i, j))
+
+    # energy of the tour legs in one evaluation, legs from a charger are evaluated when the truck charges
+    tour_rows = np.array([location_index[location] for location in tour], dtype=np.intp)
+    tour_energy = leg_energy(energy_model, distances, times, tour_rows[:-1], tour_rows[1:]).tolist()
+
     battery_capacity = truck_spec['Battery_capacity_80%_kWh'] # charging to 80% only for battery health
     battery_min = truck_spec['Battery_capacity_kWh'] * 0.1  # 10% minimum battery
-    truck_state= State()
-    truck_state.plan.append({
-                'action': 'Start',
-                'from': "",
-                'to': origin,
-                'start': truck_state.currentTime.strftime("%H:%M"),
-                'end': truck_state.currentTime.strftime("%H:%M"),
-                'SOC_kWh': truck_state.currentBattery,
-                'distance_km': 0,
-                'cost_€': 0
-            })
+    truck_state= State(currentTime=start_time, currentBattery=start_soc)
+    truck_state.add_step('Start', "", origin, 0, truck_state.currentBattery, 0, 0)
     for i in range(len(tour) - 1):
         origin = tour[i]
         truck_state.currentLocation = origin
         dest = tour[i + 1]
+        o, d = location_index[origin], location_index[dest]
+        available = np.ones(len(station_names), dtype=bool)  # charging stations not yet visited on this leg
 
         # Distance and time
-        dist = distance_matrix.loc[origin, dest]
-        travel_time = time_matrix.loc[origin, dest]
-        energy_needed = dist * consumption_rate
+        dist = float(distances[o, d])
+        travel_time = travel_minutes(o, d)
+        energy_needed = tour_energy[i]
         leg_cost = dist * driving_cost_per_km
 
         
         while True:
             # --- Check for driver break before starting a drive ---
         # This is a hard constraint for continuous driving, but it is skipped on the first leg.
-            if i > 0 and truck_state.driving_time_since_break + travel_time > MAX_CONTINUOUS_DRIVE:
-                # Check if total daily driving time will be exceeded
-                if truck_state.total_daily_driving_time + travel_time > MAX_DAILY_DRIVE:
-                    # End the day's driving and take a long rest
-                    truck_state.plan.append({
-                        'action': 'daily_rest',
-                        'date': truck_state.currentTime.strftime("%Y-%m-%d"),
-                        'from': origin,
-                        'to': origin,
-                        'duration_min': "overnight",
-                        'start': truck_state.currentTime.strftime("%H:%M"),
-                        'end': (truck_state.currentTime + timedelta(hours=8)).strftime("%H:%M"), # Assuming an 8-hour rest
-                    
-                    })
-                    truck_state.currentTime += timedelta(hours=8)
-                    truck_state.total_daily_driving_time = 0 # Reset daily timer for the next day
-                    truck_state.driving_time_since_break = 0
-                    truck_state.total_tour_break_time += 8 * 60
-                else:
-                    # Take a mandatory 45-minute break
-                    truck_state.plan.append({
-                        'action': 'driver_break',
-                        'date': truck_state.currentTime.strftime("%Y-%m-%d"),
-                        'from': origin,
-                        'to': origin,
-                        'duration_min': MANDATORY_BREAK_TIME,
-                        'start': truck_state.currentTime.strftime("%H:%M"),
-                        'end': (truck_state.currentTime + timedelta(minutes=MANDATORY_BREAK_TIME)).strftime("%H:%M"),
-                    
-                    })
-                    truck_state.currentTime += timedelta(minutes=MANDATORY_BREAK_TIME)
-                    truck_state.total_tour_break_time += MANDATORY_BREAK_TIME
-                    truck_state.driving_time_since_break = 0
+            if i > 0:
+                take_driver_break(truck_state, origin, travel_time)
 
             # Battery check
             if truck_state.currentBattery - energy_needed < battery_min:
                 # Pick nearest station
-                station = nearest_station(origin, distance_matrix, charging_stations, charging_station_in_path, truck_state, strategy="time-optimal")
-                charging_station_in_path.append(station['station_name'])
-                detour_dist = distance_matrix.loc[origin, station['station_name']]
-                detour_energy = detour_dist * consumption_rate
+                detours = distances[o, station_columns]
+                detour_energies = leg_energy(energy_model, distances, times, o, station_columns)
+                candidate_price = price
+                if tariffs is not None and strategy == "cost-optimal":
+                    arrival_minutes = truck_state.currentTime / 60_000_000 + leg_minutes(distances, times, o, station_columns)
+                    charge_minutes = (battery_capacity - (truck_state.currentBattery - detour_energies)) / power_kw * 60
+                    candidate_price = tariffs.average_price(np.arange(len(station_names)), arrival_minutes, charge_minutes)
+                k = nearest_station_index(detours, detour_energies, available, truck_state.currentBattery, power_kw, candidate_price, strategy=strategy)
+                available[k] = False
+                station_name = station_names[k]
+                s = station_columns[k]
+                detour_dist = float(distances[o, s])
+                detour_energy = float(detour_energies[k])
                 detour_cost = detour_dist * driving_cost_per_km
-                travel_time_to_charger = time_matrix.loc[origin, station['station_name']]
+                travel_time_to_charger = travel_minutes(o, s)
 
                 # Drive to charger
-                truck_state.plan.append({
-                    'action': 'drive_to_charger',
-                    'from': origin,
-                    'to': station['station_name'],
-                    'start': truck_state.currentTime.strftime("%H:%M"),
-                    'end': (truck_state.currentTime + timedelta(minutes=travel_time_to_charger)).strftime("%H:%M"),
-                    'SOC_kWh': truck_state.currentBattery - detour_energy,
-                    'distance_km': detour_dist,
-                    'cost_€': detour_cost
-                })
+                truck_state.add_step('drive_to_charger', origin, station_name, travel_time_to_charger, truck_state.currentBattery - detour_energy, detour_dist, detour_cost)
                 truck_state.currentBattery -= detour_energy
-                truck_state.currentTime += timedelta(minutes=travel_time_to_charger)
+                truck_state.currentTime += ticks(travel_time_to_charger)
+                truck_state.driving_time_since_break += travel_time_to_charger
+                truck_state.total_daily_driving_time += travel_time_to_charger
 
                 # Charging
                 # charges to full for simplicity. Adapt to need (check how much needed to reach next station or till end destination)
                 charge_needed = battery_capacity - truck_state.currentBattery
-                charge_time_min = (charge_needed / station['max_power_kW']) * 60
-                charging_cost = charge_needed * station['price_€/kWh']
+                charge_time_min = (charge_needed / power_kw[k]) * 60
+                charging_cost = charge_needed * price[k]
+                if tariffs is not None:
+                    charging_cost = charge_needed * float(tariffs.average_price(k, truck_state.currentTime / 60_000_000, charge_time_min))
                 truck_state.currentBattery = battery_capacity
 
-                truck_state.plan.append({
-                    'action': 'charging',
-                    'from': station['station_name'],
-                    'to': station['station_name'],
-                    'start': truck_state.currentTime.strftime("%H:%M"),
-                    'end': (truck_state.currentTime + timedelta(minutes=charge_time_min)).strftime("%H:%M"),
-                    'SOC_kWh': truck_state.currentBattery,
-                    'distance_km': np.nan,
-                    'cost_€': charging_cost
-                })
-                truck_state.currentTime += timedelta(minutes=charge_time_min)
-                origin = station['station_name']
+                truck_state.add_step('charging', station_name, station_name, charge_time_min, truck_state.currentBattery, np.nan, charging_cost)
+                truck_state.currentTime += ticks(charge_time_min)
+                origin, o = station_name, s
                 truck_state.currentLocation = origin
-                energy_needed= distance_matrix.loc[origin, dest]* consumption_rate
+                # the rest of the leg starts at the charger
+                dist = float(distances[o, d])
+                travel_time = travel_minutes(o, d)
+                energy_needed = travel_energy(o, d)
+                leg_cost = dist * driving_cost_per_km
+                continue  # check the battery and the driver rules again from the charger
         
-            truck_state.plan.append({
-                'action': 'drive_to_load/unload',
-                'from': origin,
-                'to': dest,
-                'start': truck_state.currentTime.strftime("%H:%M"),
-                'end': (truck_state.currentTime + timedelta(minutes=travel_time)).strftime("%H:%M"),
-                'SOC_kWh': truck_state.currentBattery - energy_needed,
-                'distance_km': dist,
-                'cost_€': leg_cost
-            })
-            charging_station_in_path= [] # once the truck drives to a customer location, it can pick the same charging stations again
+            truck_state.add_step('drive_to_load/unload', origin, dest, travel_time, truck_state.currentBattery - energy_needed, dist, leg_cost)
             truck_state.currentBattery -= energy_needed
+            truck_state.driving_time_since_break += travel_time
+            truck_state.total_daily_driving_time += travel_time
             if dest== tour[-1]:  # if last destination, no need to add stoppage time
-                truck_state.currentTime += timedelta(minutes=travel_time)
+                truck_state.currentTime += ticks(travel_time)
             else:
-                truck_state.currentTime += timedelta(minutes=travel_time)+ timedelta(minutes=time_stoppage_at_nodes)
+                truck_state.currentTime += ticks(travel_time) + ticks(time_stoppage_at_nodes)
+            break
+    return truck_state
+
+
+def compute_schedule_optimal(distance_matrix: pd.DataFrame,
+                             charging_stations: pd.DataFrame,
+                             origin: str,
+                             stops: List[str], tour: List, truck_spec, strategy="time-optimal",
+                             energy_model: Optional[EnergyModel] = None, start_soc=100, start_time=0, tariffs=None,
+                             station_power_kw=None, station_price=None, time_matrix: Optional[pd.DataFrame] = None) -> State:
+    """ Optimal charging stops from brain_optimal with the driver rest rules of this module applied on top.
+        Charging sessions of at least MANDATORY_BREAK_TIME and the stoppage at each stop count as a break.
+        Tariffs are evaluated at the charging times of the search, before the breaks are added.
+    """
+    truck_state = State(currentTime=start_time, currentBattery=start_soc)
+    truck_state.add_step('Start', "", origin, 0, truck_state.currentBattery, 0, 0)
+    truck_state.currentLocation = origin
+    for segment in plan_segments(distance_matrix, charging_stations, tour, truck_spec, truck_state.currentBattery, strategy, energy_model,
+                                 tariffs, start_time, station_power_kw, station_price, time_matrix):
+        driving = segment['action'] != 'charging'
+        if driving:
+            take_driver_break(truck_state, segment['from'], segment['minutes'])
+        truck_state.add_step(segment['action'], segment['from'], segment['to'], segment['minutes'], segment['SOC_kWh'], segment['distance_km'], segment['cost_€'])
+        truck_state.currentTime += ticks(segment['minutes'])
+        truck_state.currentBattery = segment['SOC_kWh']
+        truck_state.currentLocation = segment['to']
+        truck_state.totalCost += segment['cost_€']
+        if driving:
+            truck_state.driving_time_since_break += segment['minutes']
+            truck_state.total_daily_driving_time += segment['minutes']
+        elif segment['minutes'] >= MANDATORY_BREAK_TIME:
+            truck_state.driving_time_since_break = 0
+        if segment['action'] == 'drive_to_load/unload' and not segment['last']:
+            truck_state.currentTime += ticks(time_stoppage_at_nodes)
+            truck_state.driving_time_since_break = 0
     return truck_state
 
 
@@ -218,7 +248,7 @@ if __name__ == "__main__":
         'Max_range_km': 320 / consumption_rate
     }
     plan = compute_schedule(distance_matrix, charging_stations, origin='Ingolstadt', stops=['Halle'], tour=['Ingolstadt', 'Halle', 'Ingolstadt'], truck_spec=truck_spec)
-    for action in plan:
+    for action in plan.plan:
         print(action)
    # df = pd.DataFrame(plan)
    # print(df)
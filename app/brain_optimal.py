@@ -0,0 +1,262 @@
+import heapq
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.brain import (State, average_speed_kmh, consumption_rate, driving_cost_per_km, leg_energy, leg_minutes, station_power_and_price, ticks,
+                       time_stoppage_at_nodes)
+from app.energy import EnergyModel, leg_speed_kmh
+
+
+def search_charging_plan(distances, location_index, station_columns, power_kw, price, tour, start_soc,
+                         battery_capacity, battery_min, strategy="time-optimal", energy_model: Optional[EnergyModel] = None,
+                         tariffs=None, start_minute=0.0, times=None) -> List[dict]:
+    """ Resource-constrained A* over (tour leg, location, SOC) labels.
+        Return the minimum-time ("time-optimal") or minimum-cost ("cost-optimal") sequence of drive and charge segments
+        visiting the tour in order. At a station the truck either does not charge, charges just enough to reach the next
+        location, or charges to `battery_capacity`; with a constant charging power these
+        partial-charging options contain an optimal solution. Labels dominated by another label at the same location and
+        leg (lower or equal objective, higher or equal SOC) are pruned. Stops must be reached with `battery_min` left,
+        chargers with a non-negative battery, the same feasibility rules as compute_schedule.
+        distances: (n, n) distance array, location_index maps tour locations to its rows
+        station_columns: rows of the charging stations, power_kw/price: their charging power and price
+        energy_model: consumption of the truck, evaluated per leg at its average speed; defaults to the default consumption
+        times: (n, n) travel time array (minutes), defaults to the distances at average_speed_kmh
+        tariffs: TariffTable over the charging stations, charging is priced over its window from the label time
+                 (minutes since plan_start, the first label at `start_minute`). Labels are still compared on objective
+                 and SOC only, so with time-of-use prices the cost-optimal plan is a close approximation.
+    """
+    n = len(distances)
+    energy_model = energy_model or EnergyModel.from_spec({"Consumption_kWh_per_km": consumption_rate})
+    station_columns = np.asarray(station_columns, dtype=np.intp)
+    power_kw = np.asarray(power_kw, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    station_of = np.full(n, -1, dtype=np.intp)
+    station_of[station_columns] = np.arange(len(station_columns))
+
+    cost_optimal = strategy == "cost-optimal"
+    if cost_optimal:
+        charge_weight = price                               # € per kWh
+    else:
+        if strategy != "time-optimal":
+            print("Unknown strategy, defaulting to time-optimal")
+        charge_weight = 60 / power_kw                       # minutes per kWh
+    best_charge_weight = charge_weight.min() if len(charge_weight) else 0.0
+    if tariffs is not None and cost_optimal and len(charge_weight):
+        best_charge_weight = float(tariffs.prices.min())
+
+    def charge_objective(k, soc, charged, minute):
+        """ Objective added by charging from `soc` to `charged` (array) at station k from `minute` """
+        if tariffs is None or not cost_optimal:
+            return (charged - soc) * charge_weight[k]
+        return (charged - soc) * tariffs.average_price(k, minute, (charged - soc) / power_kw[k] * 60)
+
+    def drive_objective(km, minutes):
+        """ Objective of driving legs of `km` taking `minutes` """
+        return km * driving_cost_per_km if cost_optimal else minutes
+
+    legs = [(location_index[tour[i]], location_index[tour[i + 1]]) for i in range(len(tour) - 1)]
+    # direct distance and time of the legs after each one, for the admissible A* estimate
+    remaining_after = [sum(float(distances[a, b]) for a, b in legs[i + 1:]) for i in range(len(legs))]
+    remaining_minutes_after = [sum(float(leg_minutes(distances, times, a, b)) for a, b in legs[i + 1:]) for i in range(len(legs))]
+
+    # lowest kWh/km of any leg, so that the energy of the direct legs left bounds the one of every detour
+    if times is None:
+        min_rate = energy_model.min_kwh_per_km(average_speed_kmh, average_speed_kmh)
+    else:
+        speeds = leg_speed_kmh(distances, times)[distances > 0]
+        min_rate = energy_model.min_kwh_per_km(speeds.min(), speeds.max()) if len(speeds) else 0.0
+
+    def remaining_drive(leg, locations):
+        """ Direct distance and driving time left from `locations` when heading to the destination of `leg` """
+        if leg == len(legs):
+            return np.zeros(len(locations)), np.zeros(len(locations))
+        dest = legs[leg][1]
+        return (distances[locations, dest].astype(np.float64) + remaining_after[leg],
+                leg_minutes(distances, times, locations, dest).astype(np.float64) + remaining_minutes_after[leg])
+
+    def estimate(remaining, soc):
+        """ Admissible lower bound of the remaining objective: driving the direct legs left and charging
+            the energy deficit at the best rate of all stations
+        """
+        km, minutes = remaining
+        deficit = np.maximum(km * min_rate + battery_min - soc, 0.0)
+        return drive_objective(km, minutes) + deficit * best_charge_weight
+
+    # per (leg, location): the pushed label with the best objective and the one with the highest SOC,
+    # a cheap vectorized dominance filter before labels go into the heap
+    best_objective = np.full((len(legs) + 1, n), np.inf)
+    best_objective_soc = np.full((len(legs) + 1, n), -np.inf)
+    best_soc = np.full((len(legs) + 1, n), -np.inf)
+    best_soc_objective = np.full((len(legs) + 1, n), np.inf)
+    incumbent = np.inf  # objective of the best complete plan pushed so far, bounds the search
+
+    # labels: (location, leg, soc, objective, parent label, SOC after charging at the parent location or None,
+    #          minutes since plan_start when the truck can leave the location before charging)
+    labels = []
+    heap = []
+    if legs:
+        labels.append((legs[0][0], 0, float(start_soc), 0.0, -1, None, float(start_minute)))
+        heap.append((float(estimate(remaining_drive(0, [legs[0][0]]), start_soc)[0]), 0))
+    settled = {}  # (leg, location) -> list of (objective, soc) of expanded labels
+    goal = None
+    while heap:
+        _, label_id = heapq.heappop(heap)
+        u, leg, soc, objective, _, _, minute = labels[label_id]
+        if leg == len(legs):
+            goal = label_id
+            break
+        front = settled.setdefault((leg, u), [])
+        if any(o <= objective and s >= soc for o, s in front):
+            continue
+        front.append((objective, soc))
+
+        dest = legs[leg][1]
+        targets = np.append(station_columns, dest)
+        targets = targets[targets != u]
+        energy = leg_energy(energy_model, distances, times, u, targets)
+        drive_minutes = leg_minutes(distances, times, u, targets).astype(np.float64)
+        drive = drive_objective(distances[u, targets].astype(np.float64), drive_minutes)
+        arrives = targets == dest
+        next_leg = np.where(arrives, leg + 1, leg)
+        # stoppage at every stop but the last one
+        stop_minutes = np.where(arrives & (next_leg < len(legs)), time_stoppage_at_nodes, 0)
+        remaining = np.where(arrives, remaining_drive(leg + 1, targets), remaining_drive(leg, targets))  # (km, minutes) rows
+        # like nearest_station, the reserve below the minimum battery may be used to reach a charger but not a stop
+        reserve = np.where(arrives, battery_min, 0.0)
+
+        # (SOC after charging at u, objective added by charging, valid) for each charging option
+        options = [(np.full(len(targets), soc), np.zeros(len(targets)), soc - energy >= reserve)]
+        k = station_of[u]
+        if k >= 0:
+            just_enough = reserve + energy
+            options.append((just_enough, charge_objective(k, soc, just_enough, minute), (just_enough > soc) & (just_enough <= battery_capacity)))
+            full = np.full(len(targets), float(battery_capacity))
+            options.append((full, charge_objective(k, soc, full, minute), (battery_capacity > soc) & (full - energy >= reserve)))
+
+        for charged, charge_cost, valid in options:
+            charge_minutes = (charged - soc) / power_kw[k] * 60 if k >= 0 else 0.0
+            next_minute = minute + charge_minutes + drive_minutes + stop_minutes
+            next_soc = charged - energy
+            next_objective = objective + charge_cost + drive
+            priority = next_objective + estimate(remaining, next_soc)
+            valid &= priority <= incumbent
+            valid &= ~((best_objective[next_leg, targets] <= next_objective) & (best_objective_soc[next_leg, targets] >= next_soc))
+            valid &= ~((best_soc_objective[next_leg, targets] <= next_objective) & (best_soc[next_leg, targets] >= next_soc))
+            picked = np.flatnonzero(valid)
+            if len(picked) == 0:
+                continue
+            v, v_leg, v_soc, v_objective = targets[picked], next_leg[picked], next_soc[picked], next_objective[picked]
+            v_minute = np.broadcast_to(next_minute, len(targets))[picked]
+            improves = v_objective < best_objective[v_leg, v]
+            best_objective[v_leg[improves], v[improves]] = v_objective[improves]
+            best_objective_soc[v_leg[improves], v[improves]] = v_soc[improves]
+            improves = v_soc > best_soc[v_leg, v]
+            best_soc[v_leg[improves], v[improves]] = v_soc[improves]
+            best_soc_objective[v_leg[improves], v[improves]] = v_objective[improves]
+            complete = v_leg == len(legs)
+            if complete.any():
+                incumbent = min(incumbent, float(v_objective[complete].min()))
+            charged_to = np.where(charged[picked] > soc, charged[picked], -1.0)
+            for label in zip(v.tolist(), v_leg.tolist(), v_soc.tolist(), v_objective.tolist(), priority[picked].tolist(), charged_to.tolist(),
+                             v_minute.tolist()):
+                labels.append((label[0], label[1], label[2], label[3], label_id, label[5] if label[5] >= 0 else None, label[6]))
+                heapq.heappush(heap, (label[4], len(labels) - 1))
+
+    if goal is None:
+        raise Exception("Infeasible route: No reachable charging stations available.")
+
+    # walk back the parent labels and turn every edge into drive / charge segments
+    chain = []
+    while goal >= 0:
+        chain.append(labels[goal])
+        goal = labels[goal][4]
+    chain.reverse()
+
+    segments = []
+    for previous, label in zip(chain, chain[1:]):
+        u, v = previous[0], label[0]
+        soc = previous[2]
+        charged_to = label[5]
+        if charged_to is not None:
+            k = station_of[u]
+            charge_needed = charged_to - soc
+            charge_minutes = (charge_needed / power_kw[k]) * 60
+            segments.append({
+                'action': 'charging',
+                'from': u,
+                'to': u,
+                'minutes': charge_minutes,
+                'SOC_kWh': charged_to,
+                'distance_km': np.nan,
+                'cost_€': charge_needed * (price[k] if tariffs is None else float(tariffs.average_price(k, previous[6], charge_minutes))),
+            })
+            soc = charged_to
+        dist = float(distances[u, v])
+        arrives_at_customer = label[1] != previous[1]
+        segments.append({
+            'action': 'drive_to_load/unload' if arrives_at_customer else 'drive_to_charger',
+            'from': u,
+            'to': v,
+            'minutes': float(leg_minutes(distances, times, u, v)),
+            'SOC_kWh': soc - float(leg_energy(energy_model, distances, times, u, v)),
+            'distance_km': dist,
+            'cost_€': dist * driving_cost_per_km,
+            'last': label[1] == len(legs),
+        })
+    return segments
+
+
+def plan_segments(distance_matrix: pd.DataFrame, charging_stations: pd.DataFrame, tour: List, truck_spec,
+                  start_soc, strategy="time-optimal", energy_model: Optional[EnergyModel] = None, tariffs=None, start_time=0,
+                  station_power_kw=None, station_price=None, time_matrix: Optional[pd.DataFrame] = None) -> List[dict]:
+    """ Run search_charging_plan on the labelled distance matrix, segments refer to locations by their labels
+        start_time: ticks at the first location, for the tariffs
+        station_power_kw/station_price: power and price arrays of the whole station table, see station_power_and_price
+        time_matrix: travel times (minutes) between all points, defaults to the distances at average_speed_kmh
+    """
+    locations = list(distance_matrix.index)
+    location_index = {location: i for i, location in enumerate(locations)}
+    station_columns = [location_index[name] for name in charging_stations["ID"].tolist()]
+    power_kw, price = station_power_and_price(charging_stations, station_power_kw, station_price)
+    segments = search_charging_plan(
+        distance_matrix.to_numpy(), location_index, station_columns, power_kw, price,
+        tour, start_soc,
+        battery_capacity=truck_spec['Battery_capacity_80%_kWh'],  # charging to 80% only for battery health
+        battery_min=truck_spec['Battery_capacity_kWh'] * 0.1,     # 10% minimum battery
+        strategy=strategy,
+        energy_model=energy_model or EnergyModel.from_spec(truck_spec),
+        tariffs=tariffs,
+        start_minute=start_time / 60_000_000,
+        times=time_matrix.to_numpy() if time_matrix is not None else None,
+    )
+    for segment in segments:
+        segment['from'] = locations[segment['from']]
+        segment['to'] = locations[segment['to']]
+    return segments
+
+
+def compute_schedule_optimal(distance_matrix: pd.DataFrame,
+                             charging_stations: pd.DataFrame,
+                             origin: str,
+                             stops: List[str], tour: List, truck_spec, strategy="time-optimal",
+                             energy_model: Optional[EnergyModel] = None, start_soc=100, start_time=0, tariffs=None,
+                             station_power_kw=None, station_price=None, time_matrix: Optional[pd.DataFrame] = None) -> State:
+    """ Alternative to compute_schedule choosing charging stops and partial charge amounts optimally
+        (minimum total time or cost) instead of greedily picking a station and charging to 80%.
+        Takes the same arguments and returns the same plan format as compute_schedule_fast.
+    """
+    truck_state = State(currentTime=start_time, currentBattery=start_soc)
+    truck_state.add_step('Start', "", origin, 0, truck_state.currentBattery, 0, 0)
+    truck_state.currentLocation = origin
+    for segment in plan_segments(distance_matrix, charging_stations, tour, truck_spec, truck_state.currentBattery, strategy, energy_model,
+                                 tariffs, start_time, station_power_kw, station_price, time_matrix):
+        truck_state.add_step(segment['action'], segment['from'], segment['to'], segment['minutes'], segment['SOC_kWh'], segment['distance_km'], segment['cost_€'])
+        truck_state.currentTime += ticks(segment['minutes'])
+        truck_state.currentBattery = segment['SOC_kWh']
+        truck_state.currentLocation = segment['to']
+        truck_state.totalCost += segment['cost_€']
+        if segment['action'] == 'drive_to_load/unload' and not segment['last']:
+            truck_state.currentTime += ticks(time_stoppage_at_nodes)
+    return truck_state
@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class TwoTierCache:
+    """ JSON-serializable values in an in-process LRU in front of an optional SQLite table shared by all workers.
+        Entries expire after `ttl` seconds. The memory tier keeps at most `size` entries, the disk tier at most
+        `disk_size` entries, least recently used ones are evicted first. path=None (or "") disables the disk tier.
+        The disk tier is trimmed every `evict_every` puts of a process, so it can exceed `disk_size` by that many
+        entries per worker in between.
+    """
+    table = "entries"
+    evict_every = 256
+
+    def __init__(self, path, size, disk_size, ttl):
+        self.size = size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")  # readers in other workers do not block writers
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)")
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)")
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created)")
+            self._db.commit()
+
+    def get(self, key) -> Optional[Any]:
+        """ Cached value or None """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+            entry = self._disk_get(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, entry[0], entry[1])
+            return entry[1]
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, now, value)
+            if self._db is not None:
+                blob = zlib.compress(json.dumps(value).encode("utf-8"))
+                self._db.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)", (key, blob, now, now))
+                self._puts += 1
+                if self._puts % self.evict_every == 0:
+                    self._disk_evict(now)
+                self._db.commit()
+
+    def clear(self, keep_prefix=None):
+        """ Drop all entries, or all whose key does not start with `keep_prefix` """
+        with self._lock:
+            if keep_prefix is None:
+                self._memory.clear()
+            else:
+                for key in [key for key in self._memory if not key.startswith(keep_prefix)]:
+                    del self._memory[key]
+            if self._db is not None:
+                if keep_prefix is None:
+                    self._db.execute(f"DELETE FROM {self.table}")
+                else:
+                    self._db.execute(f"DELETE FROM {self.table} WHERE substr(key, 1, ?) != ?", (len(keep_prefix), keep_prefix))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": len(self._memory)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _memory_put(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def _disk_evict(self, now):
+        """ Drop the expired entries of the disk tier, then the least recently used ones above `disk_size` """
+        self._db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+        excess = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.disk_size
+        if excess > 0:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)", (excess,))
+
+    def _disk_get(self, key, now):
+        """ (created, value) from the disk tier, refreshing its access time, or None if missing or expired """
+        if self._db is None:
+            return None
+        row = self._db.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] >= self.ttl:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return row[1], json.loads(zlib.decompress(row[0]))
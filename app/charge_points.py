@@ -0,0 +1,152 @@
+import argparse
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.config import data_dir
+
+CHARGE_POINTS_CSV_FILE = "combined_charge_points.csv"
+CHARGE_POINTS_FILE = "charge_points.npz"
+
+# typed columns of the station table
+columns = {
+    "ID": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "max_power_kW": np.float64,
+    "price_€/kWh": np.float64,
+    "source": np.int16,  # code into source_names, dictionary encoded as there are only a few sources
+    "chargers": np.float64,  # charging points of the station, NaN: CHARGERS_PER_STATION
+}
+
+# lower-case column names of raw registry dumps -> columns
+aliases = {
+    "id": "ID", "lat": "latitude", "breitengrad": "latitude", "lon": "longitude", "lng": "longitude", "längengrad": "longitude",
+    "max_power_kw": "max_power_kW", "power_kw": "max_power_kW", "nennleistung ladeeinrichtung [kw]": "max_power_kW",
+    "price_€/kwh": "price_€/kWh", "price": "price_€/kWh", "price_eur_kwh": "price_€/kWh",
+    "operator": "source", "betreiber": "source", "anzahl ladepunkte": "chargers",
+}
+
+
+def read_charge_points(directory=data_dir, names: Optional[List[str]] = None) -> pd.DataFrame:
+    """ Station table from charge_points.npz, reading only the `names` columns (all by default), or from
+        combined_charge_points.csv if no registry was ingested
+    """
+    path = os.path.join(directory, CHARGE_POINTS_FILE)
+    if not os.path.exists(path):
+        return pd.read_csv(os.path.join(directory, CHARGE_POINTS_CSV_FILE), usecols=names)
+    with np.load(path) as table:
+        return pd.DataFrame({name: pd.Categorical.from_codes(table[name], table["source_names"]) if name == "source" else table[name]
+                             for name in names or columns})
+
+
+def _numbers(values: pd.Series) -> pd.Series:
+    """ Numbers in text like "0.64", "0,64 €" or "150 kW", NaN where there is none """
+    text = values.astype(str).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text.str.extract(r"(-?\d+(?:\.\d+)?)", expand=False), errors="coerce")
+
+
+def hilbert_order(latitudes, longitudes, bits=16) -> np.ndarray:
+    """ Positions sorting the points along a Hilbert curve over the globe, so that nearby stations get nearby rows """
+    side = 1 << bits
+    x = np.clip(((np.asarray(longitudes, dtype=np.float64) + 180) / 360 * side).astype(np.int64), 0, side - 1)
+    y = np.clip(((np.asarray(latitudes, dtype=np.float64) + 90) / 180 * side).astype(np.int64), 0, side - 1)
+    distance = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        distance += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # rotate the quadrant so that the curve continues in the next one
+        flip = rx & ~ry
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return np.argsort(distance, kind="stable")
+
+
+def ingest_charge_points(sources, directory=data_dir, source_name="Public", default_price=None, precision=5) -> int:
+    """ Offline step: turn raw charge point registry dumps (CSV) into charge_points.npz, the typed, columnar station table
+        the app loads instead of combined_charge_points.csv.
+        1. Map the columns by name (see `aliases`), parse numbers from text ("0,64 €") and drop invalid rows
+        2. Drop repeated IDs, merge the points at the same location (rounded to `precision` decimals) into one station
+           with the power and price of its most powerful point and the number of points as `chargers`
+        3. Sort the stations along a Hilbert curve, so that nearby stations are stored next to each other
+        Rows without a source get `source_name`, rows without a price `default_price` (dropped if None).
+        Without an ID column the stations are numbered in the stored order. Return the number of stations stored.
+    """
+    raw = pd.concat([pd.read_csv(source, dtype=str, keep_default_na=False) for source in sources], ignore_index=True)
+    raw = raw.rename(columns={name: aliases.get(name.strip().lower(), name.strip()) for name in raw.columns})
+    n_read = len(raw)
+    has_ids = "ID" in raw.columns
+
+    table = pd.DataFrame({name: _numbers(raw[name]) if name in raw.columns else np.nan
+                          for name in ("ID", "latitude", "longitude", "max_power_kW", "price_€/kWh", "chargers")}, index=raw.index)
+    table["source"] = raw["source"].str.strip().replace("", source_name) if "source" in raw.columns else source_name
+    if default_price is not None:
+        table["price_€/kWh"] = table["price_€/kWh"].fillna(default_price)
+
+    checks = {
+        "coordinates": table["latitude"].between(-90, 90) & table["longitude"].between(-180, 180)
+                       & ~((table["latitude"] == 0) & (table["longitude"] == 0)),
+        "max_power_kW": table["max_power_kW"] > 0,
+        "price_€/kWh": table["price_€/kWh"] >= 0,
+        "ID": (table["ID"] == table["ID"].round()) if has_ids else pd.Series(True, index=table.index),
+    }
+    valid = pd.Series(True, index=table.index)
+    invalid = {}
+    for reason, ok in checks.items():
+        invalid[reason] = int((valid & ~ok).sum())
+        valid &= ok
+    table = table[valid]
+
+    n_valid = len(table)
+    if has_ids:
+        table = table[~table["ID"].duplicated()]
+    n_unique = len(table)
+    location = [table["latitude"].round(precision), table["longitude"].round(precision)]
+    table = table.assign(_lat=location[0], _lon=location[1]).sort_values(["_lat", "_lon", "max_power_kW"], ascending=[True, True, False],
+                                                                         kind="stable")
+    stations_at = table.groupby(["_lat", "_lon"], sort=False)
+    merged = stations_at["chargers"].transform("size") > 1
+    # unknown charger counts of merged points count as one charging point each
+    points = table["chargers"].fillna(1).groupby([table["_lat"], table["_lon"]], sort=False).transform("sum")
+    table["chargers"] = table["chargers"].where(~merged, points)
+    first = ~table.duplicated(["_lat", "_lon"])
+    n_merged = int(merged.sum())
+    n_merged_stations = int((merged & first).sum())
+    table = table[first]
+
+    table = table.iloc[hilbert_order(table["latitude"], table["longitude"])]
+    if not has_ids:
+        print(f"No ID column, numbering the stations 0..{len(table) - 1}")
+        table = table.assign(ID=np.arange(len(table)))
+    source = pd.Categorical(table["source"])
+    stations = {name: source.codes if name == "source" else table[name].to_numpy() for name in columns}
+    stations = {name: np.asarray(values, dtype=columns[name]) for name, values in stations.items()}
+    stations["source_names"] = source.categories.to_numpy(dtype=np.str_)
+
+    path = os.path.join(directory, CHARGE_POINTS_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **stations)
+    os.replace(path + ".tmp", path)
+
+    print(f"Read {n_read} charge points from {len(sources)} file(s)")
+    print(f"Dropped {n_read - n_valid} invalid rows ({', '.join(f'{reason}: {n}' for reason, n in invalid.items() if n) or 'none'})")
+    print(f"Dropped {n_valid - n_unique} repeated IDs, merged {n_merged} points at shared locations into {n_merged_stations} stations")
+    return len(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest charge point registry dumps into the columnar station table charge_points.npz")
+    parser.add_argument("sources", nargs="+", help="CSV files with ID, latitude, longitude, max_power_kW, price_€/kWh and source columns (or aliases)")
+    parser.add_argument("--data-dir", default=data_dir)
+    parser.add_argument("--source", default="Public", help="source of rows without one")
+    parser.add_argument("--default-price", type=float, help="€/kWh of rows without a price, which are dropped otherwise")
+    parser.add_argument("--precision", type=int, default=5, help="decimals of the coordinates identifying one station (5: about 1 m)")
+    args = parser.parse_args()
+    n = ingest_charge_points(args.sources, args.data_dir, args.source, args.default_price, args.precision)
+    print(f"Stored {n} stations in {os.path.join(args.data_dir, CHARGE_POINTS_FILE)}")
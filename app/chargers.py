@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from app.brain import ticks
+from app.config import charger_slot_minutes, chargers_per_station
+
+
+class ChargerSlots:
+    """ Occupancy of the charging points of every station in fixed time slots, shared by the trucks of a fleet plan.
+        A charging session occupies one charger in every slot it touches, a station is busy in a slot once all its
+        chargers are taken. Times are plan ticks (microseconds since plan_start), `start` is the first slot.
+    """
+
+    def __init__(self, station_ids, chargers, start=0, slot_minutes=charger_slot_minutes, horizon_hours=48):
+        self.rows = {station_id: row for row, station_id in enumerate(np.asarray(station_ids).tolist())}
+        self.capacity = np.maximum(np.asarray(chargers, dtype=np.int32), 1)
+        self.start = start
+        self.slot = ticks(slot_minutes)
+        self.occupancy = np.zeros((len(self.capacity), horizon_hours * 60 // slot_minutes), dtype=np.int32)
+        self._log = []  # reservations as (row, first slot, last slot), to roll back a failed plan
+
+    @classmethod
+    def for_stations(cls, charge_points: pd.DataFrame, start=0) -> "ChargerSlots":
+        """ Slots of the stations of `charge_points`, with the counts of its `chargers` column or chargers_per_station """
+        if "chargers" in charge_points.columns:
+            chargers = charge_points["chargers"].fillna(chargers_per_station).to_numpy()
+        else:
+            chargers = np.full(len(charge_points), chargers_per_station)
+        return cls(charge_points["ID"].to_numpy(), chargers, start)
+
+    def rows_of(self, station_ids) -> np.ndarray:
+        return np.array([self.rows[station_id] for station_id in station_ids], dtype=np.intp)
+
+    def _slots(self, start, duration):
+        first = (start - self.start) // self.slot
+        last = -((self.start - start - duration) // self.slot)  # ceil, exclusive
+        return first, np.maximum(last, first + 1)
+
+    def _grow(self, n_slots):
+        if n_slots > self.occupancy.shape[1]:
+            grown = np.zeros((len(self.capacity), max(n_slots, 2 * self.occupancy.shape[1])), dtype=np.int32)
+            grown[:, :self.occupancy.shape[1]] = self.occupancy
+            self.occupancy = grown
+
+    def earliest_start(self, rows, arrival, duration) -> np.ndarray:
+        """ Earliest time charging can start at each station row for a truck arriving at `arrival` and charging
+            for `duration` ticks (arrays of the same length): the arrival if a charger is free for the whole session,
+            else the start of the first slot from which one is.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        arrival = np.asarray(arrival, dtype=np.int64)
+        first, last = self._slots(arrival, np.asarray(duration, dtype=np.int64))
+        length = last - first
+        if len(rows) == 0:
+            return arrival
+        self._grow(int(last.max()))
+        while True:
+            n_slots = self.occupancy.shape[1]
+            busy = self.occupancy[rows] >= self.capacity[rows, None]
+            busy_before = np.zeros((len(rows), n_slots + 1), dtype=np.int32)
+            np.cumsum(busy, axis=1, out=busy_before[:, 1:])
+            # busy slots in the window of `length` slots from every slot on
+            slots = np.arange(n_slots)
+            ends = np.minimum(slots[None, :] + length[:, None], n_slots)
+            windows = np.take_along_axis(busy_before, ends, axis=1) - busy_before[:, :-1]
+            free = (windows == 0) & (slots[None, :] >= first[:, None]) & (slots[None, :] + length[:, None] <= n_slots)
+            if free.any(axis=1).all():
+                break
+            self._grow(2 * n_slots)
+        slot = free.argmax(axis=1)
+        return np.where(slot == first, arrival, self.start + slot.astype(np.int64) * self.slot)
+
+    def reserve(self, row, start, duration):
+        """ Take one charger of the station row from `start` for `duration` ticks """
+        first, last = self._slots(start, duration)
+        first, last = int(first), int(last)
+        self._grow(last)
+        self.occupancy[row, first:last] += 1
+        self._log.append((row, first, last))
+
+    def checkpoint(self) -> int:
+        return len(self._log)
+
+    def rollback(self, checkpoint: int):
+        """ Release the reservations made since `checkpoint` """
+        while len(self._log) > checkpoint:
+            row, first, last = self._log.pop()
+            self.occupancy[row, first:last] -= 1
@@ -8,4 +8,76 @@ dotenv.load_dotenv(env_path)
 tomtom_key = os.getenv("TOMTOM_KEY")
 
 # tom tom routing api to create routes between two points for truck
-route_tomtom_post= "https://api.tomtom.com/routing/1/calculateRoute/{location}/json?key={key}&travelMode=truck"
+route_tomtom_post= "https://api.tomtom.com/routing/1/calculateRoute/{location}/json?key={key}&travelMode={travel_mode}"
+travel_mode = os.getenv("TRAVEL_MODE", "truck")
+route_url = os.getenv("ROUTE_URL", route_tomtom_post)  # e.g. a local stand-in server for tests
+routing_max_concurrency = int(os.getenv("ROUTING_MAX_CONCURRENCY", "8"))  # legs fetched at the same time
+routing_retries = int(os.getenv("ROUTING_RETRIES", "3"))
+routing_backoff = float(os.getenv("ROUTING_BACKOFF", "0.5"))  # seconds before the first retry, doubled after each one
+routing_timeout = float(os.getenv("ROUTING_TIMEOUT", "10"))  # seconds per request
+
+# cache of route summaries and points, in memory and in an SQLite file (ROUTE_CACHE_PATH="" keeps it in memory only)
+route_cache_path = os.getenv("ROUTE_CACHE_PATH", os.path.join(os.path.dirname(current_dir), "data", "route_cache.sqlite"))
+route_cache_size = int(os.getenv("ROUTE_CACHE_SIZE", "1024"))  # legs kept in memory
+route_cache_disk_size = int(os.getenv("ROUTE_CACHE_DISK_SIZE", "100000"))  # legs kept on disk
+route_cache_ttl = float(os.getenv("ROUTE_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+route_cache_precision = int(os.getenv("ROUTE_CACHE_PRECISION", "5"))  # decimals of the rounded coordinates in the key
+
+# reference data (cities, truck specs, charging stations) loaded once at startup
+data_dir = os.getenv("DATA_DIR", os.path.join(os.path.dirname(current_dir), "data"))
+reference_reload_interval = float(os.getenv("REFERENCE_RELOAD_INTERVAL", "30"))  # seconds between checks for changed files
+
+# dtype of the haversine distance matrices, float32 halves their memory
+distance_dtype = os.getenv("DISTANCE_DTYPE", "float64")
+
+# multi-stop tour optimization
+held_karp_max_stops = int(os.getenv("HELD_KARP_MAX_STOPS", "10"))  # exact solver up to this many stops, heuristics above
+tour_time_budget = float(os.getenv("TOUR_TIME_BUDGET", "0.25"))  # seconds for the 2-opt / Or-opt improvement
+
+# cache of planned routes by request, optionally in an SQLite file shared by all workers (PLAN_CACHE_PATH)
+plan_cache_path = os.getenv("PLAN_CACHE_PATH", "")
+plan_cache_size = int(os.getenv("PLAN_CACHE_SIZE", "512"))  # plans kept in memory, 0 disables the cache
+plan_cache_disk_size = int(os.getenv("PLAN_CACHE_DISK_SIZE", "10000"))  # plans kept on disk
+plan_cache_ttl = float(os.getenv("PLAN_CACHE_TTL", "3600"))  # seconds
+
+# process pool for /optimize-routes/batch
+batch_workers = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+# executor running the CPU-bound planning of /optimize-route off the event loop
+planning_executor = os.getenv("PLANNING_EXECUTOR", "thread")  # "thread" or "process"
+planning_workers = int(os.getenv("PLANNING_WORKERS", str(os.cpu_count() or 1)))
+planning_queue_size = int(os.getenv("PLANNING_QUEUE_SIZE", str(4 * (os.cpu_count() or 1))))  # waiting plans before 503
+planning_retry_after = int(os.getenv("PLANNING_RETRY_AFTER", "1"))  # seconds, Retry-After of the 503 response
+planning_timeout = float(os.getenv("PLANNING_TIMEOUT", "30"))  # seconds for distance matrix, tour and schedule
+routing_stage_timeout = float(os.getenv("ROUTING_STAGE_TIMEOUT", "30"))  # seconds for the geometry of all legs
+
+# per-stage timings of /optimize-route in a Server-Timing response header
+server_timing = os.getenv("SERVER_TIMING", "0") == "1"
+
+# opt-in sampling profiler of single /optimize-route requests (X-Profile: 1 header or ?profile=1)
+profiling_enabled = os.getenv("PROFILING", "0") == "1"
+profile_rate_limit = int(os.getenv("PROFILE_RATE_LIMIT", "6"))  # profiled requests per minute
+profile_interval = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between stack samples
+profile_dir = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(current_dir), "data", "profiles"))
+profile_keep = int(os.getenv("PROFILE_KEEP", "100"))  # newest profiles kept on disk
+
+# distance matrices kept per planning process for repeated tours and /replan
+matrix_cache_mb = float(os.getenv("MATRIX_CACHE_MB", "256"))  # 0 disables the cache
+
+# planned routes kept for /replan by plan ID, optionally in an SQLite file shared by all workers (PLAN_STORE_PATH)
+plan_store_path = os.getenv("PLAN_STORE_PATH", "")
+plan_store_size = int(os.getenv("PLAN_STORE_SIZE", "1024"))  # plans kept in memory, 0 disables /replan
+plan_store_disk_size = int(os.getenv("PLAN_STORE_DISK_SIZE", "100000"))  # plans kept on disk
+plan_store_ttl = float(os.getenv("PLAN_STORE_TTL", str(24 * 3600)))  # seconds a plan can be replanned
+
+# fleet planning of /optimize-fleet: stops assigned to trucks by large neighbourhood search on the batch process pool
+fleet_time_budget = float(os.getenv("FLEET_TIME_BUDGET", "2"))  # seconds of search per worker
+fleet_shift_hours = float(os.getenv("FLEET_SHIFT_HOURS", "10"))  # driving and stop hours of a truck without a shift_hours
+fleet_overtime_weight = float(os.getenv("FLEET_OVERTIME_WEIGHT", "1000"))  # km of driving that an hour beyond the shift costs as much as
+chargers_per_station = int(os.getenv("CHARGERS_PER_STATION", "2"))  # charging points of a station without a `chargers` column
+charger_slot_minutes = int(os.getenv("CHARGER_SLOT_MINUTES", "15"))  # time slots of the charger occupancy
+
+# distances of the planning matrices: "haversine", or "road" for the truck road network built offline from an OSM extract
+# with `python -m app.road_network` (falls back to haversine while its files are missing or stale)
+distance_backend = os.getenv("DISTANCE_BACKEND", "haversine")
+road_snap_km = float(os.getenv("ROAD_SNAP_KM", "5"))  # locations farther from a road keep haversine distances
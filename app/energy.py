@@ -0,0 +1,93 @@
+import dataclasses
+import functools
+from typing import Optional
+
+import numpy as np
+
+default_consumption = 1.2       # kWh/km when a truck spec has no Consumption_kWh_per_km
+reference_speed_kmh = 80        # speed of the Consumption_kWh_per_km figures, the planning speed of the schedulers
+reference_payload_t = 20        # payload of the Consumption_kWh_per_km figures
+empty_mass_t = 15               # tractor and trailer without payload
+payload_grid_t = np.arange(0, 40.1, 2.5)
+speed_grid_kmh = np.arange(20, 120.1, 5.0)
+# share of rolling resistance (∝ mass), air drag (∝ speed²) and auxiliaries (∝ time per km) at the reference point
+rolling_share, drag_share, auxiliary_share = 0.55, 0.35, 0.10
+
+
+def default_table(consumption, payload_t=payload_grid_t, speed_kmh=speed_grid_kmh) -> np.ndarray:
+    """ kWh/km over the payload x speed grid, scaled so that the reference payload and speed give `consumption` """
+    payload_t, speed_kmh = np.meshgrid(payload_t, speed_kmh, indexing="ij")
+
+    def relative(payload, speed):
+        return (rolling_share * (empty_mass_t + payload) / (empty_mass_t + reference_payload_t)
+                + drag_share * (speed / reference_speed_kmh) ** 2
+                + auxiliary_share * reference_speed_kmh / speed)
+
+    return consumption * relative(payload_t, speed_kmh) / relative(reference_payload_t, reference_speed_kmh)
+
+
+@dataclasses.dataclass(frozen=True)
+class EnergyModel:
+    """ Consumption of a truck as a function of payload and average speed, by bilinear interpolation in a precomputed
+        kWh/km table (clamped at the edges of the grid). `payload_t` is the load used when no payload is given.
+    """
+    payload_grid_t: np.ndarray
+    speed_grid_kmh: np.ndarray
+    table: np.ndarray  # kWh/km, shape (payload, speed)
+    payload_t: float = reference_payload_t
+
+    @classmethod
+    def from_spec(cls, truck_spec: dict) -> "EnergyModel":
+        """ Table of the truck spec ("Consumption_table": {"payload_t": [...], "speed_kmh": [...], "kWh_per_km": [[...]]})
+            or the default curves through its Consumption_kWh_per_km
+        """
+        table = truck_spec.get("Consumption_table")
+        if table is not None:
+            return cls(np.asarray(table["payload_t"], dtype=np.float64), np.asarray(table["speed_kmh"], dtype=np.float64),
+                       np.asarray(table["kWh_per_km"], dtype=np.float64))
+        return cls(payload_grid_t, speed_grid_kmh, default_table(truck_spec.get("Consumption_kWh_per_km", default_consumption)))
+
+    def for_payload(self, payload_t: Optional[float]) -> "EnergyModel":
+        """ Same tables with another default payload, None keeps the reference payload """
+        return self if payload_t is None else dataclasses.replace(self, payload_t=payload_t)
+
+    def kwh_per_km(self, speed_kmh=reference_speed_kmh, payload_t=None):
+        """ Consumption at the given speeds and payloads (scalars or arrays, broadcast against each other) """
+        payload_t = self.payload_t if payload_t is None else payload_t
+        i, u = _grid_position(self.payload_grid_t, payload_t)
+        j, v = _grid_position(self.speed_grid_kmh, speed_kmh)
+        table = self.table
+        return ((1 - u) * ((1 - v) * table[i, j] + v * table[i, j + 1])
+                + u * ((1 - v) * table[i + 1, j] + v * table[i + 1, j + 1]))
+
+    @functools.cached_property
+    def speed_curve(self) -> np.ndarray:
+        """ kWh/km over speed_grid_kmh at the default payload, interpolated per leg by energy """
+        return self.kwh_per_km(self.speed_grid_kmh)
+
+    def energy(self, distance_km, speed_kmh=reference_speed_kmh, payload_t=None):
+        """ kWh needed for legs of `distance_km` driven at `speed_kmh` (arrays of all candidate legs at once) """
+        if payload_t is None:
+            rate = np.interp(speed_kmh, self.speed_grid_kmh, self.speed_curve)
+        else:
+            rate = self.kwh_per_km(speed_kmh, payload_t)
+        return np.asarray(distance_km, dtype=np.float64) * rate
+
+    def min_kwh_per_km(self, min_speed_kmh, max_speed_kmh, payload_t=None) -> float:
+        """ Lowest consumption at any speed between `min_speed_kmh` and `max_speed_kmh`, a lower bound for the legs driven at them """
+        speeds = self.speed_grid_kmh[(self.speed_grid_kmh > min_speed_kmh) & (self.speed_grid_kmh < max_speed_kmh)]
+        return float(self.kwh_per_km(np.concatenate(([min_speed_kmh, max_speed_kmh], speeds)), payload_t).min())
+
+
+def leg_speed_kmh(distance_km, minutes):
+    """ Average speed of legs of `distance_km` taking `minutes`, the reference speed for legs without a duration """
+    distance_km, minutes = np.asarray(distance_km, dtype=np.float64), np.asarray(minutes, dtype=np.float64)
+    speed = np.full(np.broadcast(distance_km, minutes).shape, float(reference_speed_kmh))
+    return np.divide(distance_km * 60, minutes, out=speed, where=minutes > 0)
+
+
+def _grid_position(grid, values):
+    """ Cell index and position within the cell (0..1) of values on an ascending grid, clamped to the grid """
+    values = np.clip(np.asarray(values, dtype=np.float64), grid[0], grid[-1])
+    index = np.clip(np.searchsorted(grid, values, side="right") - 1, 0, len(grid) - 2)
+    return index, (values - grid[index]) / (grid[index + 1] - grid[index])
@@ -0,0 +1,283 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.brain import compute_schedule_fast, time_stoppage_at_nodes
+from app.chargers import ChargerSlots
+from app.config import fleet_overtime_weight, fleet_shift_hours, fleet_time_budget
+from app.Matrix_data_process import haversine_matrix, transform
+from app.metrics import Timings
+from app.planner import _current_reference, matrix_cache, plan_time, route_matrix, station_data
+from app.pydantic_config import FleetRequest, FleetTruck, RouteRequest
+from app.reference_data import ReferenceData
+from app.station_matrix import average_speed_kmh
+from app.tour import local_search, plan_tour
+
+
+@dataclass(frozen=True)
+class FleetProblem:
+    """ Assignment of stops to trucks on the straight-line distances between stops and depots.
+        Nodes 0..n-1 are the stops, the depots follow. A tour takes its distance at the planning speed plus the stop time
+        of every stop, hours beyond the shift of the truck cost `overtime_weight` km each. Charging is left out, it is
+        planned per truck afterwards.
+    """
+    stops: List[str]
+    distances: np.ndarray    # km between all nodes
+    depots: np.ndarray       # truck -> node of its depot
+    max_stops: np.ndarray    # truck -> most stops it can serve
+    shift_hours: np.ndarray  # truck -> hours before overtime
+    overtime_weight: float = fleet_overtime_weight
+
+    def cost(self, lengths, n_stops, shift_hours):
+        """ Tour cost in km of tours of `lengths` km with `n_stops` stops (arrays) """
+        hours = lengths / average_speed_kmh + n_stops * time_stoppage_at_nodes / 60
+        return lengths + self.overtime_weight * np.maximum(hours - shift_hours, 0)
+
+
+def fleet_problem(request: FleetRequest, reference: ReferenceData) -> FleetProblem:
+    """ Validate the cities and truck models of a fleet request and build its assignment problem """
+    city_choices = reference.city_choices
+    for truck in request.trucks:
+        if truck.origin not in city_choices:
+            raise ValueError(f"Invalid city choice {truck.origin} of truck {truck.truck_id}. Please choose from the available cities.")
+        if truck.truck_model not in reference.truck_specs:
+            raise ValueError(f"Unknown truck model {truck.truck_model} of truck {truck.truck_id}")
+        plan_time(truck.start_time)
+    if len({truck.truck_id for truck in request.trucks}) != len(request.trucks):
+        raise ValueError("Truck IDs must be unique")
+    stops = list(dict.fromkeys(request.stops))
+    if any(stop not in city_choices for stop in stops):
+        raise ValueError("Invalid city choice. Please choose from the available cities.")
+
+    depots = list(dict.fromkeys(truck.origin for truck in request.trucks))
+    cities = stops + depots
+    if reference.road_network is not None:
+        distances = reference.road_network.submatrix(reference.road_network.positions(cities, []))
+    else:
+        latitudes = [city_choices[city][0] for city in cities]
+        longitudes = [city_choices[city][1] for city in cities]
+        distances = haversine_matrix(latitudes, longitudes, latitudes, longitudes)
+    return FleetProblem(
+        stops=stops,
+        distances=distances,
+        depots=np.array([len(stops) + depots.index(truck.origin) for truck in request.trucks], dtype=np.intp),
+        max_stops=np.array([len(stops) if truck.max_stops is None else truck.max_stops for truck in request.trucks], dtype=np.intp),
+        shift_hours=np.array([fleet_shift_hours if truck.shift_hours is None else truck.shift_hours for truck in request.trucks]),
+    )
+
+
+class Assignment:
+    """ Stops of every truck in visiting order, with the length of each closed tour and the stops left over """
+
+    def __init__(self, problem: FleetProblem, routes: List[List[int]]):
+        self.problem = problem
+        self.routes = routes
+        self.lengths = np.array([self.route_length(t) for t in range(len(routes))])
+        assigned = {stop for route in routes for stop in route}
+        self.unassigned = [stop for stop in range(len(problem.stops)) if stop not in assigned]
+
+    def route_length(self, truck) -> float:
+        depot = self.problem.depots[truck]
+        nodes = [depot] + self.routes[truck] + [depot]
+        return float(self.problem.distances[nodes[:-1], nodes[1:]].sum())
+
+    def n_stops(self) -> np.ndarray:
+        return np.array([len(route) for route in self.routes])
+
+    def objective(self) -> float:
+        """ Total distance plus overtime, stops left over cost more than any tour """
+        problem = self.problem
+        penalty = 10 * (float(problem.distances.max()) + 1) * len(problem.distances)
+        return float(problem.cost(self.lengths, self.n_stops(), problem.shift_hours).sum()) + penalty * len(self.unassigned)
+
+    def copy(self) -> "Assignment":
+        clone = Assignment.__new__(Assignment)
+        clone.problem, clone.routes = self.problem, [list(route) for route in self.routes]
+        clone.lengths, clone.unassigned = self.lengths.copy(), list(self.unassigned)
+        return clone
+
+    def remove(self, stops):
+        stops = set(stops)
+        for truck, route in enumerate(self.routes):
+            if stops.intersection(route):
+                self.routes[truck] = [stop for stop in route if stop not in stops]
+                self.lengths[truck] = self.route_length(truck)
+        self.unassigned.extend(stops)
+
+    def insertion_costs(self, truck, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Cheapest extra distance and position of inserting each of `stops` into the tour of `truck` """
+        if len(self.routes[truck]) >= self.problem.max_stops[truck]:
+            return np.full(len(stops), np.inf), np.zeros(len(stops), dtype=np.intp)
+        d = self.problem.distances
+        depot = self.problem.depots[truck]
+        nodes = np.array([depot] + self.routes[truck] + [depot], dtype=np.intp)
+        a, b = nodes[:-1], nodes[1:]
+        delta = d[np.ix_(a, stops)] + d[np.ix_(stops, b)].T - d[a, b][:, None]
+        positions = delta.argmin(axis=0)
+        return delta[positions, np.arange(len(stops))], positions
+
+    def repair(self, deadline):
+        """ Regret-2 insertion of the stops left over: the stop losing most if not put into its best tour goes first.
+            Tours that received stops are improved by 2-opt / Or-opt.
+        """
+        pending = np.array(self.unassigned, dtype=np.intp)
+        n_trucks = len(self.routes)
+        costs = np.empty((len(pending), n_trucks))
+        positions = np.empty((len(pending), n_trucks), dtype=np.intp)
+        for truck in range(n_trucks):
+            costs[:, truck], positions[:, truck] = self.insertion_costs(truck, pending)
+        changed = set()
+        problem = self.problem
+        n_stops = self.n_stops()
+        while len(pending):
+            # extra distance and overtime of each insertion
+            current = problem.cost(self.lengths, n_stops, problem.shift_hours)
+            extra = problem.cost(self.lengths[None, :] + costs, n_stops[None, :] + 1, problem.shift_hours[None, :]) - current[None, :]
+            ordered = np.sort(extra, axis=1)
+            best = ordered[:, 0]
+            if not np.isfinite(best).any():
+                break
+            # stops fitting a single tour have an infinite regret and go first
+            regret = np.where(np.isfinite(best), ordered[:, 1] - best if n_trucks > 1 else -best, -np.inf)
+            i = int(regret.argmax())
+            truck = int(extra[i].argmin())
+            self.routes[truck].insert(int(positions[i, truck]), int(pending[i]))
+            self.lengths[truck] += costs[i, truck]
+            n_stops[truck] += 1
+            changed.add(truck)
+            pending = np.delete(pending, i)
+            costs, positions = np.delete(costs, i, axis=0), np.delete(positions, i, axis=0)
+            costs[:, truck], positions[:, truck] = self.insertion_costs(truck, pending)
+        self.unassigned = pending.tolist()
+        for truck in changed:
+            if len(self.routes[truck]) > 3:
+                depot = self.problem.depots[truck]
+                route = local_search(self.problem.distances, np.array([depot] + self.routes[truck] + [depot], dtype=np.intp), deadline)
+                self.routes[truck] = route[1:-1].tolist()
+            self.lengths[truck] = self.route_length(truck)
+
+
+def removal_candidates(assignment: Assignment, rng, n_remove) -> List[int]:
+    """ Stops to take out of their tours, by one of the destroy operators picked at random:
+        random stops, stops saving the most distance when removed, stops close to a random stop, or a whole tour
+    """
+    assigned = [stop for route in assignment.routes for stop in route]
+    if not assigned:
+        return []
+    n_remove = min(n_remove, len(assigned))
+    operator = rng.integers(4)
+    if operator == 0:
+        return rng.choice(assigned, size=n_remove, replace=False).tolist()
+    if operator == 1:
+        d = assignment.problem.distances
+        savings = {}
+        for truck, route in enumerate(assignment.routes):
+            depot = assignment.problem.depots[truck]
+            nodes = [depot] + route + [depot]
+            for i in range(1, len(nodes) - 1):
+                savings[nodes[i]] = d[nodes[i - 1], nodes[i]] + d[nodes[i], nodes[i + 1]] - d[nodes[i - 1], nodes[i + 1]]
+        # randomized worst removal, so that the same stops are not always picked
+        noisy = {stop: saving * rng.uniform(0.6, 1) for stop, saving in savings.items()}
+        return sorted(noisy, key=noisy.get, reverse=True)[:n_remove]
+    if operator == 2:
+        seed = assigned[rng.integers(len(assigned))]
+        distances = assignment.problem.distances[seed, assigned]
+        return [assigned[i] for i in np.argsort(distances, kind="stable")[:n_remove]]
+    routes = [route for route in assignment.routes if route]
+    return list(routes[rng.integers(len(routes))])
+
+
+def solve_assignment(problem: FleetProblem, seed=0, time_budget=fleet_time_budget) -> Tuple[float, List[List[int]], List[int]]:
+    """ Large neighbourhood search for the stops of every truck: destroy part of the assignment, repair it by regret
+        insertion and accept the result by simulated annealing, until `time_budget` seconds have passed or the best
+        assignment did not improve for a while. Runs as a process pool task, one per seed.
+        Return (objective, stops of every truck in visiting order, stops left over).
+    """
+    deadline = time.perf_counter() + time_budget
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    n_stops = len(problem.stops)
+    current = Assignment(problem, [[] for _ in problem.depots])
+    current.repair(deadline)
+    current_objective = current.objective()
+    best, best_objective = current.copy(), current_objective
+    if n_stops < 2:
+        return best_objective, best.routes, best.unassigned
+
+    max_remove = max(2, min(n_stops, 4 + n_stops // 5, 40))
+    max_idle = 50 + 10 * n_stops
+    temperature = max(0.02 * current_objective / n_stops, 1e-9)
+    idle = 0
+    while idle < max_idle and time.perf_counter() < deadline:
+        candidate = current.copy()
+        candidate.remove(removal_candidates(candidate, rng, int(rng.integers(2, max_remove + 1))))
+        candidate.repair(deadline)
+        candidate_objective = candidate.objective()
+        # cooling with the elapsed share of the time budget
+        cooling = max(1 - (time.perf_counter() - started) / time_budget, 1e-3)
+        if candidate_objective < current_objective or rng.random() < math.exp((current_objective - candidate_objective) / (temperature * cooling)):
+            current, current_objective = candidate, candidate_objective
+        if candidate_objective < best_objective - 1e-9:
+            best, best_objective, idle = candidate.copy(), candidate_objective, 0
+        else:
+            idle += 1
+    return best_objective, best.routes, best.unassigned
+
+
+def fleet_route_request(request: FleetRequest, truck: FleetTruck, stops: List[str]) -> RouteRequest:
+    """ Single truck request of a fleet plan, used for its distance matrix, road geometry and /replan """
+    return RouteRequest(origin=truck.origin, stops=stops, start_time=truck.start_time, truck_model=truck.truck_model, engine="greedy",
+                        strategy=request.strategy, payload_t=truck.payload_t, geometry=request.geometry,
+                        geometry_format=request.geometry_format, simplify_tolerance_m=request.simplify_tolerance_m)
+
+
+def schedule_fleet(request: FleetRequest, stops: List[str], routes: List[List[int]], reference: ReferenceData, matrices=None,
+                   timings: Optional[Timings] = None) -> List[dict]:
+    """ Plan the trucks one after the other in the order of their start times, sharing the charger occupancy:
+        a truck prefers stations with a free charger on arrival and otherwise waits at the one free first.
+        Return per truck (in request order) its stops in visiting order and the plan_route result or an error.
+    """
+    timings = timings or Timings()
+    start_times = [plan_time(truck.start_time) for truck in request.trucks]
+    chargers = ChargerSlots.for_stations(reference.charge_points, start=min(start_times))
+    planned = [None] * len(request.trucks)
+    for t in sorted(range(len(request.trucks)), key=start_times.__getitem__):
+        truck = request.trucks[t]
+        truck_stops = [stops[i] for i in routes[t] if stops[i] != truck.origin]
+        if not truck_stops:
+            planned[t] = {"truck_id": truck.truck_id, "stops": [], "result": None, "charger_wait": 0, "error": None}
+            continue
+        truck_request = fleet_route_request(request, truck, truck_stops)
+        distance_matrix, time_matrix, charging_stations = route_matrix(truck_request, reference, matrices, timings)
+        with timings.span("tour"):
+            tour = plan_tour(distance_matrix, truck.origin, truck_stops)
+        checkpoint = chargers.checkpoint()
+        try:
+            with timings.span("schedule"):
+                state = compute_schedule_fast(distance_matrix, charging_stations, truck.origin, truck_stops, tour=tour,
+                                              truck_spec=reference.truck_specs[truck.truck_model], strategy=request.strategy,
+                                              energy_model=reference.energy_models[truck.truck_model].for_payload(truck.payload_t),
+                                              start_time=start_times[t], chargers=chargers, time_matrix=time_matrix,
+                                              **station_data(reference, charging_stations))
+        except Exception as e:
+            chargers.rollback(checkpoint)
+            planned[t] = {"truck_id": truck.truck_id, "stops": tour[1:-1], "result": None, "charger_wait": 0, "error": f"{type(e).__name__}: {e}"}
+            continue
+        timings.count("charging_stops", sum(step.action == "charging" for step in state.plan))
+        with timings.span("transform"):
+            result = transform(raw_data=state.plan, city_choices=reference.city_choices, combined_charge_points=reference.charge_points,
+                               station_rows=reference.station_rows)
+        charger_wait = sum(step.end - step.start for step in state.plan if step.action == "waiting_for_charger") // 60_000_000
+        planned[t] = {"truck_id": truck.truck_id, "stops": tour[1:-1], "result": {**result, "tour": tour}, "charger_wait": charger_wait, "error": None}
+    return planned
+
+
+def schedule_fleet_request(request: FleetRequest, stops: List[str], routes: List[List[int]]) -> dict:
+    """ Process pool task: schedule_fleet on the worker's reference data snapshot and matrix cache """
+    timings = Timings()
+    reference = _current_reference()
+    planned = schedule_fleet(request, stops, routes, reference, matrix_cache.for_version(reference.version), timings)
+    return {"routes": planned, "stats": timings.as_dict()}
@@ -0,0 +1,94 @@
+from typing import List
+
+import numpy as np
+
+from app.spatial_index import EARTH_RADIUS_KM
+
+
+def points_to_arrays(points: List[dict]):
+    """ Latitude and longitude arrays of TomTom route points ({"latitude": .., "longitude": ..} dicts) """
+    latitudes = np.fromiter((point["latitude"] for point in points), dtype=np.float64, count=len(points))
+    longitudes = np.fromiter((point["longitude"] for point in points), dtype=np.float64, count=len(points))
+    return latitudes, longitudes
+
+
+def simplify(latitudes, longitudes, tolerance_m) -> np.ndarray:
+    """ Douglas-Peucker simplification of a polyline, return the indices of the points to keep.
+        No dropped point is further than `tolerance_m` meters from the simplified line. Distances are measured on a
+        local equirectangular projection, accurate to well below a meter over the length of a route leg.
+    """
+    n = len(latitudes)
+    if n <= 2 or tolerance_m <= 0:
+        return np.arange(n)
+    meters_per_degree = EARTH_RADIUS_KM * 1000 * np.pi / 180
+    y = np.asarray(latitudes, dtype=np.float64) * meters_per_degree
+    x = np.asarray(longitudes, dtype=np.float64) * meters_per_degree * np.cos(np.radians(np.mean(latitudes)))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        # distance of the points between first and last to the segment first -> last
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length2 = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / length2, 0, 1) if length2 > 0 else np.zeros(len(px))
+        distance2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+        farthest = int(distance2.argmax())
+        if distance2[farthest] > tolerance_m * tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def encode_polyline(latitudes, longitudes, precision=5) -> str:
+    """ Encoded polyline (Google polyline algorithm) of the coordinates, about 6 characters per point instead of
+        ~45 bytes of JSON. `precision` 5 keeps about 1 m.
+    """
+    coordinates = np.column_stack((latitudes, longitudes)) * 10 ** precision
+    deltas = np.diff(np.round(coordinates).astype(np.int64), axis=0, prepend=0).ravel()
+    # zig-zag sign encoding, then 5-bit chunks with a continuation bit, offset into printable ASCII
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+    chunks = []
+    for value in values:
+        while value >= 0x20:
+            chunks.append((0x20 | (value & 0x1f)) + 63)
+            value >>= 5
+        chunks.append(value + 63)
+    return bytes(chunks).decode("ascii")
+
+
+def decode_polyline(encoded: str, precision=5) -> np.ndarray:
+    """ (n, 2) latitude, longitude array of an encoded polyline """
+    values, value, shift = [], 0, 0
+    for byte in encoded.encode("ascii"):
+        byte -= 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def leg_geometry(points: List[dict], geometry="full", geometry_format="points", tolerance_m=25.0):
+    """ (points, polyline) of a route leg for the response:
+        geometry "none" drops the points, "simplified" applies Douglas-Peucker with `tolerance_m`, "full" keeps all.
+        geometry_format "polyline" returns an encoded polyline instead of the list of point dicts.
+    """
+    if geometry == "none" or not points:
+        return [], None
+    if geometry == "full" and geometry_format == "points":
+        return points, None
+    latitudes, longitudes = points_to_arrays(points)
+    if geometry == "simplified":
+        kept = simplify(latitudes, longitudes, tolerance_m)
+        latitudes, longitudes = latitudes[kept], longitudes[kept]
+        if geometry_format == "points":
+            return [points[i] for i in kept.tolist()], None
+    return [], encode_polyline(latitudes, longitudes)
@@ -1,75 +1,310 @@
-import json
-import pandas as pd
-import httpx
 import asyncio
-from app.Matrix_data_process import validate_input, input_from_user, transform
-from app.config import route_tomtom_post, tomtom_key
-from fastapi import FastAPI
-from app.pydantic_config import RouteRequest, TruckModel, RouteResponse, sample_intermediate_response
-from app.brain import compute_schedule
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from app.pydantic_config import (RouteRequest, RouteResponse, BatchRouteRequest, BatchRouteResult, BatchRouteResponse, ReplanRequest,
+                                 FleetRequest, FleetResponse, FleetTruckRoute)
+from app.planner import (ExecutorSaturated, PlanningExecutor, batch_chunks, get_planning_executor, get_process_pool,
+                         plan_batch_chunk, plan_request, plan_request_profiled, replan_request, shutdown_process_pool)
+from app.config import (batch_workers, fleet_time_budget, plan_cache_size, plan_store_size, planning_retry_after, planning_timeout, profiling_enabled,
+                        routing_stage_timeout, server_timing)
+from app.fleet import fleet_problem, fleet_route_request, schedule_fleet_request, solve_assignment
+from app.metrics import Timings, metrics
+from app.profiler import RateLimiter, load_profile, save_profile
+from app.reference_data import reference_store, watch_reference_data
+from app.routing import RoutingClient, RoutingError, add_geometry, get_routing_client
+from app.route_cache import RouteCache
+from app.plan_cache import PlanCache, PlanStore
+from app.streaming import media_types, stream_batch, stream_route
 
-app = FastAPI(title="AI E-Truck Dispatcher", description="API for e-truck route optimization")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Load the reference data once at startup and hot-reload it when the files change.
+        One routing client (and connection pool) is shared by all requests.
+    """
+    reference_store.reload()
+    watcher = asyncio.create_task(watch_reference_data(reference_store))
+    app.state.routing_client = RoutingClient(cache=RouteCache())
+    app.state.planning_executor = PlanningExecutor()
+    app.state.plan_cache = PlanCache() if plan_cache_size > 0 else None
+    app.state.plan_store = PlanStore() if plan_store_size > 0 else None
+    yield
+    watcher.cancel()
+    await app.state.routing_client.aclose()
+    app.state.planning_executor.shutdown()
+    if app.state.plan_cache is not None:
+        app.state.plan_cache.close()
+    if app.state.plan_store is not None:
+        app.state.plan_store.close()
+    shutdown_process_pool()
+
+app = FastAPI(title="AI E-Truck Dispatcher", description="API for e-truck route optimization", lifespan=lifespan)
+
+def get_plan_cache(http_request: Request) -> Optional[PlanCache]:
+    return http_request.app.state.plan_cache
+
+def get_plan_store(http_request: Request) -> Optional[PlanStore]:
+    return http_request.app.state.plan_store
+
+profile_limiter = RateLimiter()
 
-def get_route(origin, destination):
-    """ Get route details between origin and destination using TomTom Routing API
+def profile_requested(http_request: Request) -> bool:
+    """ Profiling is enabled and asked for with an `X-Profile: 1` header or `?profile=1`, within the rate limit """
+    if not profiling_enabled:
+        return False
+    if http_request.headers.get("x-profile") != "1" and http_request.query_params.get("profile") != "1":
+        return False
+    return profile_limiter.allow()
+
+async def run_planning(request: RouteRequest, executor: PlanningExecutor, plan_cache: Optional[PlanCache] = None,
+                       timings: Optional[Timings] = None, profile=False) -> dict:
+    """ Distance matrix, tour and schedule on the planning executor, keeping the event loop free for other requests.
+        Plans are memoized per request and reference data version if a plan cache is given.
+        timings: gets the stages of the plan, or a plan cache hit
+        profile: plan under the stack sampler (never from the cache), the collapsed stacks are returned under "profile"
     """
-    url = route_tomtom_post.format(location=f"{origin}:{destination}", key=tomtom_key)
-    headers = {
-    "accept": "*/*",
-    "Content-Type": "application/json",
-    }
-    with httpx.Client() as client:
-        response = client.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()["routes"][0]
-            return data["legs"][0]["summary"], data["legs"][0]["points"]
-        else:
-            print(f"Failed to fetch route. Status code: {response}")
-            return None
+    timings = timings if timings is not None else Timings()
+    if plan_cache is not None and not profile:
+        planned = []
+
+        def plan():
+            planned.append(True)
+            return run_planning(request, executor, timings=timings)
+
+        result = await plan_cache.get_or_plan(request, reference_store.get().version, plan)
+        if not planned:
+            timings.count("plan_cache_hits")
+        return result
+    return await run_task(executor, timings, plan_request_profiled if profile else plan_request, request)
+
+async def run_task(executor: PlanningExecutor, timings: Timings, fn, *args) -> dict:
+    """ Planning task on the executor, its stats are added to `timings`. An invalid request (unknown city or truck model,
+        position not on the plan) answers 422, a full executor 503, a slow plan 504.
+    """
+    try:
+        result = await executor.run(fn, *args, timeout=planning_timeout)
+        timings.update(result.pop("stats"))
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ExecutorSaturated as e:
+        print(e)
+        raise HTTPException(status_code=503, detail="Too many route plans in progress, retry later",
+                            headers={"Retry-After": str(planning_retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Route planning timed out")
 
 @app.post("/optimize-route", response_model=RouteResponse)
-async def optimize_route(request: RouteRequest) -> RouteResponse:
+async def optimize_route(request: RouteRequest, response: Response, http_request: Request, routing_client: RoutingClient = Depends(get_routing_client),
+                         executor: PlanningExecutor = Depends(get_planning_executor),
+                         plan_cache: Optional[PlanCache] = Depends(get_plan_cache),
+                         plan_store: Optional[PlanStore] = Depends(get_plan_store)) -> RouteResponse:
     """ Endpoint to optimize the route for an electric truck given origin, stops, truck model, and start time
     """
     print("Received request: ", request)
-    origin = request.origin
-    stops = request.stops
-    start_time = request.start_time
-    truck_model = request.truck_model
-
-    # step 1. calculate approximate distance between origin, stops and filter charging stations within truck range using haversine distance
-    origin, stop, truck_model, start_time, city_choices, combined_charge_points = validate_input(origin, stops[0], truck_model, start_time)
-    distance_matrix, charging_stations = await input_from_user(origin, stop, city_choices, combined_charge_points, truck_model)
-
-    # step 2. call waypoint api for TSP
-    # TODO calculate a simple TSP route between input origins and stops if there is more than 1 stop. (Otherwise route is origin -> stop -> origin)
-    tour= [origin]+ stops + [origin]
-
-    # step 3. call our algo for schedule 
-    scheduled_truck_state= compute_schedule(distance_matrix, charging_stations, origin, stops, tour= tour, truck_spec=truck_model)
-    # df=pd.DataFrame(scheduled_truck_state.plan)
-    # df.to_csv("Fahr Plan.csv", index=False)
-    brain_response= transform(raw_data=scheduled_truck_state.plan, city_choices=city_choices, combined_charge_points=combined_charge_points)
-    total_distance = 0
-    total_duration = 0
-    for ind,sample in enumerate(brain_response["route"]):
-        # if previous element does not have the same lat and long, compute points of fastest route between the 2 elements and populate "points"
-        if ind == 0:
-            continue
-        if (sample["latitude"] != brain_response["route"][ind-1]["latitude"] or sample["longitude"] != brain_response["route"][ind-1]["longitude"]):
-            origin= f"{brain_response['route'][ind-1]['latitude']},{brain_response['route'][ind-1]['longitude']}"
-            destination= f"{sample['latitude']},{sample['longitude']}"
-            summary, points= (get_route(origin, destination))
-            total_distance += summary["lengthInMeters"]
-            total_duration += summary["travelTimeInSeconds"]
-            sample["points"]= points
+    metrics.inc("requests")
+    timings = Timings()
+    profile = profile_requested(http_request)
+    try:
+        # steps 1-3. distance matrix, tour and schedule
+        with timings.span("planning"):
+            brain_response = await run_planning(request, executor, plan_cache, timings, profile)
+        if profile:
+            response.headers["X-Profile-Id"] = await asyncio.to_thread(save_profile, brain_response.pop("profile"))
+        # step 4. road geometry of the legs
+        total_distance, total_duration = await route_totals(brain_response, request, routing_client, timings)
+    finally:
+        metrics.record(timings)
+    if server_timing:
+        response.headers["Server-Timing"] = timings.server_timing()
     return RouteResponse(
         route=brain_response["route"],
-        total_distance= total_distance/1000,  # convert to km
-        total_duration= total_duration/3600  # convert to hours
+        total_distance= total_distance,
+        total_duration= total_duration,
+        plan_id=await store_plan(plan_store, request, brain_response)
     )
 
+async def route_totals(brain_response: dict, request: RouteRequest, routing_client: RoutingClient, timings: Timings):
+    """ Fill in the road geometry of the legs and return (total distance, total duration) from the routing API,
+        or the totals of the plan if no geometry is requested. Routing failures answer 502, a slow routing API 504.
+    """
+    if request.geometry == "none":
+        return brain_response["total_distance"], brain_response["total_duration"]
+    try:
+        with timings.span("routing"):
+            return await asyncio.wait_for(add_geometry(brain_response["route"], request, routing_client), routing_stage_timeout)
+    except RoutingError as e:
+        print(e)
+        raise HTTPException(status_code=502, detail="Routing service unavailable")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Routing service timed out")
+
+async def store_plan(plan_store: Optional[PlanStore], request: RouteRequest, brain_response: dict) -> Optional[str]:
+    """ ID of the plan for /replan, None if plans are not stored """
+    if plan_store is None:
+        return None
+    return await asyncio.to_thread(plan_store.add, request, brain_response["tour"])
+
+@app.post("/replan", response_model=RouteResponse)
+async def replan(replan_request_body: ReplanRequest, response: Response, routing_client: RoutingClient = Depends(get_routing_client),
+                 executor: PlanningExecutor = Depends(get_planning_executor),
+                 plan_store: Optional[PlanStore] = Depends(get_plan_store)) -> RouteResponse:
+    """ Continue a plan of /optimize-route (or /replan) from the truck's current position, time and battery.
+        The stops still ahead keep their order, only the charging stops and times are computed again.
+    """
+    print("Received replan: ", replan_request_body)
+    metrics.inc("replans")
+    stored = await asyncio.to_thread(plan_store.get, replan_request_body.plan_id) if plan_store is not None else None
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired plan_id")
+    request, tour = stored
+    timings = Timings()
+    try:
+        with timings.span("planning"):
+            brain_response = await run_task(executor, timings, replan_request, request, tour, replan_request_body)
+        total_distance, total_duration = await route_totals(brain_response, request, routing_client, timings)
+    finally:
+        metrics.record(timings)
+    if server_timing:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return RouteResponse(
+        route=brain_response["route"],
+        total_distance=total_distance,
+        total_duration=total_duration,
+        plan_id=await store_plan(plan_store, request, brain_response)
+    )
+
+@app.post("/optimize-routes/batch", response_model=BatchRouteResponse)
+async def optimize_routes_batch(batch: BatchRouteRequest, routing_client: RoutingClient = Depends(get_routing_client),
+                               plan_store: Optional[PlanStore] = Depends(get_plan_store)) -> BatchRouteResponse:
+    """ Plan many routes at once. Requests touching the same cities with the same truck share one distance matrix,
+        schedules are computed on a process pool. Results are in the order of the requests, a failing request
+        returns an error instead of failing the batch.
+    """
+    print(f"Received batch of {len(batch.requests)} requests")
+    loop = asyncio.get_running_loop()
+    chunks = batch_chunks(batch.requests)
+    planned = await asyncio.gather(*(loop.run_in_executor(get_process_pool(), plan_batch_chunk, [batch.requests[i] for i in chunk])
+                                     for chunk in chunks))
+    results = [None] * len(batch.requests)
+    for chunk, chunk_results in zip(chunks, planned):
+        for i, result in zip(chunk, chunk_results):
+            results[i] = result
+
+    async def finish(request, result):
+        if "error" in result:
+            return BatchRouteResult(error=result["error"])
+        if request.geometry == "none":
+            total_distance, total_duration = result["total_distance"], result["total_duration"]
+        else:
+            try:
+                total_distance, total_duration = await add_geometry(result["route"], request, routing_client)
+            except RoutingError as e:
+                return BatchRouteResult(error=str(e))
+        return BatchRouteResult(result=RouteResponse(route=result["route"], total_distance=total_distance, total_duration=total_duration,
+                                                     plan_id=await store_plan(plan_store, request, result)))
+
+    return BatchRouteResponse(results=await asyncio.gather(*(finish(request, result) for request, result in zip(batch.requests, results))))
+
+
+@app.post("/optimize-fleet", response_model=FleetResponse)
+async def optimize_fleet(request: FleetRequest, response: Response, routing_client: RoutingClient = Depends(get_routing_client),
+                         plan_store: Optional[PlanStore] = Depends(get_plan_store)) -> FleetResponse:
+    """ Assign the stops to the trucks of a fleet and plan every truck, sharing the chargers of the stations.
+        Independent searches of the assignment run on the process pool, the best one is planned truck by truck.
+    """
+    print("Received fleet request: ", request)
+    metrics.inc("fleets")
+    timings = Timings()
+    loop = asyncio.get_running_loop()
+    try:
+        try:
+            problem = fleet_problem(request, reference_store.get())
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        with timings.span("assignment"):
+            solutions = await asyncio.gather(*(loop.run_in_executor(get_process_pool(), solve_assignment, problem, seed,
+                                                                    request.time_budget_s or fleet_time_budget)
+                                               for seed in range(max(batch_workers, 1))))
+        _, routes, unassigned = min(solutions, key=lambda solution: solution[0])
+        with timings.span("planning"):
+            planned = await loop.run_in_executor(get_process_pool(), schedule_fleet_request, request, problem.stops, routes)
+        timings.update(planned.pop("stats"))
+
+        async def finish(truck, truck_plan):
+            result = truck_plan.pop("result")
+            if result is None:
+                return FleetTruckRoute(**truck_plan)
+            truck_request = fleet_route_request(request, truck, truck_plan["stops"])
+            try:
+                total_distance, total_duration = await route_totals(result, truck_request, routing_client, timings)
+            except HTTPException as e:
+                return FleetTruckRoute(**{**truck_plan, "error": e.detail})
+            return FleetTruckRoute(**truck_plan, result=RouteResponse(route=result["route"], total_distance=total_distance,
+                                                                      total_duration=total_duration,
+                                                                      plan_id=await store_plan(plan_store, truck_request, result)))
+
+        fleet_routes = await asyncio.gather(*(finish(truck, truck_plan) for truck, truck_plan in zip(request.trucks, planned["routes"])))
+    finally:
+        metrics.record(timings)
+    if server_timing:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return FleetResponse(
+        routes=fleet_routes,
+        unassigned=[problem.stops[i] for i in unassigned],
+        total_distance=sum(route.result.total_distance for route in fleet_routes if route.result is not None),
+        charger_wait=sum(route.charger_wait for route in fleet_routes)
+    )
+
+@app.post("/optimize-route/stream")
+async def optimize_route_stream(request: RouteRequest, stream_format: Literal["ndjson", "sse"] = Query("ndjson", alias="format"),
+                                routing_client: RoutingClient = Depends(get_routing_client),
+                                executor: PlanningExecutor = Depends(get_planning_executor),
+                                plan_cache: Optional[PlanCache] = Depends(get_plan_cache)) -> StreamingResponse:
+    """ Streaming variant of /optimize-route: the route points are sent as soon as the schedule is computed,
+        the road geometry of each leg follows as it arrives
+    """
+    print("Received request: ", request)
+    metrics.inc("requests")
+    timings = Timings()
+    try:
+        with timings.span("planning"):
+            brain_response = await run_planning(request, executor, plan_cache, timings)
+    finally:
+        metrics.record(timings)
+    headers = {"Server-Timing": timings.server_timing()} if server_timing else None
+    return StreamingResponse(stream_route(brain_response, request, routing_client, stream_format), media_type=media_types[stream_format],
+                             headers=headers)
+
+@app.post("/optimize-routes/batch/stream")
+async def optimize_routes_batch_stream(batch: BatchRouteRequest, stream_format: Literal["ndjson", "sse"] = Query("ndjson", alias="format"),
+                                       routing_client: RoutingClient = Depends(get_routing_client)) -> StreamingResponse:
+    """ Streaming variant of /optimize-routes/batch: each route is sent as soon as it is planned, geometry follows """
+    print(f"Received batch of {len(batch.requests)} requests")
+    return StreamingResponse(stream_batch(batch.requests, routing_client, stream_format), media_type=media_types[stream_format])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """ Counters and stage duration histograms in the Prometheus text format """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str) -> PlainTextResponse:
+    """ Collapsed stacks of a profiled request (X-Profile-Id header), input for flamegraph.pl or speedscope """
+    collapsed = await asyncio.to_thread(load_profile, profile_id) if profiling_enabled else None
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed)
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "message": "AI E-Truck Dispatcher API is running"}
\ No newline at end of file
+async def health_check(routing_client: RoutingClient = Depends(get_routing_client),
+                       executor: PlanningExecutor = Depends(get_planning_executor),
+                       plan_cache: Optional[PlanCache] = Depends(get_plan_cache)):
+    health = {"status": "healthy", "message": "AI E-Truck Dispatcher API is running",
+              "planning": {"in_flight": executor.in_flight, "capacity": executor.capacity}}
+    if routing_client.cache is not None:
+        health["route_cache"] = routing_client.cache.stats()
+    if plan_cache is not None:
+        health["plan_cache"] = plan_cache.stats()
+    return health
\ No newline at end of file
@@ -0,0 +1,121 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# upper bounds (seconds) of the stage duration histogram buckets
+duration_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name -> help text of the counters, in the order they are exposed on /metrics
+counters = {
+    "requests": "Route plans requested",
+    "replans": "Plans continued with /replan",
+    "fleets": "Fleet plans requested",
+    "stations_filtered": "Charging stations within truck range of the planned tours",
+    "matrix_cells": "Cells of the distance matrices built",
+    "charging_stops": "Charging stops of the planned routes",
+    "plan_cache_hits": "Route plans served from the plan cache",
+    "matrix_cache_hits": "Distance matrices reused from the matrix cache",
+    "routing_requests": "Requests sent to the routing API",
+    "route_cache_hits": "Legs served from the route cache",
+}
+
+
+class Timings:
+    """ Stage durations (ms) and counts of one request, in the order the stages ran.
+        Plain dicts, so that a worker process can return them with its result.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0) + (time.perf_counter() - started) * 1000
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def update(self, stats: dict):
+        """ Add the stages and counts of as_dict() output, e.g. the stats of a plan computed in a worker """
+        for stage, ms in stats.get("stages", {}).items():
+            self.stages[stage] = self.stages.get(stage, 0) + ms
+        for name, value in stats.get("counts", {}).items():
+            self.count(name, value)
+
+    def as_dict(self) -> dict:
+        return {"stages": dict(self.stages), "counts": dict(self.counts)}
+
+    def server_timing(self) -> str:
+        """ Value of a Server-Timing header: a `stage;dur=ms` entry per stage and a `name;desc=value` entry per count """
+        entries = [f"{stage};dur={ms:.1f}" for stage, ms in self.stages.items()]
+        entries += [f'{name};desc="{value}"' for name, value in self.counts.items()]
+        return ", ".join(entries)
+
+
+class Metrics:
+    """ Process-wide counters and stage duration histograms, rendered in the Prometheus text format """
+
+    def __init__(self, prefix="dispatcher"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(counters, 0)
+        self._histograms: Dict[str, list] = {}  # stage -> [bucket counts..., count, sum]
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, [0] * (len(duration_buckets) + 2))
+            for i, bound in enumerate(duration_buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def record(self, timings: Timings):
+        """ Add the stages and counts of a finished request """
+        for stage, ms in timings.stages.items():
+            self.observe(stage, ms / 1000)
+        for name, value in timings.counts.items():
+            self.inc(name, value)
+
+    @contextmanager
+    def span(self, stage, timings: Optional[Timings] = None):
+        """ Time a stage into the histogram, and into `timings` if given """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(stage, seconds)
+            if timings is not None:
+                timings.stages[stage] = timings.stages.get(stage, 0) + seconds * 1000
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, value in self._counters.items():
+                lines.append(f"# HELP {self.prefix}_{name}_total {counters.get(name, name)}")
+                lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+                lines.append(f"{self.prefix}_{name}_total {value}")
+            name = f"{self.prefix}_stage_duration_seconds"
+            lines.append(f"# HELP {name} Duration of the stages of a route plan")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in self._histograms.items():
+                for bound, count in zip(duration_buckets, histogram):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram[-2]}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram[-1]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram[-2]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
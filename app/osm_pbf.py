@@ -0,0 +1,153 @@
+import lzma
+import struct
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# Minimal reader of OpenStreetMap .osm.pbf extracts: the blob/block framing and the few protobuf messages needed
+# for a road network (dense nodes, nodes and ways). Packed fields are decoded with NumPy a whole array at a time.
+
+
+def _varint(buf, pos) -> Tuple[int, int]:
+    """ (value, position after it) of the varint at `pos` """
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _fields(buf) -> Iterator[Tuple[int, object]]:
+    """ (field number, value) of the fields of a protobuf message: ints for varints, bytes slices otherwise """
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = _varint(buf, pos)
+        elif wire == 2:
+            length, pos = _varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire}")
+        yield key >> 3, value
+
+
+def packed_varints(buf) -> np.ndarray:
+    """ Values of a packed repeated varint field as uint64 """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # position of every byte within its varint, 7 bits each
+    shifts = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    values = (data & 0x7F).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.add.reduceat(values, starts)
+
+
+def packed_sint64(buf) -> np.ndarray:
+    """ Values of a packed repeated sint64 (zigzag) field """
+    values = packed_varints(buf)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _int64(value: int) -> int:
+    """ Negative int64 fields are sent as 64-bit two's complement """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def read_blocks(path) -> Iterator[Tuple[List[str], dict, List[bytes]]]:
+    """ (string table, block settings, primitive groups) of every OSMData block of an extract """
+    with open(path, "rb") as f:
+        while True:
+            size = f.read(4)
+            if not size:
+                return
+            header = dict(_fields(f.read(struct.unpack(">I", size)[0])))
+            blob = dict(_fields(f.read(header[3])))
+            if header[1] != b"OSMData":
+                continue  # OSMHeader
+            if 1 in blob:
+                data = blob[1]
+            elif 3 in blob:
+                data = zlib.decompress(blob[3])
+            elif 4 in blob:
+                data = lzma.decompress(blob[4])
+            else:
+                raise ValueError(f"Unsupported blob compression in {path}, convert it with `osmium cat -f pbf,pbf_compression=zlib`")
+
+            strings, groups = [], []
+            settings = {"granularity": 100, "lat_offset": 0, "lon_offset": 0}
+            for field, value in _fields(data):
+                if field == 1:
+                    strings = [s.decode("utf-8", "replace") for number, s in _fields(value) if number == 1]
+                elif field == 2:
+                    groups.append(value)
+                elif field == 17:
+                    settings["granularity"] = value
+                elif field == 19:
+                    settings["lat_offset"] = _int64(value)
+                elif field == 20:
+                    settings["lon_offset"] = _int64(value)
+            yield strings, settings, groups
+
+
+def iter_ways(path) -> Iterator[Tuple[np.ndarray, Dict[str, str]]]:
+    """ (node IDs, tags) of every way of an extract """
+    for strings, _, groups in read_blocks(path):
+        for group in groups:
+            for field, way in _fields(group):
+                if field != 3:
+                    continue
+                keys = vals = refs = b""
+                for number, value in _fields(way):
+                    if number == 2:
+                        keys = value
+                    elif number == 3:
+                        vals = value
+                    elif number == 8:
+                        refs = value
+                tags = {strings[k]: strings[v] for k, v in zip(packed_varints(keys).tolist(), packed_varints(vals).tolist())}
+                yield np.cumsum(packed_sint64(refs)), tags
+
+
+def node_coordinates(path, node_ids) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ (latitude, longitude, found) of the given sorted unique node IDs, NaN where a node is not in the extract """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    latitude = np.full(len(node_ids), np.nan)
+    longitude = np.full(len(node_ids), np.nan)
+
+    def store(ids, lat, lon, settings):
+        positions = np.minimum(np.searchsorted(node_ids, ids), max(len(node_ids) - 1, 0))
+        wanted = node_ids[positions] == ids if len(node_ids) else np.zeros(len(ids), dtype=bool)
+        granularity = settings["granularity"]
+        latitude[positions[wanted]] = (settings["lat_offset"] + granularity * lat[wanted]) * 1e-9
+        longitude[positions[wanted]] = (settings["lon_offset"] + granularity * lon[wanted]) * 1e-9
+
+    for _, settings, groups in read_blocks(path):
+        for group in groups:
+            for field, value in _fields(group):
+                if field == 2:  # DenseNodes, delta coded
+                    dense = {number: item for number, item in _fields(value)}
+                    store(np.cumsum(packed_sint64(dense.get(1, b""))), np.cumsum(packed_sint64(dense.get(8, b""))),
+                          np.cumsum(packed_sint64(dense.get(9, b""))), settings)
+                elif field == 1:  # Node
+                    node = {number: item for number, item in _fields(value)}
+                    store(np.array([_zigzag(node[1])]), np.array([_zigzag(node[8])]), np.array([_zigzag(node[9])]), settings)
+    return latitude, longitude, ~np.isnan(latitude)
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.cache import TwoTierCache
+from app.config import (plan_cache_disk_size, plan_cache_path, plan_cache_size, plan_cache_ttl, plan_store_disk_size,
+                        plan_store_path, plan_store_size, plan_store_ttl)
+from app.pydantic_config import RouteRequest
+
+# request fields that change the plan, the geometry options only change how the legs are returned
+plan_fields = ("origin", "stops", "start_time", "truck_model", "engine", "strategy", "driver_rest", "payload_t")
+
+
+def plan_key(request: RouteRequest, version) -> str:
+    """ Reference data version and a hash of the canonical planning fields of the request """
+    fields = request.model_dump(include=set(plan_fields))
+    fields["stops"] = list(dict.fromkeys(fields["stops"]))
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"{version}:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _copy_plan(plan: dict) -> dict:
+    """ Copy of the route points, callers fill in the geometry of their copy in place """
+    return {**plan, "route": [dict(point) for point in plan["route"]]}
+
+
+class PlanCache(TwoTierCache):
+    """ Two-tier (memory LRU + optional SQLite) cache of planned routes (plan_route output) by plan_key.
+        Identical requests arriving while one is being planned wait for that plan instead of computing it again.
+        Entries of an older reference data version are dropped as soon as a request with a newer version comes in.
+    """
+    table = "plans"
+
+    def __init__(self, path=plan_cache_path, size=plan_cache_size, disk_size=plan_cache_disk_size, ttl=plan_cache_ttl):
+        super().__init__(path, size, disk_size, ttl)
+        self.version = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def get_or_plan(self, request: RouteRequest, version, plan: Callable[[], Awaitable[dict]]) -> dict:
+        """ Cached plan of the request for this reference data version, or the result of `await plan()` """
+        if version != self.version:
+            self.version = version
+            await asyncio.to_thread(self.clear, f"{version}:")
+        key = plan_key(request, version)
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return _copy_plan(cached)
+        if key in self._in_flight:
+            return _copy_plan(await asyncio.shield(self._in_flight[key]))
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await plan()
+            await asyncio.to_thread(self.put, key, _copy_plan(result))
+            future.set_result(result)
+            return _copy_plan(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._in_flight[key]
+
+
+class PlanStore(TwoTierCache):
+    """ Request and tour of the plans returned to clients, by plan ID, so that /replan can continue them """
+    table = "plan_contexts"
+
+    def __init__(self, path=plan_store_path, size=plan_store_size, disk_size=plan_store_disk_size, ttl=plan_store_ttl):
+        super().__init__(path, size, disk_size, ttl)
+
+    def add(self, request: RouteRequest, tour: List) -> str:
+        """ Store a plan and return its new ID """
+        plan_id = uuid.uuid4().hex
+        self.put(plan_id, {"request": request.model_dump(mode="json"), "tour": tour})
+        return plan_id
+
+    def get(self, plan_id) -> Optional[Tuple[RouteRequest, List]]:
+        """ (request, tour) of a stored plan or None """
+        value = super().get(plan_id)
+        return None if value is None else (RouteRequest(**value["request"]), value["tour"])
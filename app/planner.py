@@ -0,0 +1,355 @@
+import asyncio
+import math
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+from fastapi import Request
+
+from app import brain, brain_driver_constraints, brain_optimal
+from app.brain import plan_start, ticks
+from app.config import batch_workers, matrix_cache_mb, planning_executor, planning_queue_size, planning_workers
+from app.Matrix_data_process import add_location, build_distance_matrix, transform, validate_input
+from app.metrics import Timings
+from app.profiler import profile_call
+from app.pydantic_config import ReplanRequest, RouteRequest
+from app.reference_data import ReferenceData, reference_store
+from app.tour import plan_tour
+
+# (engine, driver_rest) -> compute_schedule implementation
+schedulers = {
+    ("greedy", False): brain.compute_schedule_fast,
+    ("optimal", False): brain_optimal.compute_schedule_optimal,
+    ("greedy", True): brain_driver_constraints.compute_schedule,
+    ("optimal", True): brain_driver_constraints.compute_schedule_optimal,
+}
+
+
+def matrix_key(request: RouteRequest):
+    """ Requests with the same key plan on the same distance matrix: same origin, set of stops and truck model """
+    return request.origin, tuple(sorted(set(request.stops) - {request.origin})), request.truck_model
+
+
+class MatrixCache:
+    """ LRU of (distance matrix, time matrix, charging stations) by reference data version and matrix_key, bounded by the bytes of
+        the matrices. One per process, shared by its planning threads through for_version().
+    """
+
+    def __init__(self, max_mb=matrix_cache_mb):
+        self.max_bytes = max_mb * 1e6
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def _size(value):
+        distance_matrix, time_matrix, _ = value
+        return distance_matrix.to_numpy().nbytes + time_matrix.to_numpy().nbytes
+
+    def put(self, key, value):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def for_version(self, version) -> "VersionMatrices":
+        return VersionMatrices(self, version)
+
+
+class VersionMatrices:
+    """ The `matrices` argument of plan_route backed by a MatrixCache, for one reference data version """
+
+    def __init__(self, cache: MatrixCache, version):
+        self.cache = cache
+        self.version = version
+
+    def get(self, key):
+        return self.cache.get((self.version, key))
+
+    def __setitem__(self, key, value):
+        self.cache.put((self.version, key), value)
+
+
+matrix_cache = MatrixCache()
+
+
+def route_matrix(request: RouteRequest, reference: ReferenceData, matrices=None, timings: Optional[Timings] = None):
+    """ (distance matrix, time matrix, charging stations) of the origin and stops of a request, from `matrices` or built """
+    timings = timings or Timings()
+    key = matrix_key(request)
+    cached = matrices.get(key) if matrices is not None else None
+    if cached is not None:
+        timings.count("matrix_cache_hits")
+        return cached
+    # stops in a canonical order, the matrix is looked up by label only
+    with timings.span("matrix"):
+        distance_matrix, time_matrix, charging_stations = build_distance_matrix(
+            request.origin, list(key[1]), reference.city_choices, reference.charge_points, reference.truck_specs[request.truck_model],
+            station_index=reference.station_index, station_matrix=reference.station_matrix, road_network=reference.road_network)
+    timings.count("stations_filtered", len(charging_stations))
+    timings.count("matrix_cells", distance_matrix.size)
+    if matrices is not None:
+        matrices[key] = distance_matrix, time_matrix, charging_stations
+    return distance_matrix, time_matrix, charging_stations
+
+
+def plan_route(request: RouteRequest, reference: ReferenceData, matrices=None, timings: Optional[Timings] = None) -> dict:
+    """ CPU-bound part of /optimize-route: validate the request, build the distance matrix, order the tour,
+        compute the schedule and transform it to the response format (without road geometry).
+        matrices: (distance matrix, time matrix, charging stations) by matrix_key, a dict shared by the requests of a batch
+                  or the matrix cache of the process
+        timings: collects the duration of each step and the stations, matrix cells and charging stops
+    """
+    timings = timings or Timings()
+    with timings.span("validate"):
+        origin, stops, truck_model, start_time, city_choices, combined_charge_points = validate_input(
+            request.origin, request.stops, request.truck_model, request.start_time, reference)
+        stops = [stop for stop in dict.fromkeys(stops) if stop != origin]
+
+    # step 1. calculate approximate distance between origin, stops and filter charging stations within truck range using haversine distance
+    distance_matrix, time_matrix, charging_stations = route_matrix(request, reference, matrices, timings)
+
+    # step 2. order the stops as the shortest round trip from the origin (origin -> stop -> origin for a single stop)
+    with timings.span("tour"):
+        tour = plan_tour(distance_matrix, origin, stops)
+
+    # step 3. call our algo for schedule
+    compute_schedule = schedulers[(request.engine, request.driver_rest)]
+    energy_model = reference.energy_models[request.truck_model].for_payload(request.payload_t)
+    with timings.span("schedule"):
+        scheduled_truck_state = compute_schedule(distance_matrix, charging_stations, origin, stops, tour=tour, truck_spec=truck_model, strategy=request.strategy,
+                                                 energy_model=energy_model, time_matrix=time_matrix, **station_data(reference, charging_stations))
+    timings.count("charging_stops", sum(step.action == "charging" for step in scheduled_truck_state.plan))
+    with timings.span("transform"):
+        result = transform(raw_data=scheduled_truck_state.plan, city_choices=city_choices, combined_charge_points=combined_charge_points,
+                           station_rows=reference.station_rows)
+    return {**result, "tour": tour}
+
+
+def station_tariffs(reference: ReferenceData, charging_stations: pd.DataFrame):
+    """ Time-of-use tariffs of the filtered charging stations, None without station_tariffs.npz """
+    if reference.tariffs is None:
+        return None
+    return reference.tariffs.for_stations(reference.station_rows, charging_stations["ID"])
+
+
+def station_data(reference: ReferenceData, charging_stations: pd.DataFrame) -> dict:
+    """ Scheduler arguments describing the filtered charging stations: power and price arrays and tariffs """
+    return {"station_power_kw": reference.station_power_kw, "station_price": reference.station_price,
+            "tariffs": station_tariffs(reference, charging_stations)}
+
+
+def plan_time(clock: str) -> int:
+    """ "HH:MM" as ticks of the plan time line, which starts at plan_start """
+    minutes = datetime.strptime(clock, "%H:%M")
+    return ticks((minutes.hour - plan_start.hour) * 60 + minutes.minute - plan_start.minute)
+
+
+def replan_route(request: RouteRequest, tour: List, replan: ReplanRequest, reference: ReferenceData, matrices=None,
+                 timings: Optional[Timings] = None) -> dict:
+    """ Schedule of the rest of a planned tour from the truck's current position, time and battery (/replan).
+        The distance matrix of the plan is reused, the remaining stops keep their planned order and only the
+        charging stops and times after the current position are computed again. Same result format as plan_route,
+        its tour starts at the current position. Raise ValueError if the position or next stop do not fit the plan.
+    """
+    timings = timings or Timings()
+    with timings.span("validate"):
+        origin, stops, truck_model, start_time, city_choices, combined_charge_points = validate_input(
+            request.origin, request.stops, request.truck_model, request.start_time, reference)
+        start_time = plan_time(replan.current_time)
+    distance_matrix, time_matrix, charging_stations = route_matrix(request, reference, matrices, timings)
+
+    # where the truck is: a location of the matrix or a new row for its coordinates
+    if replan.location is not None:
+        position = matrix_label(distance_matrix, replan.location)
+    elif replan.latitude is not None and replan.longitude is not None:
+        position = "Current position"
+        city_choices = {**city_choices, position: [replan.latitude, replan.longitude]}
+        with timings.span("matrix"):
+            distance_matrix, time_matrix = add_location(distance_matrix, time_matrix, charging_stations, city_choices, position,
+                                                        reference.road_network)
+    else:
+        raise ValueError("Give the location or the latitude and longitude of the truck")
+
+    # stops still ahead, in the order of the plan
+    if replan.next_stop is not None:
+        if replan.next_stop not in tour[1:]:
+            raise ValueError(f"{replan.next_stop} is not a stop of the plan")
+        next_index = tour.index(replan.next_stop, 1)
+    elif position in tour[:-1]:
+        next_index = tour.index(position) + 1
+    else:
+        raise ValueError("Give next_stop when the truck is not at a stop of the plan")
+    remaining = [position] + tour[next_index:]
+
+    compute_schedule = schedulers[(request.engine, request.driver_rest)]
+    energy_model = reference.energy_models[request.truck_model].for_payload(request.payload_t)
+    with timings.span("schedule"):
+        scheduled_truck_state = compute_schedule(distance_matrix, charging_stations, position, remaining[1:-1], tour=remaining, truck_spec=truck_model,
+                                                 strategy=request.strategy, energy_model=energy_model, start_soc=replan.soc_kwh, start_time=start_time,
+                                                 time_matrix=time_matrix, **station_data(reference, charging_stations))
+    timings.count("charging_stops", sum(step.action == "charging" for step in scheduled_truck_state.plan))
+    with timings.span("transform"):
+        result = transform(raw_data=scheduled_truck_state.plan, city_choices=city_choices, combined_charge_points=combined_charge_points,
+                           station_rows=reference.station_rows)
+    return {**result, "tour": remaining}
+
+
+def matrix_label(distance_matrix: pd.DataFrame, location: str):
+    """ Label of a location of the distance matrix: a city name or a charging station ID given as text """
+    if location in distance_matrix.index:
+        return location
+    if location.isdigit() and int(location) in distance_matrix.index:
+        return int(location)
+    raise ValueError(f"{location} is not a location of the plan")
+
+
+def plan_routes(requests: List[RouteRequest], reference: ReferenceData) -> List[dict]:
+    """ Plan several requests, building each distance matrix once.
+        Return the plan_route result or {"error": ...} per request, in order.
+    """
+    matrices = {}
+    results = []
+    for request in requests:
+        try:
+            results.append(plan_route(request, reference, matrices))
+        except Exception as e:
+            results.append({"error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+def _current_reference() -> ReferenceData:
+    """ Reference data of this process, worker processes have no watcher and check the files themselves """
+    if multiprocessing.parent_process() is not None:
+        reference_store.reload_if_changed()
+    return reference_store.get()
+
+
+def plan_request(request: RouteRequest) -> dict:
+    """ Executor task: plan_route on the current reference data snapshot.
+        The Timings of the plan are returned under "stats", they are recorded by the caller in the server process.
+    """
+    timings = Timings()
+    reference = _current_reference()
+    result = plan_route(request, reference, matrix_cache.for_version(reference.version), timings)
+    return {**result, "stats": timings.as_dict()}
+
+
+def replan_request(request: RouteRequest, tour: List, replan: ReplanRequest) -> dict:
+    """ Executor task: replan_route on the current reference data snapshot, reusing the matrix cache of the process """
+    timings = Timings()
+    reference = _current_reference()
+    result = replan_route(request, tour, replan, reference, matrix_cache.for_version(reference.version), timings)
+    return {**result, "stats": timings.as_dict()}
+
+
+def plan_request_profiled(request: RouteRequest) -> dict:
+    """ plan_request under the stack sampler, the collapsed stacks are returned under "profile" """
+    result, collapsed = profile_call(plan_request, request)
+    return {**result, "profile": collapsed}
+
+
+def plan_batch_chunk(requests: List[RouteRequest]) -> List[dict]:
+    """ Process pool task: plan_routes on the worker's own reference data snapshot """
+    return plan_routes(requests, _current_reference())
+
+
+def batch_chunks(requests: List[RouteRequest], workers=batch_workers) -> List[List[int]]:
+    """ Split a batch into chunks of request positions for the process pool.
+        Requests sharing a distance matrix stay in the same chunk, large groups are split so that all workers get work.
+    """
+    groups = {}
+    for i, request in enumerate(requests):
+        groups.setdefault(matrix_key(request), []).append(i)
+    chunk_size = max(1, math.ceil(len(requests) / max(workers, 1)))
+    return [positions[start:start + chunk_size] for positions in groups.values() for start in range(0, len(positions), chunk_size)]
+
+
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """ Process pool for batches, started on first use """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max(batch_workers, 1))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+class ExecutorSaturated(Exception):
+    """ All workers are busy and the queue of waiting plans is full """
+
+
+class PlanningExecutor:
+    """ Runs planning tasks on a thread or process pool with admission control.
+        At most `workers + queue_size` tasks are accepted at a time, more raise ExecutorSaturated so the caller can
+        answer 503 right away instead of queueing without bound. A task counts until it really finishes,
+        also when the caller stopped waiting for it after a timeout.
+    """
+
+    def __init__(self, kind=planning_executor, workers=planning_workers, queue_size=planning_queue_size):
+        workers = max(workers, 1)
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            if kind != "thread":
+                print("Unknown planning executor, defaulting to thread")
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="planning")
+        self.capacity = workers + max(queue_size, 0)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn, *args, timeout=None):
+        """ Run fn(*args) on the pool, raise asyncio.TimeoutError after `timeout` seconds """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise ExecutorSaturated(f"{self._in_flight} planning tasks in flight")
+            self._in_flight += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()  # only possible while still queued, a running plan finishes in the background
+            raise
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_planning_executor(request: Request) -> PlanningExecutor:
+    """ FastAPI dependency returning the app's planning executor """
+    return request.app.state.planning_executor
@@ -0,0 +1,98 @@
+import collections
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.config import profile_dir, profile_interval, profile_keep, profile_rate_limit
+
+
+class StackSampler:
+    """ Samples the Python stack of one thread every `interval` seconds from a background thread, up to the profile_call frame.
+        Stacks are counted in the collapsed format of flamegraph.pl / speedscope: "outer;...;inner count" per line.
+    """
+
+    def __init__(self, thread_id=None, interval=profile_interval):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_file = __file__
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code.co_filename != own_file:
+                # frames above profile_call belong to the executor, not to the profiled function
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_call(fn, *args, interval=profile_interval):
+    """ Run fn(*args) in the current thread while sampling its stack, return (result, collapsed stacks) """
+    sampler = StackSampler(interval=interval)
+    sampler.start()
+    try:
+        result = fn(*args)
+    finally:
+        sampler.stop()
+    return result, sampler.collapsed()
+
+
+class RateLimiter:
+    """ Allows at most `limit` events in any sliding window of `period` seconds """
+
+    def __init__(self, limit=profile_rate_limit, period=60):
+        self.limit = limit
+        self.period = period
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._events and now - self._events[0] >= self.period:
+                self._events.popleft()
+            if len(self._events) >= self.limit:
+                return False
+            self._events.append(now)
+            return True
+
+
+def save_profile(collapsed: str, directory=profile_dir, keep=profile_keep) -> str:
+    """ Store a collapsed-stack profile as <id>.collapsed in `directory`, keeping the `keep` newest ones. Return the id. """
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    with open(os.path.join(directory, f"{profile_id}.collapsed"), "w", encoding="utf-8") as f:
+        f.write(collapsed)
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith(".collapsed"))
+    for name in profiles[:max(len(profiles) - keep, 0)]:
+        os.remove(os.path.join(directory, name))
+    return profile_id
+
+
+def load_profile(profile_id, directory=profile_dir) -> Optional[str]:
+    """ Stored profile by id, None if there is none (ids are never used as paths unchecked) """
+    if not all(c.isalnum() or c == "-" for c in profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.collapsed")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
@@ -1,11 +1,18 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Literal
 
 class RouteRequest(BaseModel):
     origin: str
     stops: List[str]
     start_time: str  # Format: "HH:MM"
     truck_model: str
+    engine: Literal["greedy", "optimal"] = "greedy"  # greedy charging stops or optimal (label-setting) search
+    strategy: Literal["time-optimal", "cost-optimal"] = "time-optimal"
+    driver_rest: bool = False  # apply the driver break / daily rest rules
+    payload_t: Optional[float] = Field(None, ge=0)  # load in tonnes for the consumption curves, None: reference payload of the truck
+    geometry: Literal["none", "simplified", "full"] = "full"  # route points of each leg: none, Douglas-Peucker simplified or all
+    geometry_format: Literal["points", "polyline"] = "points"  # list of points or encoded polyline (precision 5)
+    simplify_tolerance_m: float = Field(25.0, ge=0)  # max distance of a dropped point from the simplified line
     
 class TruckModel(BaseModel):
     model: str
@@ -20,6 +27,7 @@ class RoutePoint(BaseModel):
     latitude: float
     longitude: float
     points: List[Any]   
+    polyline: Optional[str] = None  # encoded polyline of the leg instead of points, if requested
     action: str
     duration: int
     SOC: int
@@ -29,6 +37,57 @@ class RouteResponse(BaseModel):
     route: List[RoutePoint]  # Each dict contains time, location , lat, long, action, duration, SOC, distance
     total_distance: float  # in km
     total_duration: float  # in hours
+    plan_id: Optional[str] = None  # pass to /replan to continue this plan from the truck's current state
+
+class ReplanRequest(BaseModel):
+    plan_id: str
+    current_time: str  # Format: "HH:MM"
+    soc_kwh: float = Field(ge=0)  # current battery charge
+    location: Optional[str] = None  # current stop or charging station ID of the plan, or give latitude/longitude
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    next_stop: Optional[str] = None  # stop the truck is heading to, defaults to the stop after `location`
+
+class BatchRouteRequest(BaseModel):
+    requests: List[RouteRequest]
+
+class BatchRouteResult(BaseModel):
+    result: Optional[RouteResponse] = None
+    error: Optional[str] = None  # set instead of result if this request failed
+
+class BatchRouteResponse(BaseModel):
+    results: List[BatchRouteResult]  # in the order of the requests
+
+class FleetTruck(BaseModel):
+    truck_id: str
+    truck_model: str
+    origin: str  # depot, the truck returns there
+    start_time: str = "09:00"  # Format: "HH:MM", trucks share one time line for the chargers
+    payload_t: Optional[float] = Field(None, ge=0)
+    max_stops: Optional[int] = Field(None, ge=0)  # most stops the truck can serve, None: no limit
+    shift_hours: Optional[float] = Field(None, gt=0)  # driving and stop hours before overtime, default FLEET_SHIFT_HOURS
+
+class FleetRequest(BaseModel):
+    trucks: List[FleetTruck] = Field(min_length=1)
+    stops: List[str]  # served by exactly one truck each
+    strategy: Literal["time-optimal", "cost-optimal"] = "time-optimal"
+    time_budget_s: Optional[float] = Field(None, gt=0, le=60)  # search time for the assignment, default FLEET_TIME_BUDGET
+    geometry: Literal["none", "simplified", "full"] = "full"
+    geometry_format: Literal["points", "polyline"] = "points"
+    simplify_tolerance_m: float = Field(25.0, ge=0)
+
+class FleetTruckRoute(BaseModel):
+    truck_id: str
+    stops: List[str]  # assigned stops in visiting order
+    result: Optional[RouteResponse] = None
+    charger_wait: int = 0  # minutes spent waiting for a free charger
+    error: Optional[str] = None  # set instead of result if the route of this truck is infeasible
+
+class FleetResponse(BaseModel):
+    routes: List[FleetTruckRoute]  # in the order of the trucks
+    unassigned: List[str]  # stops no truck could take (max_stops)
+    total_distance: float  # in km, planned distance of all trucks
+    charger_wait: int  # minutes, all trucks
 
 sample_intermediate_response = {
     "route": [
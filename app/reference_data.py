@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.charge_points import CHARGE_POINTS_CSV_FILE, CHARGE_POINTS_FILE, read_charge_points
+from app.config import data_dir, distance_backend, reference_reload_interval
+from app.energy import EnergyModel
+from app.metrics import metrics
+from app.road_network import ROAD_NETWORK_FILES, RoadNetwork, load_road_network
+from app.spatial_index import StationGridIndex
+from app.station_matrix import STATION_MATRIX_FILES, StationMatrix, load_station_matrix
+from app.tariffs import STATION_TARIFF_FILE, TariffTable, load_tariffs
+
+CITY_CHOICES_FILE = "city_choices.json"
+TRUCK_SPECS_FILE = "truck_specs.json"
+OPTIONAL_FILES = (CHARGE_POINTS_CSV_FILE, CHARGE_POINTS_FILE) + STATION_MATRIX_FILES + (STATION_TARIFF_FILE,) + ROAD_NETWORK_FILES
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """ Immutable snapshot of the reference datasets used to plan a route.
+        The station columns are stored as read-only, typed NumPy arrays in the same row order as `charge_points`.
+        `charge_points` is shared between requests and must be treated as read-only.
+    """
+    city_choices: Dict[str, List[float]]
+    truck_specs: Dict[str, dict]
+    energy_models: Dict[str, EnergyModel]  # truck model -> consumption tables
+    charge_points: pd.DataFrame
+    station_ids: np.ndarray        # int64
+    station_lat: np.ndarray        # float64, degrees
+    station_lon: np.ndarray        # float64, degrees
+    station_power_kw: np.ndarray   # float64
+    station_price: np.ndarray      # float64, €/kWh
+    station_rows: Dict[int, int]   # station ID -> row
+    station_index: StationGridIndex  # spatial index over the station rows
+    station_matrix: Optional[StationMatrix]  # precomputed station x station matrices, None if not built
+    tariffs: Optional[TariffTable]  # time-of-use prices over the station rows, None: static price_€/kWh
+    road_network: Optional[RoadNetwork]  # road distances with DISTANCE_BACKEND=road, None: haversine
+    version: str                   # fingerprint of the files the snapshot was loaded from
+
+
+def _readonly(values, dtype):
+    array = np.array(values, dtype=dtype, copy=True)
+    array.setflags(write=False)
+    return array
+
+
+def station_row_index(station_ids) -> Dict[int, int]:
+    """ Station ID -> row of its first occurrence """
+    rows = {}
+    for row, station_id in enumerate(np.asarray(station_ids).tolist()):
+        rows.setdefault(station_id, row)
+    return rows
+
+
+def _file_signature(directory) -> Tuple:
+    """ (name, mtime, size) of every reference file, used to detect changes on disk.
+        The charging stations come from either charge_points.npz or combined_charge_points.csv; those and the precomputed
+        station matrix, tariff and road network files are optional and count as (name, 0, 0) while missing.
+    """
+    signature = []
+    for name in (CITY_CHOICES_FILE, TRUCK_SPECS_FILE) + OPTIONAL_FILES:
+        path = os.path.join(directory, name)
+        if name in OPTIONAL_FILES and not os.path.exists(path):
+            signature.append((name, 0, 0))
+            continue
+        stat = os.stat(path)
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def load_reference_data(directory=data_dir, signature=None) -> ReferenceData:
+    """ Read the city choices, truck specifications and charging stations from `directory` """
+    signature = signature or _file_signature(directory)
+    with open(os.path.join(directory, CITY_CHOICES_FILE), encoding="utf-8") as f:
+        city_choices = json.load(f)
+    with open(os.path.join(directory, TRUCK_SPECS_FILE), encoding="utf-8") as f:
+        truck_specs = json.load(f)
+    charge_points = read_charge_points(directory)
+    station_lat = _readonly(charge_points["latitude"], np.float64)
+    station_lon = _readonly(charge_points["longitude"], np.float64)
+    station_ids = _readonly(charge_points["ID"], np.int64)
+
+    return ReferenceData(
+        city_choices=city_choices,
+        truck_specs=truck_specs,
+        energy_models={name: EnergyModel.from_spec(spec) for name, spec in truck_specs.items()},
+        charge_points=charge_points,
+        station_ids=station_ids,
+        station_lat=station_lat,
+        station_lon=station_lon,
+        station_power_kw=_readonly(charge_points["max_power_kW"], np.float64),
+        station_price=_readonly(charge_points["price_€/kWh"], np.float64),
+        station_rows=station_row_index(station_ids),
+        station_index=StationGridIndex(station_lat, station_lon),
+        station_matrix=load_station_matrix(directory, station_ids, station_lat, station_lon),
+        tariffs=load_tariffs(directory, station_ids, charge_points["price_€/kWh"]),
+        road_network=load_road_network(directory, city_choices, station_ids, station_lat, station_lon) if distance_backend == "road" else None,
+        version="-".join(f"{mtime:x}{size:x}" for _, mtime, size in signature),
+    )
+
+
+class ReferenceDataStore:
+    """ Holds the current ReferenceData snapshot and swaps in a new one when the files change.
+        A new snapshot is fully loaded before it replaces the old one, so readers always get a complete dataset.
+    """
+
+    def __init__(self, directory=data_dir):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._data = None
+        self._signature = None
+
+    def get(self) -> ReferenceData:
+        data = self._data
+        if data is None:
+            return self.reload()
+        return data
+
+    def reload(self) -> ReferenceData:
+        with self._lock:
+            signature = _file_signature(self.directory)
+            with metrics.span("reference_load"):
+                data = load_reference_data(self.directory, signature)
+            # single reference assignment, in-flight requests keep the snapshot they already hold
+            self._data, self._signature = data, signature
+        return data
+
+    def reload_if_changed(self) -> bool:
+        """ Reload the snapshot if any reference file changed on disk, return True if it was swapped """
+        if self._data is not None and _file_signature(self.directory) == self._signature:
+            return False
+        self.reload()
+        return True
+
+
+async def watch_reference_data(store, interval=reference_reload_interval):
+    """ Background task polling the reference files and hot-reloading them when they change """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await asyncio.to_thread(store.reload_if_changed):
+                print(f"Reloaded reference data from {store.directory}")
+        except Exception as e:
+            # keep serving the previous snapshot if the new files cannot be loaded
+            print(f"Failed to reload reference data: {e}")
+
+
+reference_store = ReferenceDataStore()
+
+
+def get_reference_data() -> ReferenceData:
+    return reference_store.get()
@@ -0,0 +1,463 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.charge_points import read_charge_points
+from app.config import data_dir, road_snap_km
+from app.osm_pbf import iter_ways, node_coordinates
+from app.spatial_index import EARTH_RADIUS_KM, StationGridIndex, unit_vectors
+from app.station_matrix import average_speed_kmh
+
+ROAD_GRAPH_FILE = "road_graph.npz"
+ROAD_LOCATIONS_FILE = "road_locations.npz"
+ROAD_DISTANCE_FILE = "road_distance_km.npy"
+ROAD_TIME_FILE = "road_time_min.npy"
+ROAD_NETWORK_FILES = (ROAD_GRAPH_FILE, ROAD_LOCATIONS_FILE, ROAD_DISTANCE_FILE, ROAD_TIME_FILE)
+
+# truck speed (km/h) on the road classes kept in the network, smaller roads are reached by snapping
+truck_speed_kmh = {
+    "motorway": 80, "motorway_link": 50, "trunk": 70, "trunk_link": 50, "primary": 60, "primary_link": 40,
+    "secondary": 50, "secondary_link": 40, "tertiary": 40, "tertiary_link": 30, "unclassified": 30,
+}
+snap_speed_kmh = 30  # between a location and its nearest road node
+
+
+def _number(value) -> Optional[float]:
+    """ Leading number of a tag value like "7.5", "7.5 t" or "3.8 m", None if there is none """
+    match = re.match(r"\s*(\d+(?:[.,]\d+)?)", value or "")
+    return float(match.group(1).replace(",", ".")) if match else None
+
+
+def truck_way(tags: Dict[str, str], weight_t, height_m) -> Optional[Tuple[float, bool, bool]]:
+    """ (speed km/h, forward, backward) of a way a truck of `weight_t` and `height_m` may drive on, None otherwise """
+    speed = truck_speed_kmh.get(tags.get("highway"))
+    if speed is None:
+        return None
+    hgv = tags.get("hgv")
+    if hgv == "no" or (tags.get("access") in ("no", "private") and hgv not in ("yes", "designated")):
+        return None
+    max_weight, max_height = _number(tags.get("maxweight")), _number(tags.get("maxheight"))
+    if (max_weight is not None and max_weight < weight_t) or (max_height is not None and max_height < height_m):
+        return None
+    for key in ("maxspeed:hgv", "maxspeed"):
+        limit = _number(tags.get(key))
+        if limit:
+            speed = min(speed, limit * 1.609 if "mph" in tags[key] else limit)
+            break
+
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1") or (oneway is None and (tags["highway"] in ("motorway", "motorway_link")
+                                                              or tags.get("junction") in ("roundabout", "circular"))):
+        return speed, True, False
+    if oneway == "-1":
+        return speed, False, True
+    return speed, True, True
+
+
+def read_road_graph(source, weight_t=40, height_m=4.0):
+    """ Directed truck road graph of an .osm.pbf extract, with chains of nodes between junctions merged into one edge.
+        Return (node latitudes, node longitudes, edge tails, edge heads, edge times in minutes, edge lengths in km).
+    """
+    refs, speeds, directions = [], [], []
+    for way_refs, tags in iter_ways(source):
+        usable = truck_way(tags, weight_t, height_m)
+        if usable is not None and len(way_refs) > 1:
+            refs.append(way_refs)
+            speeds.append(usable[0])
+            directions.append(usable[1:])
+    if not refs:
+        raise ValueError(f"No truck roads found in {source}")
+    lengths = np.array([len(way_refs) for way_refs in refs])
+    way_of = np.repeat(np.arange(len(refs)), lengths)
+    all_refs = np.concatenate(refs)
+
+    node_ids, node_of = np.unique(all_refs, return_inverse=True)
+    latitude, longitude, found = node_coordinates(source, node_ids)
+    if not found[node_of].all():
+        print(f"Skipping ways with {np.count_nonzero(~found)} nodes missing from the extract")
+        complete = np.ones(len(refs), dtype=bool)
+        complete[way_of[~found[node_of]]] = False
+        keep = complete[way_of]
+        way_of, node_of = way_of[keep], node_of[keep]
+
+    # junctions: nodes shared by several way positions and the ends of every way
+    first = np.r_[True, way_of[1:] != way_of[:-1]]
+    last = np.r_[way_of[1:] != way_of[:-1], True]
+    junction = (np.bincount(node_of, minlength=len(node_ids)) > 1)[node_of] | first | last
+
+    # km between consecutive nodes, summed between junctions of the same way
+    xyz = unit_vectors(latitude[node_of], longitude[node_of])
+    chord = np.linalg.norm(np.diff(xyz, axis=0), axis=1)
+    step_km = np.r_[0, 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1))]
+    step_km[first] = 0
+    along = np.cumsum(step_km)
+    ends = np.flatnonzero(junction)
+    pairs = way_of[ends[:-1]] == way_of[ends[1:]]
+    tails, heads = node_of[ends[:-1][pairs]], node_of[ends[1:][pairs]]
+    length_km = along[ends[1:][pairs]] - along[ends[:-1][pairs]]
+    way = way_of[ends[:-1][pairs]]
+    time_min = length_km / np.asarray(speeds)[way] * 60
+    forward, backward = np.asarray(directions)[way].T
+
+    tail = np.concatenate((tails[forward], heads[backward]))
+    head = np.concatenate((heads[forward], tails[backward]))
+    time_min = np.concatenate((time_min[forward], time_min[backward]))
+    length_km = np.concatenate((length_km[forward], length_km[backward]))
+
+    # keep the junction nodes only
+    nodes, edge_nodes = np.unique(np.concatenate((tail, head)), return_inverse=True)
+    return latitude[nodes], longitude[nodes], edge_nodes[:len(tail)], edge_nodes[len(tail):], time_min, length_km
+
+
+def contract(n_nodes, tail, head, time_min, length_km, settle_limit=64):
+    """ Contraction hierarchy of a directed graph. Nodes are contracted one by one, least important first
+        (edge difference + contracted neighbours, updated lazily), adding a shortcut u -> w for every path u -> v -> w
+        through the contracted node v unless a witness search finds one at most as fast without it.
+        Return the upward edges (tail, head, time, length), which lead from a node to higher ranked ones, and the
+        downward edges reversed (from the head to the lower ranked tail), for the backward search.
+    """
+    out_edges = [dict() for _ in range(n_nodes)]
+    in_edges = [dict() for _ in range(n_nodes)]
+    for u, v, t, d in zip(tail.tolist(), head.tolist(), time_min.tolist(), length_km.tolist()):
+        if u != v and t < out_edges[u].get(v, (math.inf,))[0]:
+            out_edges[u][v] = in_edges[v][u] = (t, d)
+    contracted_neighbours = [0] * n_nodes
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    def shortcuts(v):
+        """ Shortcuts (u, w, time, length) needed if v is contracted now """
+        needed = []
+        outs = out_edges[v]
+        for u, (t_uv, d_uv) in in_edges[v].items():
+            targets = {w: t_uv + t_vw for w, (t_vw, _) in outs.items() if w != u}
+            if not targets:
+                continue
+            # witness search from u without v, until every target is settled or the paths get longer than through v
+            limit = max(targets.values())
+            remaining = len(targets)
+            best = {u: 0.0}
+            heap = [(0.0, u)]
+            settled = 0
+            while heap and settled < settle_limit:
+                t, x = heappop(heap)
+                if t > limit:
+                    break
+                if t > best[x]:
+                    continue
+                settled += 1
+                if x in targets:
+                    remaining -= 1
+                    if remaining == 0:
+                        break
+                for y, (t_xy, _) in out_edges[x].items():
+                    if y != v and t + t_xy < best.get(y, math.inf):
+                        best[y] = t + t_xy
+                        heappush(heap, (t + t_xy, y))
+            for w, through_v in targets.items():
+                if best.get(w, math.inf) > through_v:
+                    needed.append((u, w, through_v, d_uv + outs[w][1]))
+        return needed
+
+    def priority(v):
+        needed = shortcuts(v)
+        return len(needed) - len(in_edges[v]) - len(out_edges[v]) + contracted_neighbours[v], needed
+
+    queue = [(priority(v)[0], v) for v in range(n_nodes)]
+    heapq.heapify(queue)
+    up, down = [], []
+    while queue:
+        _, v = heapq.heappop(queue)
+        value, needed = priority(v)
+        if queue and value > queue[0][0]:
+            heapq.heappush(queue, (value, v))
+            continue
+        for w, (t, d) in out_edges[v].items():
+            up.append((v, w, t, d))
+            del in_edges[w][v]
+            contracted_neighbours[w] += 1
+        for u, (t, d) in in_edges[v].items():
+            down.append((v, u, t, d))
+            del out_edges[u][v]
+            contracted_neighbours[u] += 1
+        out_edges[v], in_edges[v] = {}, {}
+        for u, w, t, d in needed:
+            if t < out_edges[u].get(w, (math.inf,))[0]:
+                out_edges[u][w] = in_edges[w][u] = (t, d)
+
+    def arrays(edges):
+        edges = np.array(edges, dtype=np.float64).reshape(-1, 4)
+        return edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2], edges[:, 3]
+    return arrays(up), arrays(down)
+
+
+def _csr(n_nodes, tail, head, time_min, length_km):
+    """ (offsets, heads, times, lengths) of the edges grouped by tail """
+    order = np.argsort(tail, kind="stable")
+    offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tail, minlength=n_nodes), out=offsets[1:])
+    return offsets, head[order], time_min[order], length_km[order]
+
+
+def build_road_graph(source, directory=data_dir, weight_t=40, height_m=4.0) -> int:
+    """ Offline step: read the truck roads of an .osm.pbf extract, contract them and store road_graph.npz.
+        This is the slow part (minutes for a country); the locations are added by build_road_locations.
+        Return the number of road nodes.
+    """
+    latitude, longitude, tail, head, time_min, length_km = read_road_graph(source, weight_t, height_m)
+    n_nodes = len(latitude)
+    up, down = contract(n_nodes, tail, head, time_min, length_km)
+    path = os.path.join(directory, ROAD_GRAPH_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, latitude=latitude, longitude=longitude,
+                 **{f"{name}_{part}": array for name, edges in (("up", up), ("down", down))
+                    for part, array in zip(("offsets", "heads", "time_min", "length_km"), _csr(n_nodes, *edges))})
+    os.replace(path + ".tmp", path)
+    return n_nodes
+
+
+class RoadGraph:
+    """ Contracted road graph loaded from road_graph.npz, with a spatial index over its nodes """
+
+    def __init__(self, arrays):
+        self.latitude = arrays["latitude"]
+        self.longitude = arrays["longitude"]
+        self.up = tuple(arrays[f"up_{part}"] for part in ("offsets", "heads", "time_min", "length_km"))
+        self.down = tuple(arrays[f"down_{part}"] for part in ("offsets", "heads", "time_min", "length_km"))
+        self.node_index = StationGridIndex(self.latitude, self.longitude, cell_deg=0.1)
+        self._xyz = unit_vectors(self.latitude, self.longitude)
+
+    def snap(self, latitude, longitude, max_km=road_snap_km) -> Tuple[int, float]:
+        """ (nearest road node, km to it) of a point, (-1, inf) if there is none within `max_km` """
+        candidates = self.node_index.query_radius([latitude], [longitude], max_km)
+        if len(candidates) == 0:
+            return -1, math.inf
+        chord = np.linalg.norm(self._xyz[candidates] - unit_vectors([latitude], [longitude]), axis=1)
+        nearest = int(np.argmin(chord))
+        return int(candidates[nearest]), float(2 * EARTH_RADIUS_KM * np.arcsin(min(chord[nearest] / 2, 1)))
+
+    @staticmethod
+    def search(edges, source) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ (nodes, minutes, km) settled by a Dijkstra search from `source` over the upward or downward edges """
+        offsets, heads, times, lengths = edges
+        best = {source: 0.0}
+        km = {source: 0.0}
+        heap = [(0.0, source)]
+        nodes, minutes, distances = [], [], []
+        while heap:
+            t, u = heapq.heappop(heap)
+            if t > best[u]:
+                continue
+            nodes.append(u)
+            minutes.append(t)
+            distances.append(km[u])
+            start, end = offsets[u], offsets[u + 1]
+            for v, t_uv, d_uv in zip(heads[start:end].tolist(), times[start:end].tolist(), lengths[start:end].tolist()):
+                if t + t_uv < best.get(v, math.inf):
+                    best[v] = t + t_uv
+                    km[v] = km[u] + d_uv
+                    heapq.heappush(heap, (t + t_uv, v))
+        return np.array(nodes, dtype=np.int64), np.array(minutes), np.array(distances)
+
+
+def _buckets(spaces):
+    """ Search spaces (nodes, minutes, km) of the locations as one array set sorted by node """
+    location = np.repeat(np.arange(len(spaces)), [len(nodes) for nodes, _, _ in spaces])
+    nodes, minutes, km = (np.concatenate([space[i] for space in spaces]) for i in range(3))
+    order = np.argsort(nodes, kind="stable")
+    return nodes[order], location[order], minutes[order], km[order]
+
+
+def _join(space, buckets, n_locations) -> Tuple[np.ndarray, np.ndarray]:
+    """ (minutes, km) of the fastest path through a meeting node from one search space to every location, inf if none """
+    nodes, minutes, km = space
+    bucket_nodes, bucket_location, bucket_minutes, bucket_km = buckets
+    starts = np.searchsorted(bucket_nodes, nodes, side="left")
+    counts = np.searchsorted(bucket_nodes, nodes, side="right") - starts
+    entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    total = np.repeat(minutes, counts) + bucket_minutes[entries]
+    location = bucket_location[entries]
+    best_minutes = np.full(n_locations, np.inf)
+    np.minimum.at(best_minutes, location, total)
+    # km of a fastest meeting node per location
+    fastest = total == best_minutes[location]
+    best_km = np.full(n_locations, np.inf)
+    best_km[location[fastest]] = np.repeat(km, counts)[fastest] + bucket_km[entries[fastest]]
+    return best_minutes, best_km
+
+
+def _fallback_km(latitude, longitude, to_latitude, to_longitude) -> np.ndarray:
+    """ Haversine km between a point and every location, used off the road network """
+    chord = np.linalg.norm(unit_vectors(to_latitude, to_longitude) - unit_vectors([latitude], [longitude]), axis=1)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1))
+
+
+def build_road_locations(directory=data_dir, dtype=np.float64, max_snap_km=road_snap_km) -> int:
+    """ Offline step: snap the cities and charging stations to road_graph.npz and compute their road distance and
+        time matrices (road_distance_km.npy, road_time_min.npy) by many-to-many queries on the hierarchy, plus the
+        search spaces of every location for queries from other points. Pairs without a road path, e.g. locations
+        farther than `max_snap_km` from a road, keep the haversine distance. Return the number of locations.
+    """
+    with open(os.path.join(directory, "city_choices.json"), encoding="utf-8") as f:
+        city_choices = json.load(f)
+    charge_points = read_charge_points(directory, ["ID", "latitude", "longitude"])
+    with np.load(os.path.join(directory, ROAD_GRAPH_FILE)) as arrays:
+        graph = RoadGraph(arrays)
+
+    cities = list(city_choices)
+    latitude = np.concatenate(([city_choices[city][0] for city in cities], charge_points["latitude"].to_numpy(dtype=np.float64)))
+    longitude = np.concatenate(([city_choices[city][1] for city in cities], charge_points["longitude"].to_numpy(dtype=np.float64)))
+    n = len(latitude)
+    snapped = [graph.snap(lat, lon, max_snap_km) for lat, lon in zip(latitude, longitude)]
+    nodes = np.array([node for node, _ in snapped], dtype=np.int64)
+    snap_km = np.array([km if node >= 0 else 0.0 for node, km in snapped])
+
+    empty = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    forward = [graph.search(graph.up, int(node)) if node >= 0 else empty for node in nodes]
+    backward = [graph.search(graph.down, int(node)) if node >= 0 else empty for node in nodes]
+    to_buckets = _buckets(backward)
+
+    paths = {name: os.path.join(directory, name) for name in ROAD_NETWORK_FILES}
+    distance = np.lib.format.open_memmap(paths[ROAD_DISTANCE_FILE] + ".tmp", mode="w+", dtype=dtype, shape=(n, n))
+    travel_time = np.lib.format.open_memmap(paths[ROAD_TIME_FILE] + ".tmp", mode="w+", dtype=dtype, shape=(n, n))
+    for i in range(n):
+        minutes, km = _join(forward[i], to_buckets, n)
+        minutes += (snap_km[i] + snap_km) / snap_speed_kmh * 60
+        km += snap_km[i] + snap_km
+        off_road = ~np.isfinite(km)
+        km[off_road] = _fallback_km(latitude[i], longitude[i], latitude[off_road], longitude[off_road])
+        minutes[off_road] = km[off_road] / average_speed_kmh * 60
+        km[i] = minutes[i] = 0
+        distance[i] = km
+        travel_time[i] = minutes
+    distance.flush()
+    travel_time.flush()
+    del distance, travel_time
+
+    from_buckets = _buckets(forward)
+    with open(paths[ROAD_LOCATIONS_FILE] + ".tmp", "wb") as f:
+        np.savez(f, cities=np.array(cities), station_ids=charge_points["ID"].to_numpy(dtype=np.int64), latitude=latitude, longitude=longitude,
+                 snap_km=snap_km, **{f"to_{i}": array for i, array in enumerate(to_buckets)}, **{f"from_{i}": array for i, array in enumerate(from_buckets)})
+    for name in (ROAD_LOCATIONS_FILE, ROAD_DISTANCE_FILE, ROAD_TIME_FILE):
+        os.replace(paths[name] + ".tmp", paths[name])
+    return n
+
+
+@dataclass(frozen=True)
+class RoadNetwork:
+    """ Road distances (km) and truck travel times (minutes) between the cities and charging stations, precomputed
+        from an OSM extract and memory-mapped read-only, with the contracted graph for queries from other points.
+        Locations are the cities in city_choices.json order followed by the stations in charge point table order.
+    """
+    city_positions: Dict[str, int]
+    station_ids: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    snap_km: np.ndarray
+    distance_km: np.ndarray  # (n, n) memmap, row: from, column: to
+    time_min: np.ndarray     # (n, n) memmap
+    graph: RoadGraph
+    to_buckets: tuple        # backward search spaces of the locations
+    from_buckets: tuple      # forward search spaces of the locations
+    _sorter: np.ndarray
+
+    def positions(self, cities, station_ids) -> np.ndarray:
+        """ Positions of the given cities followed by the given station IDs """
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        found = self._sorter[np.searchsorted(self.station_ids, station_ids, sorter=self._sorter)]
+        return np.concatenate(([self.city_positions[city] for city in cities], len(self.city_positions) + found)).astype(np.int64)
+
+    def submatrix(self, positions, dtype=np.float64, times=False) -> np.ndarray:
+        """ Road distances, or truck travel times if `times`, between the locations at `positions` """
+        matrix = self.time_min if times else self.distance_km
+        return np.asarray(matrix[np.ix_(positions, positions)], dtype=dtype)
+
+    def point_distances(self, latitude, longitude, positions) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Road km and truck minutes from a point to the locations at `positions` and from them to the point, e.g. the
+            current position of a truck, by one forward and one backward search on the hierarchy
+            Return (km to, km from, minutes to, minutes from).
+        """
+        node, snap_km = self.graph.snap(latitude, longitude)
+        n = len(self.latitude)
+        if node < 0:
+            to_minutes = from_minutes = to_km = from_km = np.full(n, np.inf)
+        else:
+            to_minutes, to_km = _join(self.graph.search(self.graph.up, node), self.to_buckets, n)
+            from_minutes, from_km = _join(self.graph.search(self.graph.down, node), self.from_buckets, n)
+        kms, times = [], []
+        for km, minutes in ((to_km, to_minutes), (from_km, from_minutes)):
+            snap = snap_km + self.snap_km[positions]
+            km, minutes = km[positions] + snap, minutes[positions] + snap / snap_speed_kmh * 60
+            off_road = ~np.isfinite(km)
+            km[off_road] = _fallback_km(latitude, longitude, self.latitude[positions][off_road], self.longitude[positions][off_road])
+            minutes[off_road] = km[off_road] / average_speed_kmh * 60
+            kms.append(km)
+            times.append(minutes)
+        return kms[0], kms[1], times[0], times[1]
+
+
+def load_road_network(directory, city_choices, station_ids, latitudes, longitudes) -> Optional[RoadNetwork]:
+    """ Load the road network files if they exist and cover the given cities and stations at the same coordinates.
+        Return None otherwise, in which case haversine distances are used.
+    """
+    paths = {name: os.path.join(directory, name) for name in ROAD_NETWORK_FILES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        print("Road network not built, run `python -m app.road_network <extract.osm.pbf>`; using haversine distances")
+        return None
+    with np.load(paths[ROAD_LOCATIONS_FILE]) as locations:
+        locations = dict(locations)
+    city_positions = {city: i for i, city in enumerate(locations["cities"].tolist())}
+    network_ids = locations["station_ids"]
+    sorter = np.argsort(network_ids, kind="stable")
+
+    station_ids = np.asarray(station_ids, dtype=np.int64)
+    stale = any(city not in city_positions or (locations["latitude"][city_positions[city]], locations["longitude"][city_positions[city]]) != tuple(point)
+                for city, point in city_choices.items())
+    if len(network_ids) and not stale:
+        found = sorter[np.minimum(np.searchsorted(network_ids, station_ids, sorter=sorter), len(network_ids) - 1)]
+        rows = len(city_positions) + found
+        stale = not (np.array_equal(network_ids[found], station_ids)
+                     and np.array_equal(locations["latitude"][rows], latitudes)
+                     and np.array_equal(locations["longitude"][rows], longitudes))
+    elif len(station_ids):
+        stale = True
+    if stale:
+        print("Road network locations are stale, rebuild them with `python -m app.road_network`; using haversine distances")
+        return None
+
+    with np.load(paths[ROAD_GRAPH_FILE]) as arrays:
+        graph = RoadGraph(arrays)
+    return RoadNetwork(
+        city_positions=city_positions,
+        station_ids=network_ids,
+        latitude=locations["latitude"],
+        longitude=locations["longitude"],
+        snap_km=locations["snap_km"],
+        distance_km=np.load(paths[ROAD_DISTANCE_FILE], mmap_mode="r"),
+        time_min=np.load(paths[ROAD_TIME_FILE], mmap_mode="r"),
+        graph=graph,
+        to_buckets=tuple(locations[f"to_{i}"] for i in range(4)),
+        from_buckets=tuple(locations[f"from_{i}"] for i in range(4)),
+        _sorter=sorter,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the truck road network used by DISTANCE_BACKEND=road from an OSM extract")
+    parser.add_argument("source", nargs="?", help=".osm.pbf extract; without it only the city and station locations are recomputed")
+    parser.add_argument("--data-dir", default=data_dir)
+    parser.add_argument("--weight-t", type=float, default=40, help="roads with a lower maxweight are left out")
+    parser.add_argument("--height-m", type=float, default=4.0, help="roads with a lower maxheight are left out")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="float32 halves the size of the location matrices")
+    args = parser.parse_args()
+    if args.source:
+        n_nodes = build_road_graph(args.source, args.data_dir, args.weight_t, args.height_m)
+        print(f"Stored the contracted road graph of {n_nodes} nodes in {args.data_dir}")
+    n = build_road_locations(args.data_dir, dtype=np.dtype(args.dtype))
+    print(f"Stored {n}x{n} road distance and time matrices in {args.data_dir}")
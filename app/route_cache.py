@@ -0,0 +1,29 @@
+from typing import List, Optional, Tuple
+
+from app.cache import TwoTierCache
+from app.config import (route_cache_disk_size, route_cache_path, route_cache_precision, route_cache_size,
+                        route_cache_ttl)
+
+
+def route_key(origin, destination, travel_mode, precision=route_cache_precision) -> str:
+    """ Cache key of a leg: origin and destination ("lat,lon" strings) rounded to `precision` decimals and the travel mode.
+        5 decimals are about 1 m, so the same depot, charger or customer always maps to the same key.
+    """
+    coordinates = [round(float(value), precision) for point in (origin, destination) for value in str(point).split(",")]
+    return f"{travel_mode}:" + ":".join(f"{value:.{precision}f}" for value in coordinates)
+
+
+class RouteCache(TwoTierCache):
+    """ Two-tier (memory LRU + SQLite) cache of route (summary, points) by route_key """
+    table = "routes"
+
+    def __init__(self, path=route_cache_path, size=route_cache_size, disk_size=route_cache_disk_size, ttl=route_cache_ttl):
+        super().__init__(path, size, disk_size, ttl)
+
+    def get(self, key) -> Optional[Tuple[dict, List[dict]]]:
+        """ Cached (summary, points) of a leg or None """
+        value = super().get(key)
+        return None if value is None else (value[0], value[1])
+
+    def put(self, key, summary, points):
+        super().put(key, (summary, points))
@@ -0,0 +1,127 @@
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+
+from app.config import (route_url, routing_backoff, routing_max_concurrency, routing_retries,
+                        routing_timeout, tomtom_key, travel_mode)
+from app.geometry import leg_geometry
+from app.metrics import metrics
+from app.pydantic_config import RouteRequest
+from app.route_cache import RouteCache, route_key
+
+
+class RoutingError(Exception):
+    """ The routing API did not return a route after all retries """
+
+
+class RoutingClient:
+    """ Async client for the TomTom routing API sharing one connection pool for the app's lifetime.
+        Legs are fetched concurrently, at most `max_concurrency` at a time, and retried with exponential backoff
+        on transport errors, 429 and 5xx responses. Legs found in `cache` are not requested at all.
+        url: route url template with {location} and {key}, e.g. pointing to a local stand-in server in tests
+        transport: optional httpx transport, e.g. httpx.MockTransport
+    """
+
+    def __init__(self, url=route_url, key=tomtom_key, max_concurrency=routing_max_concurrency,
+                 retries=routing_retries, backoff=routing_backoff, timeout=routing_timeout, transport=None,
+                 cache: Optional[RouteCache] = None, travel_mode=travel_mode):
+        self.url = url
+        self.key = key
+        self.travel_mode = travel_mode
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            headers={"accept": "*/*", "Content-Type": "application/json"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport,
+        )
+
+    async def get_route(self, origin, destination) -> Tuple[dict, List[dict]]:
+        """ Get route summary and points between origin and destination ("lat,lon" strings) """
+        if self.cache is not None:
+            cache_key = route_key(origin, destination, self.travel_mode)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                metrics.inc("route_cache_hits")
+                return cached
+        url = self.url.format(location=f"{origin}:{destination}", key=self.key, travel_mode=self.travel_mode)
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                metrics.inc("routing_requests")
+                try:
+                    response = await self._client.get(url)
+                except httpx.TransportError as e:
+                    error = repr(e)
+                    continue
+                if response.status_code == 200:
+                    data = response.json()["routes"][0]
+                    summary, points = data["legs"][0]["summary"], data["legs"][0]["points"]
+                    if self.cache is not None:
+                        await asyncio.to_thread(self.cache.put, cache_key, summary, points)
+                    return summary, points
+                error = f"status code {response.status_code}"
+                if response.status_code != 429 and response.status_code < 500:
+                    break  # client errors are not retried
+        raise RoutingError(f"Failed to fetch route {origin} -> {destination}: {error}")
+
+    async def get_routes(self, legs: List[Tuple[str, str]]) -> List[Tuple[dict, List[dict]]]:
+        """ Fetch all (origin, destination) legs concurrently, results are in the order of `legs` """
+        return await asyncio.gather(*(self.get_route(origin, destination) for origin, destination in legs))
+
+    async def aclose(self):
+        """ Close the connection pool and the cache """
+        await self._client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def get_routing_client(request: Request) -> RoutingClient:
+    """ FastAPI dependency returning the app's shared client, override it to use a stand-in routing backend """
+    return request.app.state.routing_client
+
+
+def route_legs(route) -> List[Tuple[int, str, str]]:
+    """ (position, origin, destination) of every leg between consecutive route points at different coordinates """
+    return [(ind, f"{route[ind-1]['latitude']},{route[ind-1]['longitude']}", f"{route[ind]['latitude']},{route[ind]['longitude']}")
+            for ind in range(1, len(route))
+            if route[ind]["latitude"] != route[ind-1]["latitude"] or route[ind]["longitude"] != route[ind-1]["longitude"]]
+
+
+async def add_geometry(route, request: RouteRequest, routing_client: RoutingClient):
+    """ Fetch the road geometry of every leg of the route concurrently.
+        Fill the points of the route in place and return the total distance (km) and duration (hours).
+    """
+    legs = route_legs(route)
+    results = await routing_client.get_routes([(origin, destination) for _, origin, destination in legs])
+    total_distance = 0
+    total_duration = 0
+    for (ind, _, _), (summary, points) in zip(legs, results):
+        total_distance += summary["lengthInMeters"]
+        total_duration += summary["travelTimeInSeconds"]
+        route[ind]["points"], route[ind]["polyline"] = leg_geometry(points, request.geometry, request.geometry_format,
+                                                                   request.simplify_tolerance_m)
+    return total_distance/1000, total_duration/3600  # convert to km and hours
+
+
+async def stream_geometry(route, request: RouteRequest, routing_client: RoutingClient) -> AsyncIterator[Tuple[int, dict]]:
+    """ Like add_geometry, but yield (position, summary) for each leg as soon as it arrives, in completion order """
+    async def fetch(ind, origin, destination):
+        return ind, await routing_client.get_route(origin, destination)
+
+    tasks = [asyncio.ensure_future(fetch(*leg)) for leg in route_legs(route)]
+    try:
+        for next_leg in asyncio.as_completed(tasks):
+            ind, (summary, points) = await next_leg
+            route[ind]["points"], route[ind]["polyline"] = leg_geometry(points, request.geometry, request.geometry_format,
+                                                                       request.simplify_tolerance_m)
+            yield ind, summary
+    finally:
+        for task in tasks:
+            task.cancel()
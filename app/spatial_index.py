@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def unit_vectors(latitudes, longitudes):
+    """ (n, 3) cartesian coordinates of the points on the unit sphere """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+class StationGridIndex:
+    """ Spatial index over the charging stations, built once per reference data snapshot.
+        Stations are bucketed into a uniform latitude/longitude grid and sorted by cell, so a radius query only
+        visits the rows of cells overlapping the query cap and checks the candidates exactly on the unit sphere.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_deg=0.5):
+        self.cell_deg = cell_deg
+        self.n_rows = int(math.ceil(180 / cell_deg))
+        self.n_cols = int(math.ceil(360 / cell_deg))
+        self.size = len(latitudes)
+        self._xyz = unit_vectors(latitudes, longitudes)
+
+        keys = self._row(np.asarray(latitudes, dtype=np.float64)) * self.n_cols + self._col(np.asarray(longitudes, dtype=np.float64))
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+
+    def _row(self, latitudes):
+        return np.clip(np.floor((latitudes + 90) / self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+
+    def _col(self, longitudes):
+        longitudes = (longitudes + 180) % 360
+        return np.clip(np.floor(longitudes / self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+
+    def _cell_ranges(self, lat, lon, radius_rad):
+        """ (first_key, last_key) ranges of grid cells overlapping the spherical cap around (lat, lon) """
+        dlat = math.degrees(radius_rad)
+        lat_lo, lat_hi = lat - dlat, lat + dlat
+        row_lo = int(self._row(np.float64(lat_lo)))
+        row_hi = int(self._row(np.float64(lat_hi)))
+
+        # longitude half-width of the cap, the whole circle if the cap contains a pole
+        cos_lat = math.cos(math.radians(lat))
+        if lat_lo <= -90 or lat_hi >= 90 or math.sin(radius_rad) >= cos_lat:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            dlon = math.degrees(math.asin(math.sin(radius_rad) / cos_lat))
+            col_lo = int(self._col(np.float64(lon - dlon)))
+            col_hi = int(self._col(np.float64(lon + dlon)))
+            if dlon >= 180:
+                col_ranges = [(0, self.n_cols - 1)]
+            elif col_lo <= col_hi:
+                col_ranges = [(col_lo, col_hi)]
+            else:  # cap crosses the antimeridian
+                col_ranges = [(col_lo, self.n_cols - 1), (0, col_hi)]
+
+        return [(row * self.n_cols + c_lo, row * self.n_cols + c_hi)
+                for row in range(row_lo, row_hi + 1) for c_lo, c_hi in col_ranges]
+
+    def query_radius(self, latitudes, longitudes, max_distance) -> np.ndarray:
+        """ Return the sorted row positions of all stations within `max_distance` km of any of the given points """
+        if self.size == 0:
+            return np.empty(0, dtype=np.int64)
+        radius_rad = max_distance / EARTH_RADIUS_KM
+        # two points are within the great-circle distance if their chord on the unit sphere is short enough
+        max_chord_sq = (2 * math.sin(min(radius_rad, math.pi) / 2)) ** 2
+
+        points = unit_vectors(latitudes, longitudes)
+        found = []
+        for (lat, lon), point in zip(zip(latitudes, longitudes), points):
+            slices = [self._order[np.searchsorted(self._sorted_keys, lo, side="left"):np.searchsorted(self._sorted_keys, hi, side="right")]
+                      for lo, hi in self._cell_ranges(float(lat), float(lon), radius_rad)]
+            candidates = np.concatenate(slices)
+            chord_sq = ((self._xyz[candidates] - point) ** 2).sum(axis=1)
+            found.append(candidates[chord_sq <= max_chord_sq])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
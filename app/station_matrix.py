@@ -0,0 +1,121 @@
+import argparse
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.charge_points import read_charge_points
+from app.config import data_dir
+
+STATION_DISTANCE_FILE = "station_distance_km.npy"
+STATION_TIME_FILE = "station_time_min.npy"
+STATION_MATRIX_INDEX_FILE = "station_matrix_index.npz"
+STATION_MATRIX_FILES = (STATION_DISTANCE_FILE, STATION_TIME_FILE, STATION_MATRIX_INDEX_FILE)
+
+average_speed_kmh = 80  # same assumption as the schedulers
+
+
+@dataclass(frozen=True)
+class StationMatrix:
+    """ Precomputed station x station distance and travel time matrices, memory-mapped read-only from disk.
+        Rows and columns are keyed by station ID, so every worker process shares the same pages through the page cache.
+    """
+    station_ids: np.ndarray
+    distance_km: np.ndarray  # (n, n) memmap
+    time_min: np.ndarray     # (n, n) memmap
+    _sorter: np.ndarray
+
+    def positions(self, station_ids) -> np.ndarray:
+        """ Row/column positions of the given station IDs in the matrices """
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        found = np.searchsorted(self.station_ids, station_ids, sorter=self._sorter)
+        return self._sorter[found]
+
+    def submatrix(self, positions, out, times=False) -> np.ndarray:
+        """ Copy the distances between the stations at `positions` into `out` straight from the mapped file
+            times: copy the travel times (minutes) instead
+        """
+        matrix = self.time_min if times else self.distance_km
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) and np.array_equal(positions, np.arange(positions[0], positions[0] + len(positions))):
+            # contiguous block, e.g. stations sorted spatially: plain slice of the memmap, no index arrays
+            out[...] = matrix[positions[0]:positions[0] + len(positions), positions[0]:positions[0] + len(positions)]
+        else:
+            out[...] = matrix[np.ix_(positions, positions)]
+        return out
+
+
+def build_station_matrix(directory=data_dir, dtype=np.float64, chunk_rows=1024):
+    """ Offline step: compute the full station x station haversine distance and travel time matrices
+        from the charge point table and store them as .npy files next to it.
+        Rows are written in chunks to memory-mapped files so a full matrix never has to fit in memory twice.
+    """
+    from app.Matrix_data_process import haversine_matrix
+
+    charge_points = read_charge_points(directory, ["ID", "latitude", "longitude"])
+    station_ids = charge_points["ID"].to_numpy(dtype=np.int64)
+    latitudes = charge_points["latitude"].to_numpy(dtype=np.float64)
+    longitudes = charge_points["longitude"].to_numpy(dtype=np.float64)
+    n = len(station_ids)
+
+    paths = {name: os.path.join(directory, name) for name in STATION_MATRIX_FILES}
+    distance = np.lib.format.open_memmap(paths[STATION_DISTANCE_FILE] + ".tmp", mode="w+", dtype=dtype, shape=(n, n))
+    travel_time = np.lib.format.open_memmap(paths[STATION_TIME_FILE] + ".tmp", mode="w+", dtype=dtype, shape=(n, n))
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        rows = haversine_matrix(latitudes[start:stop], longitudes[start:stop], latitudes, longitudes, dtype=dtype)
+        distance[start:stop] = rows
+        rows /= average_speed_kmh
+        rows *= 60
+        travel_time[start:stop] = rows
+    distance.flush()
+    travel_time.flush()
+    del distance, travel_time
+    with open(paths[STATION_MATRIX_INDEX_FILE] + ".tmp", "wb") as f:
+        np.savez(f, station_ids=station_ids, latitude=latitudes, longitude=longitudes)
+
+    # swap the files in place, workers that already mapped the previous files keep reading them
+    for path in paths.values():
+        os.replace(path + ".tmp", path)
+    return n
+
+
+def load_station_matrix(directory, station_ids, latitudes, longitudes):
+    """ Memory-map the precomputed matrices if they exist and cover the given stations at the same coordinates.
+        Return None otherwise, in which case distances are computed per request.
+    """
+    paths = {name: os.path.join(directory, name) for name in STATION_MATRIX_FILES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    with np.load(paths[STATION_MATRIX_INDEX_FILE]) as index:
+        matrix_ids = index["station_ids"]
+        matrix_lat = index["latitude"]
+        matrix_lon = index["longitude"]
+    if len(matrix_ids) == 0:
+        return None
+    sorter = np.argsort(matrix_ids, kind="stable")
+
+    station_ids = np.asarray(station_ids, dtype=np.int64)
+    found = np.searchsorted(matrix_ids, station_ids, sorter=sorter)
+    positions = sorter[np.minimum(found, len(matrix_ids) - 1)]
+    if not (np.array_equal(matrix_ids[positions], station_ids)
+            and np.array_equal(matrix_lat[positions], latitudes)
+            and np.array_equal(matrix_lon[positions], longitudes)):
+        print("Station matrix is stale, rebuild it with `python -m app.station_matrix`")
+        return None
+
+    return StationMatrix(
+        station_ids=matrix_ids,
+        distance_km=np.load(paths[STATION_DISTANCE_FILE], mmap_mode="r"),
+        time_min=np.load(paths[STATION_TIME_FILE], mmap_mode="r"),
+        _sorter=sorter,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the station x station distance and travel time matrices")
+    parser.add_argument("--data-dir", default=data_dir)
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="float32 halves the file size")
+    args = parser.parse_args()
+    n = build_station_matrix(args.data_dir, dtype=np.dtype(args.dtype))
+    print(f"Stored {n}x{n} station matrices in {args.data_dir}")
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import AsyncIterator, List
+
+from app.config import routing_stage_timeout
+from app.planner import batch_chunks, get_process_pool, plan_batch_chunk
+from app.pydantic_config import RouteRequest, RoutePoint
+from app.routing import RoutingClient, RoutingError, stream_geometry
+
+media_types = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def encode_event(event, data: dict, stream_format="ndjson") -> str:
+    """ One event as a line of newline-delimited JSON ({"event": ..., **data}) or as a server-sent event """
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+
+async def within(events: AsyncIterator, timeout) -> AsyncIterator:
+    """ Items of `events` until `timeout` seconds have passed, then asyncio.TimeoutError """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(anext(events), deadline - loop.time())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await events.aclose()
+
+
+def route_points(route) -> List[dict]:
+    """ RoutePoints of a planned route as JSON-ready dicts """
+    return [RoutePoint(**point).model_dump(mode="json") for point in route]
+
+
+async def stream_route(plan: dict, request: RouteRequest, routing_client: RoutingClient, stream_format="ndjson") -> AsyncIterator[str]:
+    """ Events of a planned route: a "point" per RoutePoint right away, then a "geometry" event per leg as its road
+        geometry arrives, and a final "summary" with the totals (or an "error" if the routing API failed or took
+        longer than ROUTING_STAGE_TIMEOUT for all legs)
+    """
+    route = plan["route"]
+    for ind, point in enumerate(route_points(route)):
+        yield encode_event("point", {"point": ind, **point}, stream_format)
+    if request.geometry == "none":
+        yield encode_event("summary", {"total_distance": plan["total_distance"], "total_duration": plan["total_duration"]}, stream_format)
+        return
+    total_distance = 0
+    total_duration = 0
+    try:
+        async for ind, summary in within(stream_geometry(route, request, routing_client), routing_stage_timeout):
+            total_distance += summary["lengthInMeters"]
+            total_duration += summary["travelTimeInSeconds"]
+            yield encode_event("geometry", {"point": ind, "points": route[ind]["points"], "polyline": route[ind]["polyline"]}, stream_format)
+    except RoutingError as e:
+        print(e)
+        yield encode_event("error", {"error": "Routing service unavailable"}, stream_format)
+        return
+    except asyncio.TimeoutError:
+        yield encode_event("error", {"error": "Routing service timed out"}, stream_format)
+        return
+    yield encode_event("summary", {"total_distance": total_distance/1000, "total_duration": total_duration/3600}, stream_format)
+
+
+async def stream_batch(requests: List[RouteRequest], routing_client: RoutingClient, stream_format="ndjson") -> AsyncIterator[str]:
+    """ Events of a batch, tagged with the position of the request in the batch and emitted as soon as available:
+        a "route" event per planned route (without geometry), "geometry" events per leg, and a "summary" or "error"
+        event that ends each request. The stream ends with a "done" event.
+        Every failure of a request, including a routing stage slower than ROUTING_STAGE_TIMEOUT, ends it with an "error" event.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    tasks = []
+
+    async def geometry(i, route):
+        total_distance = 0
+        total_duration = 0
+        try:
+            async for ind, summary in within(stream_geometry(route, requests[i], routing_client), routing_stage_timeout):
+                total_distance += summary["lengthInMeters"]
+                total_duration += summary["travelTimeInSeconds"]
+                await queue.put(("geometry", {"index": i, "point": ind, "points": route[ind]["points"], "polyline": route[ind]["polyline"]}))
+        except RoutingError as e:
+            await queue.put(("error", {"index": i, "error": str(e)}))
+            return
+        except asyncio.TimeoutError:
+            await queue.put(("error", {"index": i, "error": "Routing service timed out"}))
+            return
+        except Exception as e:
+            # any failure must end the request, the stream waits for one summary or error per request
+            await queue.put(("error", {"index": i, "error": f"{type(e).__name__}: {e}"}))
+            return
+        await queue.put(("summary", {"index": i, "total_distance": total_distance/1000, "total_duration": total_duration/3600}))
+
+    async def plan(chunk):
+        try:
+            results = await loop.run_in_executor(get_process_pool(), plan_batch_chunk, [requests[i] for i in chunk])
+        except Exception as e:
+            results = [{"error": f"{type(e).__name__}: {e}"}] * len(chunk)
+        for i, result in zip(chunk, results):
+            if "error" in result:
+                await queue.put(("error", {"index": i, "error": result["error"]}))
+                continue
+            try:
+                points = route_points(result["route"])
+            except Exception as e:
+                await queue.put(("error", {"index": i, "error": f"{type(e).__name__}: {e}"}))
+                continue
+            await queue.put(("route", {"index": i, "route": points}))
+            if requests[i].geometry == "none":
+                await queue.put(("summary", {"index": i, "total_distance": result["total_distance"], "total_duration": result["total_duration"]}))
+            else:
+                tasks.append(asyncio.create_task(geometry(i, result["route"])))
+
+    tasks.extend(asyncio.create_task(plan(chunk)) for chunk in batch_chunks(requests))
+    try:
+        finished = 0
+        while finished < len(requests):
+            event, data = await queue.get()
+            finished += event in ("summary", "error")
+            yield encode_event(event, data, stream_format)
+        yield encode_event("done", {}, stream_format)
+    finally:
+        # client went away or the batch is done: stop pending geometry requests
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,130 @@
+import argparse
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from app.brain import plan_start
+from app.charge_points import read_charge_points
+from app.config import data_dir
+
+STATION_TARIFF_FILE = "station_tariffs.npz"
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+@dataclass(frozen=True)
+class TariffTable:
+    """ Time-of-use charging prices (€/kWh) of stations in 15-minute slots of the day, repeated every day.
+        Rows follow the stations it was built for. Times are minutes on the plan time line (since plan_start).
+    """
+    prices: np.ndarray     # (n, SLOTS_PER_DAY) float32
+    _integral: np.ndarray  # (n, SLOTS_PER_DAY + 1) € per kWh times minutes, from midnight to the start of each slot
+
+    @classmethod
+    def from_prices(cls, prices) -> "TariffTable":
+        prices = np.asarray(prices, dtype=np.float32)
+        integral = np.zeros((len(prices), SLOTS_PER_DAY + 1))
+        np.cumsum(prices * SLOT_MINUTES, axis=1, dtype=np.float64, out=integral[:, 1:])
+        return cls(prices, integral)
+
+    def for_stations(self, station_rows, station_ids) -> "TariffTable":
+        """ Table of the given stations, e.g. the charging stations of one request; station_rows maps ID -> row """
+        rows = np.array([station_rows[station_id] for station_id in station_ids], dtype=np.intp)
+        return TariffTable(self.prices[rows], self._integral[rows])
+
+    @staticmethod
+    def _slot(minute):
+        """ (day, slot of the day, minutes into the slot) of plan minutes """
+        day, minute_of_day = np.divmod(minute + plan_start.hour * 60 + plan_start.minute, 24 * 60)
+        slot = np.minimum((minute_of_day // SLOT_MINUTES).astype(np.intp), SLOTS_PER_DAY - 1)
+        return day, slot, minute_of_day - slot * SLOT_MINUTES
+
+    def _price_minutes(self, rows, minute):
+        """ Integral of the price from midnight of the first plan day to `minute` """
+        day, slot, into_slot = self._slot(minute)
+        return day * self._integral[rows, -1] + self._integral[rows, slot] + self.prices[rows, slot] * into_slot
+
+    def average_price(self, rows, start_minute, minutes) -> np.ndarray:
+        """ Mean price of charging at constant power at the station rows from `start_minute` for `minutes`
+            (scalars or arrays, broadcast against each other), the price at the start for sessions of no length
+        """
+        rows, start_minute, minutes = np.broadcast_arrays(np.asarray(rows, dtype=np.intp), np.asarray(start_minute, dtype=np.float64),
+                                                          np.asarray(minutes, dtype=np.float64))
+        spent = self._price_minutes(rows, start_minute + minutes) - self._price_minutes(rows, start_minute)
+        at_start = self.prices[rows, self._slot(start_minute)[1]]
+        return np.where(minutes > 0, spent / np.where(minutes > 0, minutes, 1), at_start)
+
+
+def load_tariffs(directory, station_ids, static_prices):
+    """ Tariff table over the charge point rows from station_tariffs.npz, None if there is none.
+        Stations missing from the file keep their static price all day.
+    """
+    path = os.path.join(directory, STATION_TARIFF_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as tariffs:
+        tariff_ids = tariffs["station_ids"].astype(np.int64)
+        tariff_prices = tariffs["prices"]
+    if tariff_prices.shape != (len(tariff_ids), SLOTS_PER_DAY):
+        print(f"Ignoring {STATION_TARIFF_FILE}: prices must have {SLOTS_PER_DAY} slots per station")
+        return None
+    prices = np.repeat(np.asarray(static_prices, dtype=np.float32)[:, None], SLOTS_PER_DAY, axis=1)
+    sorter = np.argsort(tariff_ids, kind="stable")
+    found = np.minimum(np.searchsorted(tariff_ids, station_ids, sorter=sorter), len(tariff_ids) - 1)
+    if len(tariff_ids):
+        covered = tariff_ids[sorter[found]] == station_ids
+        prices[covered] = tariff_prices[sorter[found[covered]]]
+    return TariffTable.from_prices(prices)
+
+
+def slot_of(clock: str) -> int:
+    """ Slot of the day starting at "HH:MM", "24:00" is the end of the day """
+    hours, minutes = clock.split(":")
+    minute = int(hours) * 60 + int(minutes)
+    if minute % SLOT_MINUTES or not 0 <= minute <= 24 * 60:
+        raise ValueError(f"{clock} is not a {SLOT_MINUTES}-minute boundary of the day")
+    return minute // SLOT_MINUTES
+
+
+def build_tariffs(source, directory=data_dir) -> int:
+    """ Offline step: turn a tariff CSV into station_tariffs.npz next to the charge point table.
+        Rows: ID (station) or source (every station of that source in the charge point table), from, to ("HH:MM",
+        wrapping past midnight if to <= from) and price_€/kWh. Later rows override earlier ones, slots without a row
+        keep the static price of the station. Return the number of stations stored.
+    """
+    charge_points = read_charge_points(directory, ["ID", "price_€/kWh", "source"])
+    station_ids = charge_points["ID"].to_numpy(dtype=np.int64)
+    rows = {station_id: row for row, station_id in enumerate(station_ids.tolist())}
+    prices = np.repeat(charge_points["price_€/kWh"].to_numpy(dtype=np.float32)[:, None], SLOTS_PER_DAY, axis=1)
+    covered = np.zeros(len(station_ids), dtype=bool)
+
+    for tariff in pd.read_csv(source, dtype={"source": str}).to_dict("records"):
+        station_id = tariff.get("ID")
+        if station_id is not None and not pd.isna(station_id):
+            if int(station_id) not in rows:
+                print(f"Skipping tariff of unknown station {int(station_id)}")
+                continue
+            selected = np.array([rows[int(station_id)]])
+        else:
+            selected = np.flatnonzero(charge_points["source"].to_numpy() == tariff.get("source"))
+        first, last = slot_of(tariff["from"]), slot_of(tariff["to"])
+        slots = np.arange(first, last) if first < last else np.r_[first:SLOTS_PER_DAY, 0:last]
+        prices[np.ix_(selected, slots)] = tariff["price_€/kWh"]
+        covered[selected] = True
+
+    path = os.path.join(directory, STATION_TARIFF_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.savez_compressed(f, station_ids=station_ids[covered], prices=prices[covered])
+    os.replace(path + ".tmp", path)
+    return int(covered.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store time-of-use station tariffs as 15-minute price arrays")
+    parser.add_argument("source", help="CSV with ID or source, from, to and price_€/kWh columns")
+    parser.add_argument("--data-dir", default=data_dir)
+    args = parser.parse_args()
+    n = build_tariffs(args.source, args.data_dir)
+    print(f"Stored the tariffs of {n} stations in {os.path.join(args.data_dir, STATION_TARIFF_FILE)}")
@@ -0,0 +1,156 @@
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from app.config import held_karp_max_stops, tour_time_budget
+
+
+def held_karp(distances) -> List[int]:
+    """ Exact shortest closed tour starting and ending at node 0, O(2^n * n^2) dynamic program over subsets of stops
+        distances: (n + 1, n + 1) array, node 0 is the origin
+    """
+    n = len(distances) - 1
+    if n <= 1:
+        return list(range(1, n + 1))
+    d = np.asarray(distances, dtype=np.float64)
+    stops = d[1:, 1:]
+    full = (1 << n) - 1
+    # cost[mask, j]: shortest path from the origin visiting the stops in `mask` and ending at stop j
+    cost = np.full((1 << n, n), np.inf)
+    parent = np.full((1 << n, n), -1, dtype=np.int64)
+    for j in range(n):
+        cost[1 << j, j] = d[0, j + 1]
+    bits = 1 << np.arange(n)
+    for mask in range(1, full):
+        row = cost[mask]
+        if not np.isfinite(row).any():
+            continue
+        # best way to extend the path ending at any j in mask to every stop k
+        through = row[:, None] + stops
+        best_j = through.argmin(axis=0)
+        best = through[best_j, np.arange(n)]
+        for k in np.flatnonzero((mask & bits) == 0):
+            next_mask = mask | (1 << k)
+            if best[k] < cost[next_mask, k]:
+                cost[next_mask, k] = best[k]
+                parent[next_mask, k] = best_j[k]
+
+    last = int((cost[full] + d[1:, 0]).argmin())
+    order, mask = [], full
+    while last >= 0:
+        order.append(last + 1)
+        last, mask = int(parent[mask, last]), mask & ~(1 << last)
+    return order[::-1]
+
+
+def nearest_neighbour(distances) -> List[int]:
+    """ Greedy tour from node 0 always driving to the closest unvisited stop """
+    n = len(distances)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    order, current = [], 0
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, distances[current])
+        current = int(row.argmin())
+        visited[current] = True
+        order.append(current)
+    return order
+
+
+def tour_length(distances, order) -> float:
+    route = [0] + list(order) + [0]
+    return float(sum(distances[a, b] for a, b in zip(route, route[1:])))
+
+
+def two_opt(distances, route, deadline) -> bool:
+    """ Apply the best improving segment reversal of the closed `route` (in place), return False if there is none """
+    a, b = route[:-1], route[1:]
+    # gain of replacing edges (a_i, b_i) and (a_j, b_j) by (a_i, a_j) and (b_i, b_j), i.e. reversing b_i .. a_j
+    delta = distances[np.ix_(a, a)] + distances[np.ix_(b, b)] - distances[a, b][:, None] - distances[a, b][None, :]
+    # on directed distances the edges inside the segment are driven the other way: edges i + 1 .. j - 1
+    reversal = np.concatenate(([0.0], np.cumsum(distances[b, a] - distances[a, b])))
+    delta += reversal[None, :-1] - reversal[1:, None]
+    delta = np.triu(delta, k=2)
+    i, j = np.unravel_index(delta.argmin(), delta.shape)
+    if delta[i, j] >= -1e-9 or time.perf_counter() > deadline:
+        return False
+    route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+    return True
+
+
+def or_opt(distances, route, deadline) -> bool:
+    """ Move a segment of 1 to 3 stops (possibly reversed) to its best position in the closed `route` (in place),
+        return False if no move improves the tour
+    """
+    n = len(route)
+    for length in (1, 2, 3):
+        for start in range(1, n - length):
+            if time.perf_counter() > deadline:
+                return False
+            end = start + length - 1
+            first, last = route[start], route[end]
+            before, after = route[start - 1], route[end + 1]
+            removal_gain = distances[before, first] + distances[last, after] - distances[before, after]
+            rest = np.concatenate((route[:start], route[end + 1:]))
+            a, b = rest[:-1], rest[1:]
+            forward = distances[a, first] + distances[last, b] - distances[a, b]
+            # a reversed segment drives its inner edges the other way, which costs more or less on directed distances
+            inner = route[start:end + 1]
+            reversal = float((distances[inner[1:], inner[:-1]] - distances[inner[:-1], inner[1:]]).sum())
+            backward = distances[a, last] + distances[first, b] - distances[a, b] + reversal
+            best = int(np.minimum(forward, backward).argmin())
+            if min(forward[best], backward[best]) < removal_gain - 1e-9:
+                segment = route[start:end + 1] if forward[best] <= backward[best] else route[start:end + 1][::-1]
+                route[:] = np.concatenate((rest[:best + 1], segment, rest[best + 1:]))
+                return True
+    return False
+
+
+def local_search(distances, route, deadline):
+    """ 2-opt and Or-opt moves on the closed `route` (in place) until no move improves it or the deadline passes """
+    while two_opt(distances, route, deadline) or or_opt(distances, route, deadline):
+        pass
+    return route
+
+
+def double_bridge(route, rng):
+    """ Random double-bridge kick: cut the tour into four parts and reconnect them as A C B D """
+    i, j, k = np.sort(rng.choice(np.arange(1, len(route) - 1), size=3, replace=False))
+    return np.concatenate((route[:i], route[j:k], route[i:j], route[k:]))
+
+
+def solve_tour(distances, time_budget=tour_time_budget) -> List[int]:
+    """ Order in which to visit nodes 1..n of `distances` on a closed tour from node 0.
+        Exact Held-Karp for up to `held_karp_max_stops` stops. Otherwise nearest neighbour improved by 2-opt and
+        Or-opt moves, then iterated local search with double-bridge kicks until `time_budget` seconds have passed
+        or n kicks in a row did not improve the tour.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = len(distances) - 1
+    if n <= max(held_karp_max_stops, 3):
+        return held_karp(distances)
+
+    deadline = time.perf_counter() + time_budget
+    rng = np.random.default_rng(0)  # deterministic kicks, same request gives the same tour
+    best = local_search(distances, np.array([0] + nearest_neighbour(distances) + [0], dtype=np.intp), deadline)
+    best_length = tour_length(distances, best[1:-1])
+    failed_kicks = 0
+    while failed_kicks < n and time.perf_counter() < deadline:
+        candidate = local_search(distances, double_bridge(best, rng), deadline)
+        candidate_length = tour_length(distances, candidate[1:-1])
+        if candidate_length < best_length - 1e-9:
+            best, best_length, failed_kicks = candidate, candidate_length, 0
+        else:
+            failed_kicks += 1
+    return best[1:-1].tolist()
+
+
+def plan_tour(distance_matrix: pd.DataFrame, origin, stops: List[str], time_budget=tour_time_budget) -> List:
+    """ Shortest round trip from `origin` through all `stops` on the distance matrix, as [origin, ..., origin] """
+    locations = [origin] + list(stops)
+    positions = distance_matrix.index.get_indexer(locations)
+    distances = distance_matrix.to_numpy()[np.ix_(positions, positions)]
+    order = solve_tour(distances, time_budget)
+    return [origin] + [stops[i - 1] for i in order] + [origin]
@@ -0,0 +1,284 @@
+""" Offline benchmark of the planning pipeline on synthetic data.
+
+Times filter_stations, build_distance_matrix, plan_tour, every compute_schedule implementation, transform and the full
+/optimize-route endpoint (in-process ASGI client, stubbed routing backend) for synthetic station sets and tours,
+and reports latency percentiles, throughput and peak memory per stage.
+
+    python benchmark.py
+    python benchmark.py --stations 400,10000 --stops 1,20 --budget 1 --json results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# no result caches and no reloads while measuring, must be set before the app is imported
+os.environ.setdefault("PLAN_CACHE_SIZE", "0")
+os.environ.setdefault("ROUTE_CACHE_PATH", "")
+os.environ.setdefault("REFERENCE_RELOAD_INTERVAL", "86400")
+
+import httpx
+
+from app import brain, brain_driver_constraints, brain_optimal
+from app.Matrix_data_process import build_distance_matrix, filter_stations, transform
+from app.charge_points import ingest_charge_points, read_charge_points
+from app.reference_data import load_reference_data, reference_store
+from app.routing import RoutingClient, get_routing_client
+from app.tour import plan_tour
+
+STATION_BOX = ((44.0, 56.0), (2.0, 20.0))  # lat, lon range of the synthetic stations (central Europe)
+CITY_BOX = ((48.0, 54.0), (7.0, 14.0))     # lat, lon range of the synthetic depot and stops (Germany)
+TRUCK_MODEL = "MAN eGTX"
+
+schedulers = {
+    "compute_schedule (brain, pandas)": lambda dm, cs, o, s, t, spec, time_matrix: brain.compute_schedule(dm, cs, o, s, t, spec, time_matrix=time_matrix),
+    "compute_schedule_fast (brain)": brain.compute_schedule_fast,
+    "compute_schedule_optimal (brain_optimal)": brain_optimal.compute_schedule_optimal,
+    "compute_schedule (brain_driver_constraints)": brain_driver_constraints.compute_schedule,
+    "compute_schedule_optimal (brain_driver_constraints)": brain_driver_constraints.compute_schedule_optimal,
+}
+
+
+def write_synthetic_data(directory, n_stations, n_cities, seed=0):
+    """ Reference files with `n_stations` random charging stations and a depot plus `n_cities` random stops """
+    rng = np.random.default_rng(seed)
+    (lat_min, lat_max), (lon_min, lon_max) = STATION_BOX
+    pd.DataFrame({
+        "ID": np.arange(n_stations),
+        "latitude": rng.uniform(lat_min, lat_max, n_stations),
+        "longitude": rng.uniform(lon_min, lon_max, n_stations),
+        "max_power_kW": rng.choice([50, 150, 300, 400, 1000], n_stations),
+        "price_€/kWh": rng.choice([0.39, 0.49, 0.59, 0.64, 0.79], n_stations),
+        "source": "Synthetic",
+    }).to_csv(os.path.join(directory, "combined_charge_points.csv"), index=False)
+
+    (lat_min, lat_max), (lon_min, lon_max) = CITY_BOX
+    cities = {"Depot": [float(rng.uniform(lat_min, lat_max)), float(rng.uniform(lon_min, lon_max))]}
+    for i in range(n_cities):
+        cities[f"Stop {i + 1}"] = [float(rng.uniform(lat_min, lat_max)), float(rng.uniform(lon_min, lon_max))]
+    with open(os.path.join(directory, "city_choices.json"), "w", encoding="utf-8") as f:
+        json.dump(cities, f, ensure_ascii=False)
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "truck_specs.json"), directory)
+
+
+def measure(fn, budget, track_memory=True):
+    """ Call fn repeatedly for about `budget` seconds (at least once, at most 1000 times).
+        Return the latencies in seconds, the number of failed calls and the traced peak memory of one extra call.
+    """
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    while len(latencies) < 1000 and (not latencies or time.perf_counter() - started < budget):
+        t = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - t)
+    peak = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            fn()
+        except Exception:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return latencies, errors, peak
+
+
+def summarize(latencies, errors, peak) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "runs": len(latencies),
+        "errors": errors,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "ops_per_s": len(latencies) / (ms.sum() / 1000) if ms.sum() > 0 else float("inf"),
+        "peak_mb": None if peak is None else peak / 1e6,
+    }
+
+
+def print_row(n_stations, n_stops, stage, result, file=None):
+    if "skipped" in result:
+        print(f"{n_stations:>8} {n_stops:>5}  {stage:<52} skipped: {result['skipped']}", file=file)
+        return
+    peak = "" if result["peak_mb"] is None else f"{result['peak_mb']:9.1f}"
+    print(f"{n_stations:>8} {n_stops:>5}  {stage:<52} {result['runs']:>5} {result['errors']:>4} {result['p50_ms']:>10.2f} "
+          f"{result['p90_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['max_ms']:>10.2f} {result['ops_per_s']:>9.1f} {peak}", file=file)
+
+
+async def benchmark_endpoint(app, body, budget, concurrency):
+    """ Sequential latencies and concurrent throughput of POST /optimize-route with a stubbed routing backend """
+    def routing_stub(request):
+        return httpx.Response(200, json={"routes": [{"legs": [{
+            "summary": {"lengthInMeters": 100000, "travelTimeInSeconds": 4500},
+            "points": [{"latitude": 50.0, "longitude": 10.0}, {"latitude": 50.5, "longitude": 10.5}],
+        }]}]})
+
+    routing_client = RoutingClient(url="http://routing.invalid/{location}?key={key}", transport=httpx.MockTransport(routing_stub))
+    app.dependency_overrides[get_routing_client] = lambda: routing_client
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://benchmark", timeout=None) as client:
+                latencies, errors = [], 0
+                started = time.perf_counter()
+                while len(latencies) < 1000 and (not latencies or time.perf_counter() - started < budget):
+                    t = time.perf_counter()
+                    response = await client.post("/optimize-route", json=body)
+                    errors += response.status_code != 200
+                    latencies.append(time.perf_counter() - t)
+                result = summarize(latencies, errors, None)
+
+                t = time.perf_counter()
+                responses = await asyncio.gather(*(client.post("/optimize-route", json=body) for _ in range(concurrency)))
+                result["concurrent_requests"] = concurrency
+                result["concurrent_req_per_s"] = concurrency / (time.perf_counter() - t)
+                result["concurrent_errors"] = sum(r.status_code != 200 for r in responses)
+                return result
+    finally:
+        app.dependency_overrides.pop(get_routing_client, None)
+        await routing_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the planning pipeline on synthetic stations and tours")
+    parser.add_argument("--stations", default="400,2000,10000,100000", help="comma separated numbers of charging stations")
+    parser.add_argument("--stops", default="1,5,20,50", help="comma separated numbers of stops per tour")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds spent per stage and case")
+    parser.add_argument("--engine", default="greedy", help="planning engine of the endpoint requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests for the endpoint throughput")
+    parser.add_argument("--max-matrix-mb", type=float, default=2048, help="skip the stages after filtering above this size of the distance and time matrices")
+    parser.add_argument("--stages", default="", help="comma separated substrings, only run stages whose name contains one")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace peak memory (saves one run per stage)")
+    parser.add_argument("--verbose", action="store_true", help="show the output printed by the planning code")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    station_counts = [int(n) for n in args.stations.split(",")]
+    stop_counts = [int(n) for n in args.stops.split(",")]
+    selected = [s for s in args.stages.split(",") if s]
+    track_memory = not args.no_memory
+
+    def wanted(stage):
+        return not selected or any(s in stage for s in selected)
+
+    import app.main as api
+
+    # the table goes to stdout, the prints of the planning code are dropped unless --verbose
+    out = sys.stdout
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    results = []
+    print(f"{'stations':>8} {'stops':>5}  {'stage':<52} {'runs':>5} {'err':>4} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} "
+          f"{'max ms':>10} {'ops/s':>9} {'peak MB':>9}")
+    loop = asyncio.new_event_loop()
+    with quiet:
+        for n_stations in station_counts:
+            directory = tempfile.mkdtemp(prefix="benchmark_")
+            try:
+                write_synthetic_data(directory, n_stations, max(stop_counts))
+
+                # loading the station table from the CSV vs. the ingested, columnar charge_points.npz
+                columnar = os.path.join(directory, "columnar")
+                os.mkdir(columnar)
+                ingest_charge_points([os.path.join(directory, "combined_charge_points.csv")], columnar)
+                for stage, source in (("read_charge_points (csv)", directory), ("read_charge_points (npz)", columnar)):
+                    if wanted(stage):
+                        result = summarize(*measure(lambda: read_charge_points(source), args.budget, track_memory))
+                        result.update(stations=n_stations, stops=None, stage=stage)
+                        results.append(result)
+                        print_row(n_stations, "-", stage, result, file=out)
+
+                reference = load_reference_data(directory)
+                truck_spec = reference.truck_specs[TRUCK_MODEL]
+                for n_stops in stop_counts:
+                    origin, stops = "Depot", [f"Stop {i + 1}" for i in range(n_stops)]
+                    cities = [origin] + stops
+                    origins = [{"point": {"latitude": reference.city_choices[c][0], "longitude": reference.city_choices[c][1]}} for c in cities]
+
+                    def record(stage, result):
+                        result.update(stations=n_stations, stops=n_stops, stage=stage)
+                        results.append(result)
+                        print_row(n_stations, n_stops, stage, result, file=out)
+
+                    stage = "filter_stations"
+                    if wanted(stage):
+                        record(stage, summarize(*measure(
+                            lambda: filter_stations(origins, reference.charge_points, truck_spec["Range_80%_km"], reference.station_index),
+                            args.budget, track_memory)))
+
+                    filtered = filter_stations(origins, reference.charge_points, truck_spec["Range_80%_km"], reference.station_index)
+                    n = len(cities) + len(filtered)
+                    matrix_mb = 2 * n * n * 8 / 1e6
+                    if matrix_mb > args.max_matrix_mb:
+                        record("build_distance_matrix and later stages", {"skipped": f"{n}x{n} distance and time matrices would take {matrix_mb:,.0f} MB"})
+                        continue
+
+                    def build():
+                        return build_distance_matrix(origin, stops, reference.city_choices, reference.charge_points, truck_spec,
+                                                     station_index=reference.station_index, station_matrix=reference.station_matrix,
+                                                     road_network=reference.road_network)
+
+                    stage = "build_distance_matrix"
+                    if wanted(stage):
+                        record(stage, summarize(*measure(build, args.budget, track_memory)))
+                    distance_matrix, time_matrix, charging_stations = build()
+
+                    stage = "plan_tour"
+                    if wanted(stage):
+                        record(stage, summarize(*measure(lambda: plan_tour(distance_matrix, origin, stops), args.budget, track_memory)))
+                    tour = plan_tour(distance_matrix, origin, stops)
+
+                    for stage, scheduler in schedulers.items():
+                        if wanted(stage):
+                            record(stage, summarize(*measure(
+                                lambda: scheduler(distance_matrix, charging_stations, origin, stops, tour, truck_spec, time_matrix=time_matrix),
+                                args.budget, track_memory)))
+
+                    stage = "transform"
+                    if wanted(stage):
+                        try:
+                            plan = brain.compute_schedule_fast(distance_matrix, charging_stations, origin, stops, tour, truck_spec, time_matrix=time_matrix).plan
+                        except Exception:
+                            # the greedy schedulers strand the truck on sparse station sets, the optimal one rarely does
+                            try:
+                                plan = brain_optimal.compute_schedule_optimal(distance_matrix, charging_stations, origin, stops, tour, truck_spec,
+                                                                              time_matrix=time_matrix).plan
+                            except Exception as e:
+                                plan = None
+                                record(stage, {"skipped": f"no feasible plan ({e})"})
+                    if wanted(stage) and plan is not None:
+                        record(stage, summarize(*measure(
+                            lambda: transform(plan, reference.city_choices, reference.charge_points, reference.station_rows), args.budget, track_memory)))
+
+                    stage = "POST /optimize-route"
+                    if wanted(stage):
+                        reference_store.directory = directory
+                        body = {"origin": origin, "stops": stops, "start_time": "08:00", "truck_model": TRUCK_MODEL, "engine": args.engine}
+                        result = loop.run_until_complete(benchmark_endpoint(api.app, body, args.budget, args.concurrency))
+                        record(stage, result)
+                        print(f"{'':>16}{'':<52} {args.concurrency} concurrent: {result['concurrent_req_per_s']:.1f} req/s, "
+                              f"{result['concurrent_errors']} errors", file=out)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+    loop.close()
+
+    print(f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_runs_on_a_tiny_workload(tmp_path):
+    # own process: the benchmark sets its environment before importing the app and points the reference store at its data
+    output = tmp_path / "results.json"
+    completed = subprocess.run(
+        [sys.executable, "benchmark.py", "--stations", "500", "--stops", "2", "--budget", "0", "--no-memory", "--concurrency", "2",
+         "--json", str(output)],
+        cwd=root, capture_output=True, text=True, timeout=120,
+    )
+    assert completed.returncode == 0, completed.stderr
+
+    results = json.loads(output.read_text())
+    stages = [r["stage"] for r in results]
+    assert stages[:2] == ["read_charge_points (csv)", "read_charge_points (npz)"]
+    assert stages[2:5] == ["filter_stations", "build_distance_matrix", "plan_tour"]
+    assert {"transform", "POST /optimize-route"} <= set(stages)
+    assert sum(s.startswith("compute_schedule") for s in stages) == 5
+    for result in results:
+        assert "skipped" not in result, result
+        assert result["runs"] >= 1 and result["errors"] == 0, result
+        assert result["p50_ms"] <= result["p99_ms"] <= result["max_ms"]
+    endpoint = results[-1]
+    assert endpoint["concurrent_requests"] == 2 and endpoint["concurrent_errors"] == 0
+    assert "max RSS" in completed.stdout
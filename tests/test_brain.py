@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.brain import compute_schedule, compute_schedule_fast, station_power_and_price
+from app.brain_optimal import compute_schedule_optimal
+from app import brain_driver_constraints
+from app.config import data_dir
+from app.energy import leg_speed_kmh
+from app.Matrix_data_process import build_distance_matrix, filter_stations
+from app.reference_data import load_reference_data
+from app.tour import plan_tour
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return load_reference_data(data_dir)
+
+
+def same_step(a, b):
+    for name in a.__slots__:
+        x, y = getattr(a, name), getattr(b, name)
+        if isinstance(x, float) and math.isnan(x):
+            if not (isinstance(y, float) and math.isnan(y)):
+                return False
+        elif x != pytest.approx(y):
+            return False
+    return True
+
+
+@pytest.mark.parametrize("origin, stops, truck_model", [
+    ("Ingolstadt", ["Großbeeren"], "Mercedes eActros"),
+    ("Halle", ["Zuffenhausen"], "MAN eGTX"),
+    ("Bamberg", ["Halle", "Großbeeren", "Ingolstadt"], "MAN eGTX"),
+])
+def test_fast_scheduler_matches_baseline(reference, origin, stops, truck_model):
+    truck_spec = reference.truck_specs[truck_model]
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix(origin, stops, reference.city_choices, reference.charge_points,
+                                                                            truck_spec)
+    tour = plan_tour(distance_matrix, origin, stops)
+    baseline = compute_schedule(distance_matrix, charging_stations, origin, stops, tour, truck_spec, time_matrix=time_matrix)
+    fast = compute_schedule_fast(distance_matrix, charging_stations, origin, stops, tour, truck_spec, time_matrix=time_matrix)
+    assert len(fast.plan) == len(baseline.plan)
+    assert all(same_step(a, b) for a, b in zip(fast.plan, baseline.plan))
+    assert fast.currentTime == baseline.currentTime
+
+
+def test_legs_after_charging_start_at_the_charger(reference):
+    truck_spec = reference.truck_specs["MAN eGTX"]
+    stops = ["Zuffenhausen"]
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix("Halle", stops, reference.city_choices, reference.charge_points,
+                                                                            truck_spec)
+    np.testing.assert_allclose(time_matrix.to_numpy(), distance_matrix.to_numpy() / 80 * 60)
+    plan = compute_schedule_fast(distance_matrix, charging_stations, "Halle", stops, ["Halle", "Zuffenhausen", "Halle"], truck_spec,
+                                 time_matrix=time_matrix).plan
+    assert any(step.action == "charging" for step in plan)
+    for step in plan:
+        if step.action.startswith("drive"):
+            assert step.distance_km == pytest.approx(distance_matrix.loc[step.origin, step.to])
+            assert step.end - step.start == round(time_matrix.loc[step.origin, step.to] * 60_000_000)
+
+
+@pytest.mark.parametrize("scheduler", [compute_schedule_fast, compute_schedule_optimal])
+def test_leg_times_come_from_the_time_matrix(reference, scheduler):
+    truck_spec = reference.truck_specs["MAN eGTX"]
+    stops = ["Zuffenhausen"]
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix("Halle", stops, reference.city_choices, reference.charge_points,
+                                                                            truck_spec)
+    slow = time_matrix * 1.5  # e.g. road times at 53 km/h
+    plan = scheduler(distance_matrix, charging_stations, "Halle", stops, ["Halle", "Zuffenhausen", "Halle"], truck_spec, time_matrix=slow).plan
+    drives = [step for step in plan if step.action.startswith("drive")]
+    assert drives
+    for step in drives:
+        assert step.end - step.start == round(slow.loc[step.origin, step.to] * 60_000_000)
+
+
+@pytest.mark.parametrize("scheduler", [compute_schedule, compute_schedule_fast, compute_schedule_optimal, brain_driver_constraints.compute_schedule])
+def test_leg_energy_follows_the_leg_speed(reference, scheduler):
+    truck_spec = reference.truck_specs["MAN eGTX"]
+    model = reference.energy_models["MAN eGTX"].for_payload(30)
+    stops = ["Zuffenhausen"]
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix("Halle", stops, reference.city_choices, reference.charge_points,
+                                                                            truck_spec)
+    slow = time_matrix * 1.5  # e.g. road times at 53 km/h, below the planning speed a truck uses less energy per km
+    plan = scheduler(distance_matrix, charging_stations, "Halle", stops, ["Halle", "Zuffenhausen", "Halle"], truck_spec, energy_model=model,
+                     time_matrix=slow).plan
+    drives = [(before, step) for before, step in zip(plan, plan[1:]) if step.action in ("drive_to_charger", "drive_to_load/unload")]
+    assert any(step.action == "drive_to_charger" for _, step in drives)
+    for before, step in drives:
+        km, minutes = distance_matrix.loc[step.origin, step.to], slow.loc[step.origin, step.to]
+        assert before.SOC_kWh - step.SOC_kWh == pytest.approx(model.energy(km, leg_speed_kmh(km, minutes)))
+        assert before.SOC_kWh - step.SOC_kWh < km * model.kwh_per_km()
+
+
+def test_filtered_stations_keep_their_rows(reference):
+    origins = [{"point": {"latitude": 50.0, "longitude": 10.0}}]
+    stations = filter_stations(origins, reference.charge_points, 150, reference.station_index)
+    assert len(stations) > 0
+    np.testing.assert_array_equal(stations["ID"], reference.station_ids[stations.index])
+    power_kw, price = station_power_and_price(stations, reference.station_power_kw, reference.station_price)
+    np.testing.assert_array_equal(power_kw, stations["max_power_kW"])
+    np.testing.assert_array_equal(price, stations["price_€/kWh"])
+
+
+@pytest.mark.parametrize("scheduler", [compute_schedule_fast, compute_schedule_optimal])
+@pytest.mark.parametrize("strategy", ["time-optimal", "cost-optimal"])
+def test_reference_station_arrays_give_the_same_plan(reference, scheduler, strategy):
+    truck_spec = reference.truck_specs["MAN eGTX"]
+    stops = ["Zuffenhausen"]
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix("Halle", stops, reference.city_choices, reference.charge_points,
+                                                                            truck_spec, station_index=reference.station_index)
+    tour = ["Halle", "Zuffenhausen", "Halle"]
+    columns = scheduler(distance_matrix, charging_stations, "Halle", stops, tour, truck_spec, strategy=strategy)
+    arrays = scheduler(distance_matrix, charging_stations, "Halle", stops, tour, truck_spec, strategy=strategy,
+                       station_power_kw=reference.station_power_kw, station_price=reference.station_price)
+    assert any(step.action == "charging" for step in arrays.plan)
+    assert len(arrays.plan) == len(columns.plan)
+    assert all(same_step(a, b) for a, b in zip(arrays.plan, columns.plan))
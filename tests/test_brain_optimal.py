@@ -0,0 +1,111 @@
+import itertools
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.brain import compute_schedule_fast, driving_cost_per_km
+from app.brain_optimal import average_speed_kmh, compute_schedule_optimal, search_charging_plan
+from app.energy import EnergyModel, leg_speed_kmh
+
+truck_spec = {"Battery_capacity_kWh": 600, "Battery_capacity_80%_kWh": 480, "Consumption_kWh_per_km": 1.2}
+
+
+def objective(segments, strategy):
+    if strategy == "cost-optimal":
+        return sum(segment["cost_€"] for segment in segments)
+    return sum(segment["minutes"] for segment in segments)
+
+
+def brute_force(distances, stations, power_kw, price, source, dest, soc, capacity, battery_min, energies, strategy, times=None):
+    """ Best plan over every sequence of up to 4 stations, charging nothing, just enough or to capacity at each
+        energies: kWh of every leg
+    """
+    times = distances / average_speed_kmh * 60 if times is None else times
+
+    def step_objective(u, v, charged, k):
+        if strategy == "cost-optimal":
+            return distances[u, v] * driving_cost_per_km + (charged * price[k] if k is not None else 0)
+        return times[u, v] + (charged / power_kw[k] * 60 if k is not None else 0)
+
+    def best_from(path, i, soc):
+        if i == len(path) - 1:
+            return 0.0
+        u, v = path[i], path[i + 1]
+        energy = energies[u, v]
+        reserve = battery_min if v == dest else 0.0
+        k = stations.index(u) if u in stations else None
+        options = [soc] + ([reserve + energy, capacity] if k is not None else [])
+        best = math.inf
+        for charged in options:
+            if charged < soc or charged > capacity or charged - energy < reserve - 1e-9:
+                continue
+            best = min(best, step_objective(u, v, charged - soc, k) + best_from(path, i + 1, charged - energy))
+        return best
+
+    # stations may be visited again, topping up on the way back can beat the 80% cap
+    return min(best_from([source, *sequence, dest], 0, soc)
+               for r in range(5) for sequence in itertools.product(stations, repeat=r)
+               if all(a != b for a, b in zip(sequence, sequence[1:])))
+
+
+@pytest.mark.parametrize("leg_speeds", [False, True])
+@pytest.mark.parametrize("strategy", ["time-optimal", "cost-optimal"])
+def test_search_matches_brute_force(strategy, leg_speeds):
+    rng = np.random.default_rng(1)
+    model = EnergyModel.from_spec(truck_spec)
+    feasible = 0
+    for _ in range(30):
+        # destination beyond the range of a full battery, stations scattered along the corridor
+        length = rng.uniform(450, 700)
+        points = np.column_stack((rng.uniform(-50, length + 50, 7), rng.uniform(-80, 80, 7)))
+        points[0], points[1] = (0, 0), (length, 0)
+        distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+        stations = [2, 3, 4, 5, 6]
+        power_kw = rng.choice([50.0, 150.0, 350.0], len(stations))
+        price = rng.uniform(0.3, 0.8, len(stations))
+        start_soc = rng.uniform(200, 480)
+        # every road at its own average speed both ways, the energy of a leg depends on it
+        times = None
+        if leg_speeds:
+            speeds = rng.uniform(40, 100, distances.shape)
+            times = distances / (speeds + speeds.T) * 120
+            for k in range(len(times)):  # fastest paths, like road times
+                times = np.minimum(times, times[:, k, None] + times[None, k, :])
+        energies = distances * 1.2 if times is None else model.energy(distances, leg_speed_kmh(distances, times))
+        expected = brute_force(distances, stations, power_kw, price, 0, 1, start_soc, 480, 60, energies, strategy, times)
+        try:
+            segments = search_charging_plan(distances, {"A": 0, "B": 1}, stations, power_kw, price, ["A", "B"], start_soc,
+                                            480, 60, strategy=strategy, energy_model=model, times=times)
+        except Exception:
+            assert math.isinf(expected)
+            continue
+        assert objective(segments, strategy) == pytest.approx(expected)
+        feasible += 1
+    assert feasible >= 10
+
+
+def line_instance():
+    """ Origin, stop 500 km away and one charger half way """
+    labels = ["A", "B", 7]
+    positions = np.array([0.0, 500.0, 250.0])
+    matrix = pd.DataFrame(np.abs(positions[:, None] - positions[None, :]), index=labels, columns=labels)
+    stations = pd.DataFrame({"ID": [7], "max_power_kW": [150.0], "price_€/kWh": [0.6]})
+    return matrix, stations
+
+
+def test_charges_just_enough():
+    matrix, stations = line_instance()
+    state = compute_schedule_optimal(matrix, stations, "A", ["B"], ["A", "B"], truck_spec, start_soc=480)
+    assert [step.action for step in state.plan] == ["Start", "drive_to_charger", "charging", "drive_to_load/unload"]
+    # 250 km to go and 60 kWh left at the stop
+    assert state.plan[2].SOC_kWh == pytest.approx(250 * 1.2 + 60)
+    assert state.plan[-1].SOC_kWh == pytest.approx(60)
+
+
+def test_not_slower_than_greedy():
+    matrix, stations = line_instance()
+    greedy = compute_schedule_fast(matrix, stations, "A", ["B"], ["A", "B"], truck_spec, start_soc=480)
+    optimal = compute_schedule_optimal(matrix, stations, "A", ["B"], ["A", "B"], truck_spec, start_soc=480)
+    assert optimal.currentTime <= greedy.currentTime
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from app.charge_points import CHARGE_POINTS_FILE, hilbert_order, ingest_charge_points, read_charge_points
+
+
+def test_hilbert_order_keeps_neighbours_together():
+    # 4 x 4 grid visited along the curve: consecutive points are always adjacent cells
+    side = 4
+    y, x = np.divmod(np.arange(side * side), side)
+    order = hilbert_order(-90 + (y + 0.5) * 180 / side, -180 + (x + 0.5) * 360 / side, bits=2)
+    steps = np.abs(np.diff(x[order])) + np.abs(np.diff(y[order]))
+    assert sorted(order.tolist()) == list(range(16))
+    assert (steps == 1).all()
+
+
+def test_ingest_registry_dump(tmp_path):
+    (tmp_path / "registry.csv").write_text(
+        "ID,Breitengrad,Längengrad,Nennleistung Ladeeinrichtung [kW],Price,Betreiber,Anzahl Ladepunkte\n"
+        + "\n".join([
+            '1,"50,1","10,2",150 kW,"0,64 €",Ionity,2',
+            '2,"50,1","10,2",300 kW,"0,70 €",Ionity,4',   # same location as 1, merged
+            '3,52.5,13.4,50,0.5,,',                     # no operator: default source
+            '3,52.5,13.4,50,0.5,,',                     # repeated ID
+            '4,0,0,150,0.5,Ionity,1',                   # null island
+            '5,48.1,11.5,0,0.5,Ionity,1',               # no power
+            '6,48.2,11.6,150,,Ionity,1',                # no price
+            '7.5,48.3,11.7,150,0.5,Ionity,1',           # not an ID
+        ]) + "\n", encoding="utf-8")
+    assert ingest_charge_points([tmp_path / "registry.csv"], tmp_path, source_name="Public") == 2
+
+    stations = read_charge_points(tmp_path).set_index("ID")
+    assert list(stations.columns) == ["latitude", "longitude", "max_power_kW", "price_€/kWh", "source", "chargers"]
+    assert stations.loc[2].tolist() == [50.1, 10.2, 300.0, 0.7, "Ionity", 6.0]
+    assert stations.loc[3, "source"] == "Public" and np.isnan(stations.loc[3, "chargers"])
+    with np.load(tmp_path / CHARGE_POINTS_FILE) as table:
+        assert table["ID"].dtype == np.int64 and table["source"].dtype == np.int16
+
+    # only the requested columns are read
+    assert list(read_charge_points(tmp_path, ["ID", "latitude"]).columns) == ["ID", "latitude"]
+
+
+def test_default_price_and_numbering(tmp_path):
+    pd.DataFrame({"lat": [50.0, 51.0], "lon": [10.0, 11.0], "power_kw": [150, 50], "price": ["", "0.4"]}).to_csv(tmp_path / "raw.csv", index=False)
+    assert ingest_charge_points([tmp_path / "raw.csv"], tmp_path, default_price=0.55) == 2
+    stations = read_charge_points(tmp_path)
+    assert sorted(stations["ID"].tolist()) == [0, 1]
+    assert sorted(stations["price_€/kWh"].tolist()) == [0.4, 0.55]
+
+
+def test_csv_fallback(tmp_path):
+    pd.DataFrame({"ID": [1], "latitude": [50.0], "longitude": [10.0], "max_power_kW": [150], "price_€/kWh": [0.6],
+                  "source": ["Public"]}).to_csv(tmp_path / "combined_charge_points.csv", index=False)
+    assert read_charge_points(tmp_path, ["ID", "source"]).to_dict("records") == [{"ID": 1, "source": "Public"}]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from app.brain import consumption_of
+from app.energy import EnergyModel, default_table, leg_speed_kmh, payload_grid_t, reference_payload_t, reference_speed_kmh, speed_grid_kmh
+
+
+def test_default_curves_pass_through_the_spec_consumption():
+    model = EnergyModel.from_spec({"Consumption_kWh_per_km": 1.3})
+    assert model.kwh_per_km() == pytest.approx(1.3)
+    assert model.kwh_per_km(reference_speed_kmh, reference_payload_t) == pytest.approx(1.3)
+    assert consumption_of({"Consumption_kWh_per_km": 1.3}) == pytest.approx(1.3)
+    assert consumption_of({}) == pytest.approx(1.2)
+
+
+def test_consumption_grows_with_payload():
+    model = EnergyModel.from_spec({"Consumption_kWh_per_km": 1.2})
+    consumption = model.kwh_per_km(80, payload_grid_t)
+    assert (np.diff(consumption) > 0).all()
+    assert model.for_payload(40).kwh_per_km() > model.kwh_per_km() > model.for_payload(0).kwh_per_km()
+    assert model.for_payload(None) is model
+
+
+def test_bilinear_interpolation_of_a_table():
+    spec = {"Consumption_table": {"payload_t": [0, 10], "speed_kmh": [60, 100], "kWh_per_km": [[1.0, 2.0], [3.0, 4.0]]}}
+    model = EnergyModel.from_spec(spec)
+    assert model.kwh_per_km(60, 0) == pytest.approx(1.0)
+    assert model.kwh_per_km(100, 10) == pytest.approx(4.0)
+    assert model.kwh_per_km(80, 5) == pytest.approx(2.5)
+    assert model.kwh_per_km(70, 10) == pytest.approx(3.25)
+    # clamped outside the grid
+    assert model.kwh_per_km(200, 50) == pytest.approx(4.0)
+    assert model.kwh_per_km(10, -5) == pytest.approx(1.0)
+    np.testing.assert_allclose(model.kwh_per_km(np.array([60, 100]), 0), [1.0, 2.0])
+
+
+def test_grid_nodes_are_exact():
+    table = default_table(1.2)
+    model = EnergyModel(payload_grid_t, speed_grid_kmh, table)
+    payload, speed = np.meshgrid(payload_grid_t, speed_grid_kmh, indexing="ij")
+    np.testing.assert_allclose(model.kwh_per_km(speed, payload), table)
+
+
+def test_energy_of_legs_at_their_speeds():
+    model = EnergyModel.from_spec({"Consumption_kWh_per_km": 1.2}).for_payload(30)
+    distances = np.array([100.0, 50.0, 0.0, 80.0])
+    speeds = leg_speed_kmh(distances, np.array([75.0, 60.0, 0.0, 0.0]))
+    # legs without a duration are driven at the reference speed
+    np.testing.assert_allclose(speeds, [80, 50, reference_speed_kmh, reference_speed_kmh])
+    np.testing.assert_allclose(model.energy(distances, speeds), distances * model.kwh_per_km(speeds))
+    assert model.energy(100.0) == pytest.approx(100 * model.kwh_per_km())
+    assert model.energy(100.0, 60, payload_t=0) == pytest.approx(100 * model.kwh_per_km(60, 0))
+    # the lowest consumption over a speed range bounds every leg driven in it
+    lowest = model.min_kwh_per_km(50, 90)
+    assert lowest <= model.kwh_per_km(np.linspace(50, 90, 401)).min() + 1e-12
+    assert lowest == pytest.approx(model.kwh_per_km(np.linspace(50, 90, 401)).min(), rel=1e-3)
+    assert model.min_kwh_per_km(80, 80) == pytest.approx(model.kwh_per_km())
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from app.brain import ticks
+from app.chargers import ChargerSlots
+from app.fleet import Assignment, FleetProblem, solve_assignment
+from app.tour import held_karp, tour_length
+
+
+def test_charger_slots_fill_and_roll_back():
+    slots = ChargerSlots([10, 20], [2, 1], slot_minutes=15)
+    row = slots.rows_of([20])
+    # free: charging starts on arrival, also off the slot grid
+    assert slots.earliest_start(row, [ticks(5)], [ticks(30)]).tolist() == [ticks(5)]
+    checkpoint = slots.checkpoint()
+    slots.reserve(row[0], ticks(5), ticks(30))  # slots 0..2
+    assert slots.earliest_start(row, [ticks(10)], [ticks(15)]).tolist() == [ticks(45)]
+    # the station with two chargers still has one free
+    slots.reserve(slots.rows_of([10])[0], 0, ticks(60))
+    assert slots.earliest_start(slots.rows_of([10]), [0], [ticks(60)]).tolist() == [0]
+    slots.rollback(checkpoint)
+    assert slots.occupancy.sum() == 0
+    assert slots.earliest_start(row, [ticks(10)], [ticks(15)]).tolist() == [ticks(10)]
+
+
+def test_charger_slots_grow_beyond_the_horizon():
+    slots = ChargerSlots([1], [1], slot_minutes=60, horizon_hours=2)
+    slots.reserve(0, 0, ticks(120))
+    assert slots.earliest_start([0], [0], [ticks(240)]).tolist() == [ticks(120)]
+
+
+def problem(n_stops, n_trucks, seed=0, max_stops=None, shift_hours=100.0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 300, (n_stops + n_trucks, 2))
+    distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    return FleetProblem(stops=[f"S{i}" for i in range(n_stops)], distances=distances,
+                        depots=np.arange(n_stops, n_stops + n_trucks),
+                        max_stops=np.full(n_trucks, n_stops if max_stops is None else max_stops),
+                        shift_hours=np.full(n_trucks, shift_hours))
+
+
+def test_every_stop_is_served_once():
+    fleet = problem(20, 3)
+    objective, routes, unassigned = solve_assignment(fleet, time_budget=0.5)
+    assert unassigned == []
+    assert sorted(stop for route in routes for stop in route) == list(range(20))
+    assert objective == pytest.approx(Assignment(fleet, routes).objective())
+
+
+def test_max_stops_leaves_stops_over():
+    _, routes, unassigned = solve_assignment(problem(10, 2, max_stops=3), time_budget=0.2)
+    assert all(len(route) <= 3 for route in routes)
+    assert len(unassigned) == 4
+
+
+def test_single_truck_gets_the_shortest_tour():
+    fleet = problem(7, 1, seed=3)
+    objective, routes, _ = solve_assignment(fleet, time_budget=0.5)
+    nodes = [fleet.depots[0]] + list(range(7))
+    distances = fleet.distances[np.ix_(nodes, nodes)]
+    assert objective == pytest.approx(tour_length(distances, held_karp(distances)))
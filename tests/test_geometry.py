@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.geometry import decode_polyline, encode_polyline, leg_geometry, simplify
+
+
+def test_polyline_matches_reference_vector():
+    # example of the Google polyline algorithm documentation
+    latitudes, longitudes = [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]
+    assert encode_polyline(latitudes, longitudes) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    np.testing.assert_allclose(decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@"), np.column_stack((latitudes, longitudes)))
+
+
+def test_polyline_round_trip():
+    rng = np.random.default_rng(0)
+    latitudes, longitudes = rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)
+    decoded = decode_polyline(encode_polyline(latitudes, longitudes))
+    np.testing.assert_allclose(decoded, np.column_stack((latitudes, longitudes)), atol=0.5e-5)
+    assert encode_polyline([], []) == ""
+
+
+def test_simplify_keeps_points_within_tolerance():
+    # wiggly line of about 11 km along a parallel
+    longitudes = np.linspace(10, 10.15, 1000)
+    latitudes = 50 + 0.0005 * np.sin(np.linspace(0, 40, 1000))
+    kept = simplify(latitudes, longitudes, 25)
+    assert kept[0] == 0 and kept[-1] == 999 and len(kept) < 1000
+    # distance of every point to the simplified line, interpolated along the longitude
+    error_deg = np.abs(latitudes - np.interp(longitudes, longitudes[kept], latitudes[kept]))
+    assert (error_deg * 6_371_000 * np.pi / 180).max() <= 25
+    assert len(simplify(latitudes, longitudes, 0)) == 1000
+
+
+def test_leg_geometry_options():
+    points = [{"latitude": 50.0 + i * 1e-3, "longitude": 10.0} for i in range(10)]
+    assert leg_geometry(points, "full", "points") == (points, None)
+    assert leg_geometry(points, "none", "points") == ([], None)
+    assert leg_geometry(points, "simplified", "points") == ([points[0], points[-1]], None)
+    _, polyline = leg_geometry(points, "simplified", "polyline")
+    np.testing.assert_allclose(decode_polyline(polyline), [[50.0, 10.0], [50.009, 10.0]])
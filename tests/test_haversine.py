@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from app.Matrix_data_process import haversine, haversine_matrix
+
+
+def test_matrix_matches_scalar_formula():
+    rng = np.random.default_rng(0)
+    lat1, lon1 = rng.uniform(-80, 80, 20), rng.uniform(-180, 180, 20)
+    lat2, lon2 = rng.uniform(-80, 80, 30), rng.uniform(-180, 180, 30)
+    matrix = haversine_matrix(lat1, lon1, lat2, lon2)
+    assert matrix.shape == (20, 30)
+    expected = [[haversine(a, b, c, d) for c, d in zip(lat2, lon2)] for a, b in zip(lat1, lon1)]
+    np.testing.assert_allclose(matrix, expected, rtol=1e-12, atol=1e-9)
+
+
+def test_known_distances_and_float32():
+    # Berlin - Munich, antipodal points
+    assert haversine_matrix([52.52], [13.405], [48.137], [11.575])[0, 0] == pytest.approx(504.4, abs=0.5)
+    assert haversine_matrix([0.0], [0.0], [0.0], [180.0])[0, 0] == pytest.approx(np.pi * 6371)
+    matrix = haversine_matrix([52.52, 48.137], [13.405, 11.575], [52.52, 48.137], [13.405, 11.575], dtype=np.float32)
+    assert matrix.dtype == np.float32
+    assert np.diag(matrix).max() == 0
+    assert matrix[0, 1] == matrix[1, 0]
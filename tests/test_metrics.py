@@ -0,0 +1,52 @@
+import time
+
+from app.metrics import Metrics, Timings
+
+
+def test_timings_collect_stages_and_counts():
+    timings = Timings()
+    with timings.span("matrix"):
+        time.sleep(0.002)
+    timings.count("matrix_cells", 9)
+    timings.count("matrix_cells", 1)
+    assert timings.stages["matrix"] >= 2
+    assert timings.counts == {"matrix_cells": 10}
+
+    merged = Timings()
+    merged.update(timings.as_dict())
+    merged.update(timings.as_dict())
+    assert merged.counts == {"matrix_cells": 20}
+    assert merged.stages["matrix"] == 2 * timings.stages["matrix"]
+
+
+def test_server_timing_header():
+    timings = Timings()
+    timings.stages.update({"matrix": 1.25, "schedule": 3.0})
+    timings.count("charging_stops", 2)
+    assert timings.server_timing() == 'matrix;dur=1.2, schedule;dur=3.0, charging_stops;desc="2"'
+
+
+def test_prometheus_histogram_buckets_are_cumulative():
+    metrics = Metrics(prefix="test")
+    for seconds in (0.003, 0.02, 0.02, 40):
+        metrics.observe("tour", seconds)
+    metrics.inc("requests", 3)
+    text = metrics.render()
+    assert "test_requests_total 3\n" in text
+    assert 'test_stage_duration_seconds_bucket{stage="tour",le="0.001"} 0\n' in text
+    assert 'test_stage_duration_seconds_bucket{stage="tour",le="0.005"} 1\n' in text
+    assert 'test_stage_duration_seconds_bucket{stage="tour",le="0.025"} 3\n' in text
+    assert 'test_stage_duration_seconds_bucket{stage="tour",le="30"} 3\n' in text
+    assert 'test_stage_duration_seconds_bucket{stage="tour",le="+Inf"} 4\n' in text
+    assert 'test_stage_duration_seconds_count{stage="tour"} 4\n' in text
+
+
+def test_record_adds_request_timings():
+    metrics = Metrics(prefix="test")
+    timings = Timings()
+    timings.stages["schedule"] = 7.0
+    timings.count("charging_stops", 2)
+    metrics.record(timings)
+    text = metrics.render()
+    assert "test_charging_stops_total 2\n" in text
+    assert 'test_stage_duration_seconds_sum{stage="schedule"} 0.007\n' in text
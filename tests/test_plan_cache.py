@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.plan_cache import PlanCache, plan_key
+from app.pydantic_config import RouteRequest
+
+
+def request(stops=("Halle", "Bamberg"), **kwargs):
+    return RouteRequest(origin="Ingolstadt", stops=list(stops), start_time="09:00", truck_model="MAN eGTX", **kwargs)
+
+
+def plan_result():
+    return {"route": [{"location": "Ingolstadt", "points": []}], "total_distance": 1.0, "total_duration": 1.0}
+
+
+def test_plan_key_ignores_geometry_options_and_repeated_stops():
+    assert plan_key(request(), "v1") == plan_key(request(stops=["Halle", "Bamberg", "Halle"], geometry="none"), "v1")
+    assert plan_key(request(), "v1") != plan_key(request(stops=["Bamberg", "Halle"]), "v1")
+    assert plan_key(request(), "v1") != plan_key(request(strategy="cost-optimal"), "v1")
+    assert plan_key(request(), "v1") != plan_key(request(), "v2")
+
+
+def test_identical_requests_are_planned_once():
+    cache = PlanCache(path="", size=10)
+    calls = []
+
+    async def plan():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return plan_result()
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_plan(request(), "v1", plan) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == plan_result() for result in results)
+    # callers get their own copies of the route points to fill in
+    results[0]["route"][0]["points"] = ["x"]
+    assert asyncio.run(cache.get_or_plan(request(), "v1", plan)) == plan_result()
+    assert len(calls) == 1
+
+
+def test_new_reference_version_drops_old_plans():
+    cache = PlanCache(path="", size=10)
+
+    async def plan():
+        return plan_result()
+
+    asyncio.run(cache.get_or_plan(request(), "v1", plan))
+    asyncio.run(cache.get_or_plan(request(), "v2", plan))
+    assert cache.get(plan_key(request(), "v1")) is None
+    assert cache.get(plan_key(request(), "v2")) is not None
+
+
+def test_failed_plans_are_not_cached():
+    cache = PlanCache(path="", size=10)
+
+    async def plan():
+        raise ValueError("Invalid city choice")
+
+    with pytest.raises(ValueError):
+        asyncio.run(cache.get_or_plan(request(), "v1", plan))
+    assert cache.get(plan_key(request(), "v1")) is None
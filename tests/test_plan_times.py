@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.brain import PlanStep, State, ticks
+from app.Matrix_data_process import transform
+
+
+def times(*steps):
+    """ (time, duration) of each step as transform shows them """
+    plan = [PlanStep("drive_to_load/unload", "A", "B", start, end, 100.0, 1.0, 0.0) for start, end in steps]
+    return [(p["time"], p["duration"]) for p in transform(plan, {"B": [50.0, 10.0]}, station_table(), {})["route"]]
+
+
+def station_table():
+    return pd.DataFrame({"ID": [], "latitude": [], "longitude": []})
+
+
+def test_ticks_round_like_timedelta():
+    assert ticks(1) == 60_000_000
+    assert ticks(1 / 3) == 20_000_000
+    assert ticks(45) == 2_700_000_000
+    assert ticks(1e-8) == 1  # 0.6 µs
+
+
+def test_ticks_shown_as_hh_mm_since_plan_start():
+    # the clock wraps on multi-day plans
+    assert times((0, ticks(90)), (ticks(24 * 60 + 1), ticks(24 * 60 + 2))) == [("09:00", 90), ("09:01", 1)]
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (ticks(59) + 59_999_999, ticks(60), ("09:59", 1)),    # 1 µs crosses into 10:00
+    (ticks(59.5), ticks(60.5), ("09:59", 1)),             # one minute across a minute boundary
+    (ticks(60), ticks(60) + 59_999_999, ("10:00", 0)),    # just under a minute within 10:00
+    (ticks(10.25), ticks(12.75), ("09:10", 2)),           # 2.5 minutes shown from whole minute to whole minute
+])
+def test_times_are_floored_to_whole_minutes(start, end, expected):
+    assert times((start, end)) == [expected]
+
+
+def test_durations_add_up_along_the_plan():
+    # exact ticks accumulate, the shown durations of consecutive steps add up to the shown elapsed time
+    state = State()
+    for minutes in (12.4, 0.3, 47.9, 59.7, 1 / 3):
+        state.add_step("drive_to_load/unload", "A", "B", minutes, 100.0, 1.0, 0.0)
+        state.currentTime += ticks(minutes)
+    shown = [(p["time"], p["duration"]) for p in transform(state.plan, {"B": [50.0, 10.0]}, station_table(), {})["route"]]
+    assert [t for t, _ in shown] == ["09:00", "09:12", "09:12", "10:00", "11:00"]
+    assert sum(d for _, d in shown) == state.currentTime // 60_000_000
+    assert np.isclose(transform(state.plan, {}, station_table(), {})["total_duration"], (12.4 + 0.3 + 47.9 + 59.7 + 1 / 3) / 60)
@@ -0,0 +1,49 @@
+import pytest
+
+from app.config import data_dir
+from app.planner import MatrixCache, batch_chunks, matrix_key, plan_route, plan_routes, route_matrix
+from app.pydantic_config import RouteRequest
+from app.reference_data import load_reference_data
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return load_reference_data(data_dir)
+
+
+def request(origin="Ingolstadt", stops=("Großbeeren",), truck_model="Mercedes eActros", **kwargs):
+    return RouteRequest(origin=origin, stops=list(stops), start_time="09:00", truck_model=truck_model, **kwargs)
+
+
+def test_batch_matches_single_plans(reference):
+    requests = [request(), request(stops=["Halle", "Bamberg"]), request(strategy="cost-optimal"), request(stops=["Bamberg", "Halle"])]
+    assert plan_routes(requests, reference) == [plan_route(r, reference) for r in requests]
+
+
+def test_batch_reports_errors_per_request(reference):
+    results = plan_routes([request(truck_model="Unknown"), request()], reference)
+    assert results[0] == {"error": "ValueError: Invalid truck model Unknown. Please choose from the available truck models."}
+    assert results[1]["route"]
+
+
+def test_matrix_key_ignores_stop_order_and_repeats():
+    assert matrix_key(request(stops=["Halle", "Bamberg", "Halle"])) == matrix_key(request(stops=["Bamberg", "Halle", "Ingolstadt"]))
+    assert matrix_key(request(stops=["Halle"])) != matrix_key(request(stops=["Halle"], truck_model="MAN eGTX"))
+
+
+def test_batch_chunks_keep_shared_matrices_together():
+    requests = [request(), request(stops=["Halle"]), request(strategy="cost-optimal"), request(stops=["Halle"], engine="optimal")]
+    chunks = batch_chunks(requests, workers=2)
+    assert sorted(i for chunk in chunks for i in chunk) == [0, 1, 2, 3]
+    assert sorted(map(sorted, chunks)) == [[0, 2], [1, 3]]
+    # large groups are split so that every worker gets a chunk
+    assert len(batch_chunks([request()] * 8, workers=4)) == 4
+
+
+def test_matrix_cache_is_bounded_by_bytes(reference):
+    entry = route_matrix(request(), reference)
+    distance_matrix, time_matrix, _ = entry
+    cache = MatrixCache(max_mb=(distance_matrix.to_numpy().nbytes + time_matrix.to_numpy().nbytes) * 1.5 / 1e6)
+    cache.put("a", entry)
+    cache.put("b", entry)
+    assert cache.get("a") is None and cache.get("b") is not None
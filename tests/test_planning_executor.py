@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.main import run_task
+from app.metrics import Timings
+from app.planner import ExecutorSaturated, PlanningExecutor
+
+
+def test_executor_rejects_tasks_beyond_capacity():
+    executor = PlanningExecutor("thread", workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def run():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert executor.in_flight == 2
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(release.wait)
+        release.set()
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(run()) == [True, True]
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+
+def test_timed_out_tasks_count_until_they_finish():
+    executor = PlanningExecutor("thread", workers=1, queue_size=0)
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(release.wait, timeout=0.01)
+        assert executor.in_flight == 1
+        release.set()
+        await asyncio.sleep(0.05)
+        return executor.in_flight
+
+    assert asyncio.run(run()) == 0
+    executor.shutdown()
+
+
+def invalid_request():
+    raise ValueError("Invalid city choice. Please choose from the available cities.")
+
+
+def test_invalid_requests_answer_422():
+    executor = PlanningExecutor("thread", workers=1, queue_size=0)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(run_task(executor, Timings(), invalid_request))
+    assert error.value.status_code == 422
+    assert error.value.detail == "Invalid city choice. Please choose from the available cities."
+    executor.shutdown()
@@ -0,0 +1,40 @@
+import time
+
+from app.profiler import RateLimiter, load_profile, profile_call, save_profile
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return "done"
+
+
+def test_profile_call_samples_the_profiled_function():
+    result, collapsed = profile_call(busy_loop, 0.1, interval=0.002)
+    assert result == "done"
+    lines = collapsed.splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.endswith("test_profiler.py:busy_loop") and int(count) > 0
+    assert "profiler.py:profile_call" not in collapsed
+
+
+def test_rate_limiter_sliding_window(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(limit=2, period=60)
+    assert limiter.allow() and limiter.allow()
+    assert not limiter.allow()
+    now[0] = 59.9
+    assert not limiter.allow()
+    now[0] = 60.0
+    assert limiter.allow()
+
+
+def test_saved_profiles_are_pruned_and_ids_checked(tmp_path):
+    ids = [save_profile(f"a;b {i}\n", tmp_path, keep=2) for i in range(3)]
+    assert len(list(tmp_path.iterdir())) == 2
+    assert sum(load_profile(profile_id, tmp_path) is not None for profile_id in ids) == 2
+    assert load_profile("../secret", tmp_path) is None
+    assert load_profile("missing", tmp_path) is None
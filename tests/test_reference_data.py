@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.config import data_dir
+from app.reference_data import (CITY_CHOICES_FILE, TRUCK_SPECS_FILE, ReferenceDataStore, load_reference_data,
+                                station_row_index)
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    for name in (CITY_CHOICES_FILE, TRUCK_SPECS_FILE, "combined_charge_points.csv"):
+        shutil.copy(os.path.join(data_dir, name), tmp_path / name)
+    return tmp_path
+
+
+def test_station_arrays_are_typed_and_read_only(reference_dir):
+    reference = load_reference_data(reference_dir)
+    assert reference.station_ids.dtype == np.int64
+    assert reference.station_lat.dtype == reference.station_lon.dtype == np.float64
+    assert reference.station_power_kw.dtype == reference.station_price.dtype == np.float64
+    for array in (reference.station_ids, reference.station_lat, reference.station_lon, reference.station_power_kw, reference.station_price):
+        assert not array.flags.writeable
+    np.testing.assert_array_equal(reference.station_lat, reference.charge_points["latitude"])
+    np.testing.assert_array_equal(reference.station_power_kw, reference.charge_points["max_power_kW"])
+    np.testing.assert_array_equal(reference.station_price, reference.charge_points["price_€/kWh"])
+    assert reference.station_matrix is None and reference.tariffs is None and reference.road_network is None
+
+
+def test_station_row_index_keeps_first_occurrence():
+    assert station_row_index([7, 3, 7, 5]) == {7: 0, 3: 1, 5: 3}
+
+
+def test_store_reloads_only_changed_files(reference_dir):
+    store = ReferenceDataStore(reference_dir)
+    first = store.get()
+    assert store.get() is first
+    assert not store.reload_if_changed()
+
+    path = reference_dir / CITY_CHOICES_FILE
+    path.write_text('{"A": [50.0, 10.0]}', encoding="utf-8")
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+    assert store.reload_if_changed()
+    assert store.get().city_choices == {"A": [50.0, 10.0]}
+    assert first.city_choices != store.get().city_choices
@@ -0,0 +1,40 @@
+import pytest
+
+from app.config import data_dir
+from app.brain import compute_schedule_fast
+from app.planner import plan_route, replan_route, route_matrix
+from app.pydantic_config import ReplanRequest, RouteRequest
+from app.reference_data import load_reference_data
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return load_reference_data(data_dir)
+
+
+def test_replan_on_schedule_continues_the_plan(reference):
+    request = RouteRequest(origin="Ingolstadt", stops=["Halle", "Bamberg"], start_time="09:00", truck_model="Mercedes eActros")
+    plan = plan_route(request, reference)
+    # the truck is at the first stop with the planned battery (the response only shows it rounded)
+    distance_matrix, time_matrix, charging_stations = route_matrix(request, reference)
+    state = compute_schedule_fast(distance_matrix, charging_stations, request.origin, request.stops, plan["tour"],
+                                  reference.truck_specs[request.truck_model], time_matrix=time_matrix)
+    arrival = next(step for step in state.plan if step.to == plan["tour"][1])
+    replan = ReplanRequest(plan_id="p", current_time="13:00", soc_kwh=arrival.SOC_kWh, location=plan["tour"][1])
+    result = replan_route(request, plan["tour"], replan, reference)
+    assert result["tour"] == plan["tour"][1:]
+    rest = plan["route"][[p["location"] for p in plan["route"]].index(plan["tour"][1]) + 1:]
+    assert [(p["location"], p["action"]) for p in result["route"][1:]] == [(p["location"], p["action"]) for p in rest]
+
+
+def test_replan_from_coordinates_needs_the_next_stop(reference):
+    request = RouteRequest(origin="Ingolstadt", stops=["Halle"], start_time="09:00", truck_model="Mercedes eActros")
+    tour = plan_route(request, reference)["tour"]
+    replan = ReplanRequest(plan_id="p", current_time="10:00", soc_kwh=300, latitude=49.5, longitude=11.6)
+    with pytest.raises(ValueError):
+        replan_route(request, tour, replan, reference)
+    result = replan_route(request, tour, replan.model_copy(update={"next_stop": "Halle"}), reference)
+    assert result["tour"] == ["Current position", "Halle", "Ingolstadt"]
+    assert result["route"][0]["time"] == "10:00"
+    with pytest.raises(ValueError):
+        replan_route(request, tour, replan.model_copy(update={"next_stop": "Bamberg"}), reference)
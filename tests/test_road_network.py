@@ -0,0 +1,198 @@
+import heapq
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.Matrix_data_process import add_location, build_distance_matrix
+from app.osm_pbf import _varint, packed_sint64, packed_varints
+from app.road_network import (RoadGraph, _buckets, _csr, _join, build_road_graph, build_road_locations, contract,
+                              load_road_network, read_road_graph, truck_way)
+
+
+# minimal .osm.pbf writer: one block of dense nodes and one of ways
+def varint(value):
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def field(number, value):
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def packed(number, values, signed=False):
+    return field(number, b"".join(varint((v << 1) ^ (v >> 63) if signed else v) for v in map(int, values)))
+
+
+def blob(kind, data):
+    body = field(2, len(data)) + field(3, zlib.compress(data))
+    header = field(1, kind) + field(3, len(body))
+    return struct.pack(">I", len(header)) + header + body
+
+
+def write_pbf(path, nodes, ways):
+    """ nodes: {id: (lat, lon)}, ways: [(refs, tags)] """
+    ids = sorted(nodes)
+    lat = [round(nodes[i][0] * 1e7) for i in ids]
+    lon = [round(nodes[i][1] * 1e7) for i in ids]
+    dense = packed(1, np.diff(ids, prepend=0), True) + packed(8, np.diff(lat, prepend=0), True) + packed(9, np.diff(lon, prepend=0), True)
+    strings = [b""] + sorted({s.encode() for _, tags in ways for item in tags.items() for s in item})
+    index = {s.decode(): i for i, s in enumerate(strings)}
+    way_messages = b"".join(field(3, field(1, w) + packed(2, [index[k] for k in tags]) + packed(3, [index[v] for v in tags.values()])
+                                  + packed(8, np.diff(refs, prepend=0), True))
+                            for w, (refs, tags) in enumerate(ways, 1))
+    with open(path, "wb") as f:
+        f.write(blob(b"OSMHeader", field(4, b"OsmSchema-V0.6")))
+        f.write(blob(b"OSMData", field(1, b"") + field(2, field(2, dense))))
+        f.write(blob(b"OSMData", field(1, b"".join(field(1, s) for s in strings)) + field(2, way_messages)))
+
+
+def dijkstra(n_nodes, tail, head, time_min, length_km, source):
+    """ (minutes, km) of the fastest paths from `source` """
+    out = [[] for _ in range(n_nodes)]
+    for u, v, t, d in zip(tail.tolist(), head.tolist(), time_min.tolist(), length_km.tolist()):
+        out[u].append((v, t, d))
+    minutes, km = np.full(n_nodes, np.inf), np.full(n_nodes, np.inf)
+    minutes[source] = km[source] = 0
+    heap = [(0.0, source)]
+    while heap:
+        t, u = heapq.heappop(heap)
+        if t > minutes[u]:
+            continue
+        for v, t_uv, d_uv in out[u]:
+            if t + t_uv < minutes[v]:
+                minutes[v], km[v] = t + t_uv, km[u] + d_uv
+                heapq.heappush(heap, (t + t_uv, v))
+    return minutes, km
+
+
+def test_truck_way_rules():
+    assert truck_way({"highway": "motorway"}, 40, 4) == (80, True, False)
+    assert truck_way({"highway": "primary", "maxspeed": "50"}, 40, 4) == (50, True, True)
+    assert truck_way({"highway": "primary", "maxspeed:hgv": "30 mph", "maxspeed": "50"}, 40, 4) == (pytest.approx(48.27), True, True)
+    assert truck_way({"highway": "secondary", "oneway": "-1"}, 40, 4) == (50, False, True)
+    assert truck_way({"highway": "secondary", "maxweight": "7.5 t"}, 40, 4) is None
+    assert truck_way({"highway": "secondary", "maxheight": "3,8"}, 40, 4) is None
+    assert truck_way({"highway": "secondary", "hgv": "no"}, 40, 4) is None
+    assert truck_way({"highway": "service", "access": "private", "hgv": "yes"}, 40, 4) is None
+    assert truck_way({"highway": "tertiary", "access": "no", "hgv": "designated"}, 40, 4) == (40, True, True)
+    assert truck_way({"highway": "footway"}, 40, 4) is None
+
+
+def test_packed_varints_match_scalar_decoding():
+    values = [0, 1, 127, 128, 300, 2**35 + 7, 2**63 - 1]
+    buf = b"".join(varint(v) for v in values)
+    assert packed_varints(buf).tolist() == values
+    pos, scalar = 0, []
+    while pos < len(buf):
+        value, pos = _varint(buf, pos)
+        scalar.append(value)
+    assert scalar == values
+    signed = [0, -1, 1, -64, 2**40, -(2**40)]
+    assert packed_sint64(b"".join(varint((v << 1) ^ (v >> 63)) for v in signed)).tolist() == signed
+
+
+def test_read_road_graph_merges_chains(tmp_path):
+    nodes = {1: (50.0, 10.0), 2: (50.0, 10.05), 3: (50.0, 10.1), 4: (50.1, 10.1), 5: (50.1, 10.0)}
+    ways = [([1, 2, 3], {"highway": "secondary"}),
+            ([3, 4], {"highway": "primary", "oneway": "yes"}),
+            ([1, 5, 4], {"highway": "primary", "hgv": "no"})]
+    write_pbf(tmp_path / "roads.osm.pbf", nodes, ways)
+    latitude, longitude, tail, head, time_min, length_km = read_road_graph(tmp_path / "roads.osm.pbf")
+    # node 2 is inside a chain, nodes 5 and the hgv=no way are dropped
+    assert sorted(zip(latitude.round(3).tolist(), longitude.round(3).tolist())) == [(50.0, 10.0), (50.0, 10.1), (50.1, 10.1)]
+    node = {(round(a, 3), round(b, 3)): i for i, (a, b) in enumerate(zip(latitude, longitude))}
+    edges = {(int(u), int(v)): (t, d) for u, v, t, d in zip(tail, head, time_min, length_km)}
+    a, c, d = node[50.0, 10.0], node[50.0, 10.1], node[50.1, 10.1]
+    assert set(edges) == {(a, c), (c, a), (c, d)}
+    assert edges[a, c][1] == pytest.approx(7.15, abs=0.01)   # 0.1° of longitude at 50°N
+    assert edges[a, c][0] == pytest.approx(edges[a, c][1] / 50 * 60)
+    assert edges[c, d][1] == pytest.approx(11.12, abs=0.01)
+
+
+def test_contraction_hierarchy_matches_dijkstra():
+    rng = np.random.default_rng(0)
+    n = 80
+    # connected directed graph: a random cycle plus random edges
+    order = rng.permutation(n)
+    tail = np.concatenate((order, rng.integers(0, n, 3 * n)))
+    head = np.concatenate((np.roll(order, -1), rng.integers(0, n, 3 * n)))
+    length_km = rng.uniform(1, 20, len(tail))
+    time_min = length_km / rng.uniform(30, 80, len(tail)) * 60
+
+    up, down = contract(n, tail, head, time_min, length_km)
+    up, down = _csr(n, *up), _csr(n, *down)
+    buckets = _buckets([RoadGraph.search(down, t) for t in range(n)])
+    for source in range(n):
+        minutes, km = _join(RoadGraph.search(up, source), buckets, n)
+        expected_minutes, expected_km = dijkstra(n, tail, head, time_min, length_km, source)
+        np.testing.assert_allclose(minutes, expected_minutes, rtol=1e-9)
+        np.testing.assert_allclose(km, expected_km, rtol=1e-9)
+
+
+def test_build_and_load_road_distances(tmp_path):
+    # 5 x 5 grid of two-way roads, 0.1° apart, with a one-way motorway along the bottom row
+    node = lambda i, j: 1 + 5 * i + j
+    nodes = {node(i, j): (50 + 0.1 * i, 10 + 0.1 * j) for i in range(5) for j in range(5)}
+    ways = [([node(i, j) for j in range(5)], {"highway": "motorway" if i == 0 else "tertiary"}) for i in range(5)]
+    ways += [([node(i, j) for i in range(5)], {"highway": "tertiary"}) for j in range(5)]
+    write_pbf(tmp_path / "grid.osm.pbf", nodes, ways)
+    cities = {"West": [50.0, 10.0], "East": [50.0, 10.4], "North": [50.401, 10.2]}
+    (tmp_path / "city_choices.json").write_text(json.dumps(cities), encoding="utf-8")
+    stations = pd.DataFrame({"ID": [5, 3], "latitude": [50.2, 52.0], "longitude": [10.2, 10.0], "max_power_kW": 150,
+                             "price_€/kWh": 0.6, "source": "Public"})
+    stations.to_csv(tmp_path / "combined_charge_points.csv", index=False)
+
+    assert build_road_graph(tmp_path / "grid.osm.pbf", tmp_path) == 25
+    assert build_road_locations(tmp_path) == 5
+    network = load_road_network(tmp_path, cities, stations["ID"], stations["latitude"].to_numpy(), stations["longitude"].to_numpy())
+    positions = network.positions(["West", "East", "North"], [5, 3])
+    distances = network.submatrix(positions)
+    times = network.submatrix(positions, times=True)
+
+    latitude, longitude, tail, head, time_min, length_km = read_road_graph(tmp_path / "grid.osm.pbf")
+    grid_node = {(round(a, 3), round(b, 3)): i for i, (a, b) in enumerate(zip(latitude, longitude))}
+    west, east, station = grid_node[50.0, 10.0], grid_node[50.0, 10.4], grid_node[50.2, 10.2]
+    # the motorway only runs east, the way back takes the faster of the detours
+    for source, target, (i, j) in ((west, east, (0, 1)), (east, west, (1, 0)), (west, station, (0, 3))):
+        minutes, km = dijkstra(len(latitude), tail, head, time_min, length_km, source)
+        assert distances[i, j] == pytest.approx(km[target])
+        assert times[i, j] == pytest.approx(minutes[target])
+    assert distances[1, 0] > distances[0, 1]
+    # 40 km of motorway at 80 km/h, the way back on tertiary roads at 40 km/h
+    assert times[0, 1] == pytest.approx(distances[0, 1] / 80 * 60)
+    assert times[1, 0] == pytest.approx(distances[1, 0] / 40 * 60)
+    # North is snapped to the road about 110 m away
+    north = grid_node[50.4, 10.2]
+    minutes, km = dijkstra(len(latitude), tail, head, time_min, length_km, north)
+    assert distances[2, 3] == pytest.approx(km[station] + 0.111, abs=0.002)
+    assert times[2, 3] == pytest.approx(minutes[station] + 0.111 / 30 * 60, abs=0.005)
+    # station 3 is off the network and keeps the haversine distance at 80 km/h
+    assert distances[0, 4] == pytest.approx(222.4, abs=0.1)
+    assert times[0, 4] == pytest.approx(distances[0, 4] / 80 * 60)
+    assert np.allclose(np.diag(distances), 0) and np.allclose(np.diag(times), 0)
+
+    # queries from a point match the precomputed rows and columns
+    to_km, from_km, to_minutes, from_minutes = network.point_distances(50.0, 10.0, positions)
+    np.testing.assert_allclose(to_km, distances[0], atol=1e-9)
+    np.testing.assert_allclose(from_km, distances[:, 0], atol=1e-9)
+    np.testing.assert_allclose(to_minutes, times[0], atol=1e-9)
+    np.testing.assert_allclose(from_minutes, times[:, 0], atol=1e-9)
+
+    # the matrices of a request and of a new location are looked up on the road network
+    distance_matrix, time_matrix, charging_stations = build_distance_matrix("West", ["East", "North"], cities, stations, {"Range_80%_km": 500},
+                                                                            dtype=np.float64, road_network=network)
+    np.testing.assert_allclose(time_matrix.to_numpy(), times)
+    cities["Truck"] = [50.0, 10.0]
+    _, time_matrix = add_location(distance_matrix, time_matrix, charging_stations, cities, "Truck", road_network=network)
+    np.testing.assert_allclose(time_matrix.to_numpy()[0, 1:], times[0], atol=1e-9)
@@ -0,0 +1,51 @@
+import time
+
+from app.route_cache import RouteCache, route_key
+
+summary = {"lengthInMeters": 1000, "travelTimeInSeconds": 60}
+points = [{"latitude": 50.0, "longitude": 10.0}]
+
+
+def test_route_key_rounds_coordinates():
+    assert route_key("50.000001,10.0", "51,11.0000049", "truck") == route_key("50.0,10.0", "51.0,11.0", "truck")
+    assert route_key("50.0,10.0", "51.0,11.0", "truck") != route_key("50.0,10.0", "51.0,11.0", "car")
+    assert route_key("50.0,10.0", "51.0,11.0", "truck") != route_key("51.0,11.0", "50.0,10.0", "truck")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = RouteCache(path="", size=2)
+    cache.put("a", summary, points)
+    cache.put("b", summary, points)
+    assert cache.get("a") is not None
+    cache.put("c", summary, points)
+    assert cache.get("b") is None
+    assert cache.get("a") == (summary, points)
+    assert cache.stats() == {"hits": 2, "disk_hits": 0, "misses": 1, "entries": 2}
+
+
+def test_disk_tier_is_shared_and_expires(tmp_path):
+    path = str(tmp_path / "routes.sqlite")
+    writer = RouteCache(path=path, size=1)
+    writer.put("a", summary, points)
+    reader = RouteCache(path=path, size=1)
+    assert reader.get("a") == (summary, points)
+    assert reader.disk_hits == 1
+
+    expired = RouteCache(path=path, size=1, ttl=0)
+    assert expired.get("a") is None
+    for cache in (writer, reader, expired):
+        cache.close()
+
+
+def test_disk_tier_is_trimmed_every_evict_every_puts(tmp_path):
+    cache = RouteCache(path=str(tmp_path / "routes.sqlite"), size=1, disk_size=5)
+    cache.evict_every = 4
+    for i in range(7):
+        cache.put(f"leg{i}", summary, points)
+        time.sleep(0.001)  # distinct access times
+    # not trimmed yet, the bound may be exceeded between checks
+    assert cache._db.execute("SELECT COUNT(*) FROM routes").fetchone()[0] == 7
+    cache.put("leg7", summary, points)
+    keys = [row[0] for row in cache._db.execute("SELECT key FROM routes ORDER BY key")]
+    assert keys == [f"leg{i}" for i in range(3, 8)]
+    cache.close()
@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.route_cache import RouteCache
+from app.routing import RoutingClient, RoutingError, route_legs
+
+
+def route_response(location):
+    origin, destination = location.split(":")
+    points = [dict(zip(("latitude", "longitude"), map(float, point.split(",")))) for point in (origin, destination)]
+    return {"routes": [{"legs": [{"summary": {"lengthInMeters": 1000, "travelTimeInSeconds": 60}, "points": points}]}]}
+
+
+class Backend:
+    """ Stand-in routing API answering each location with the queued status codes, then 200 """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request):
+        location = request.url.path.split("/")[-2]
+        self.requests.append(location)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        return httpx.Response(status, json=route_response(location) if status == 200 else {})
+
+
+def client(backend, **kwargs):
+    return RoutingClient(url="http://routing.test/route/{location}/json?key={key}", key="test", backoff=0,
+                         transport=httpx.MockTransport(backend), **kwargs)
+
+
+def test_legs_are_fetched_concurrently_in_order():
+    backend = Backend()
+    legs = [(f"50.{i},10.0", f"51.{i},11.0") for i in range(10)]
+
+    async def run():
+        routing = client(backend, max_concurrency=3)
+        try:
+            return await routing.get_routes(legs)
+        finally:
+            await routing.aclose()
+
+    results = asyncio.run(run())
+    assert [points[0]["latitude"] for _, points in results] == [float(origin.split(",")[0]) for origin, _ in legs]
+    assert 1 < backend.max_in_flight <= 3
+
+
+def test_server_errors_are_retried():
+    backend = Backend([503, 429])
+
+    async def run():
+        routing = client(backend, retries=2)
+        try:
+            return await routing.get_route("50.0,10.0", "51.0,11.0")
+        finally:
+            await routing.aclose()
+
+    summary, _ = asyncio.run(run())
+    assert summary["lengthInMeters"] == 1000
+    assert len(backend.requests) == 3
+
+
+@pytest.mark.parametrize("statuses, attempts", [([400], 1), ([500, 500, 500], 3)])
+def test_failed_legs_raise(statuses, attempts):
+    backend = Backend(statuses)
+
+    async def run():
+        routing = client(backend, retries=2)
+        try:
+            await routing.get_route("50.0,10.0", "51.0,11.0")
+        finally:
+            await routing.aclose()
+
+    with pytest.raises(RoutingError):
+        asyncio.run(run())
+    assert len(backend.requests) == attempts
+
+
+def test_cached_legs_are_not_requested():
+    backend = Backend()
+
+    async def run():
+        routing = client(backend, cache=RouteCache(path="", size=10))
+        try:
+            first = await routing.get_route("50.0,10.0", "51.0,11.0")
+            second = await routing.get_route("50.000001,10.0", "51.0,11.0")
+            return first, second
+        finally:
+            await routing.aclose()
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert len(backend.requests) == 1
+
+
+def test_route_legs_skip_repeated_points():
+    route = [{"latitude": 50.0, "longitude": 10.0}, {"latitude": 50.0, "longitude": 10.0}, {"latitude": 51.0, "longitude": 11.0}]
+    assert route_legs(route) == [(2, "50.0,10.0", "51.0,11.0")]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from app.Matrix_data_process import haversine_matrix
+from app.spatial_index import StationGridIndex
+
+
+def brute_force(latitudes, longitudes, points, max_distance):
+    distances = haversine_matrix([p[0] for p in points], [p[1] for p in points], latitudes, longitudes)
+    return np.flatnonzero((distances <= max_distance).any(axis=0))
+
+
+def test_query_radius_matches_brute_force():
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(45, 56, 2000)
+    longitudes = rng.uniform(5, 16, 2000)
+    index = StationGridIndex(latitudes, longitudes)
+    for max_distance in (10, 120, 400):
+        points = list(zip(rng.uniform(46, 55, 3), rng.uniform(6, 15, 3)))
+        found = index.query_radius([p[0] for p in points], [p[1] for p in points], max_distance)
+        # points right on the radius may fall either way between the chord test and the haversine formula
+        expected = brute_force(latitudes, longitudes, points, max_distance - 1e-6)
+        assert set(expected) <= set(found)
+        assert set(found) <= set(brute_force(latitudes, longitudes, points, max_distance + 1e-6))
+
+
+def test_query_radius_across_the_antimeridian_and_pole():
+    latitudes = np.array([0.0, 0.0, 0.0, 89.9, 89.9])
+    longitudes = np.array([179.95, -179.95, 170.0, 0.0, 180.0])
+    index = StationGridIndex(latitudes, longitudes)
+    assert index.query_radius([0.0], [180.0], 20).tolist() == [0, 1]
+    assert index.query_radius([90.0], [0.0], 20).tolist() == [3, 4]
+
+
+def test_empty_index():
+    assert len(StationGridIndex([], []).query_radius([50.0], [10.0], 100)) == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from app.Matrix_data_process import build_distance_matrix, haversine_matrix
+from app.charge_points import read_charge_points
+from app.station_matrix import build_station_matrix, load_station_matrix
+
+
+def write_stations(directory, stations):
+    """ Write the station table and return it as read back, with the coordinates the matrix is built from """
+    stations.to_csv(directory / "combined_charge_points.csv", index=False)
+    return read_charge_points(directory)
+
+
+def stations_frame(n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"ID": rng.permutation(1000)[:n], "latitude": rng.uniform(47, 55, n), "longitude": rng.uniform(6, 15, n),
+                         "max_power_kW": 150, "price_€/kWh": 0.6, "source": "Public"})
+
+
+def test_build_and_load_matches_haversine(tmp_path):
+    stations = write_stations(tmp_path, stations_frame())
+    assert build_station_matrix(tmp_path, chunk_rows=16) == len(stations)
+
+    lat, lon = stations["latitude"].to_numpy(), stations["longitude"].to_numpy()
+    matrix = load_station_matrix(tmp_path, stations["ID"], lat, lon)
+    assert isinstance(matrix.distance_km, np.memmap) and isinstance(matrix.time_min, np.memmap)
+    np.testing.assert_allclose(matrix.distance_km, haversine_matrix(lat, lon, lat, lon))
+    np.testing.assert_allclose(matrix.time_min, haversine_matrix(lat, lon, lat, lon) / 80 * 60)
+
+    # any subset of stations, in any order
+    ids = stations["ID"].to_numpy()[[7, 3, 41]]
+    positions = matrix.positions(ids)
+    out = np.empty((3, 3))
+    matrix.submatrix(positions, out)
+    rows = [7, 3, 41]
+    np.testing.assert_allclose(out, haversine_matrix(lat[rows], lon[rows], lat[rows], lon[rows]))
+    matrix.submatrix(positions, out, times=True)
+    np.testing.assert_allclose(out, haversine_matrix(lat[rows], lon[rows], lat[rows], lon[rows]) / 80 * 60)
+    # contiguous block read as a slice
+    matrix.submatrix(np.arange(5, 9), out=np.empty((4, 4)))
+
+
+def test_stale_matrix_is_ignored(tmp_path):
+    stations = write_stations(tmp_path, stations_frame())
+    build_station_matrix(tmp_path)
+    moved = stations["latitude"].to_numpy().copy()
+    moved[0] += 0.1
+    assert load_station_matrix(tmp_path, stations["ID"], moved, stations["longitude"].to_numpy()) is None
+    assert load_station_matrix(tmp_path / "missing", stations["ID"], moved, stations["longitude"].to_numpy()) is None
+
+
+def test_distance_matrix_from_the_station_matrices(tmp_path):
+    stations = write_stations(tmp_path, stations_frame())
+    build_station_matrix(tmp_path)
+    lat, lon = stations["latitude"].to_numpy(), stations["longitude"].to_numpy()
+    matrix = load_station_matrix(tmp_path, stations["ID"], lat, lon)
+    cities = {"A": [50.0, 10.0], "B": [52.0, 12.0]}
+    truck = {"Range_80%_km": 300}
+
+    computed = build_distance_matrix("A", ["B"], cities, stations, truck)
+    looked_up = build_distance_matrix("A", ["B"], cities, stations, truck, station_matrix=matrix)
+    assert len(looked_up[2]) > 0 and list(looked_up[0].index) == list(computed[0].index)
+    np.testing.assert_allclose(looked_up[0].to_numpy(), computed[0].to_numpy())
+    np.testing.assert_allclose(looked_up[1].to_numpy(), computed[1].to_numpy())
+    np.testing.assert_allclose(looked_up[1].to_numpy(), looked_up[0].to_numpy() / 80 * 60)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import streaming
+from app.pydantic_config import RouteRequest
+from app.routing import RoutingClient
+from app.streaming import encode_event, stream_batch, stream_route
+
+
+def test_encode_event_formats():
+    assert encode_event("point", {"point": 0}) == '{"event": "point", "point": 0}\n'
+    assert encode_event("point", {"point": 0}, "sse") == 'event: point\ndata: {"point": 0}\n\n'
+
+
+def planned_route():
+    point = {"time": "09:00", "location": "A", "points": [], "action": "Start", "duration": 0, "SOC": 480, "why": ""}
+    return {"route": [{**point, "latitude": 50.0, "longitude": 10.0},
+                      {**point, "location": "B", "latitude": 51.0, "longitude": 11.0, "action": "drive_to_load/unload"}],
+            "total_distance": 130.0, "total_duration": 1.6}
+
+
+def collect(plan, request, status=200):
+    def backend(http_request):
+        origin, destination = http_request.url.path.split("/")[-2].split(":")
+        points = [dict(zip(("latitude", "longitude"), map(float, p.split(",")))) for p in (origin, destination)]
+        return httpx.Response(status, json={"routes": [{"legs": [{"summary": {"lengthInMeters": 140000, "travelTimeInSeconds": 7200},
+                                                                   "points": points}]}]})
+
+    async def run():
+        client = RoutingClient(url="http://routing.test/{location}/json?key={key}", key="test", retries=0,
+                               transport=httpx.MockTransport(backend))
+        try:
+            return [json.loads(line) async for line in stream_route(plan, request, client)]
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+
+def test_points_then_geometry_then_summary():
+    request = RouteRequest(origin="A", stops=["B"], start_time="09:00", truck_model="T", geometry_format="polyline")
+    events = collect(planned_route(), request)
+    assert [event["event"] for event in events] == ["point", "point", "geometry", "summary"]
+    assert events[2]["point"] == 1 and events[2]["polyline"]
+    assert events[3] == {"event": "summary", "total_distance": 140.0, "total_duration": 2.0}
+
+
+def test_planned_totals_without_geometry():
+    request = RouteRequest(origin="A", stops=["B"], start_time="09:00", truck_model="T", geometry="none")
+    events = collect(planned_route(), request)
+    assert events[-1] == {"event": "summary", "total_distance": 130.0, "total_duration": 1.6}
+
+
+def test_routing_failure_ends_with_error():
+    request = RouteRequest(origin="A", stops=["B"], start_time="09:00", truck_model="T")
+    events = collect(planned_route(), request, status=503)
+    assert events[-1] == {"event": "error", "error": "Routing service unavailable"}
+
+
+@pytest.fixture
+def batch_planner(monkeypatch):
+    """ Plans of the batch from a dict of position -> plan, on threads instead of the process pool """
+    plans = {}
+    monkeypatch.setattr(streaming, "get_process_pool", lambda: None)
+    monkeypatch.setattr(streaming, "batch_chunks", lambda requests: [[i] for i in range(len(requests))])
+    monkeypatch.setattr(streaming, "plan_batch_chunk", lambda chunk: [plans[int(request.origin)] for request in chunk])
+    return plans
+
+
+def collect_batch(requests):
+    async def run():
+        return [json.loads(line) async for line in stream_batch(requests, None)]
+
+    # the stream must end even if a request fails
+    return asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def batch_request(i):
+    return RouteRequest(origin=str(i), stops=["B"], start_time="09:00", truck_model="T")
+
+
+def test_batch_failures_end_their_request(batch_planner, monkeypatch):
+    async def broken_geometry(route, request, routing_client):
+        yield 1, {"lengthInMeters": 1000, "travelTimeInSeconds": 60}
+        raise KeyError("points")
+
+    monkeypatch.setattr(streaming, "stream_geometry", broken_geometry)
+    invalid = planned_route()
+    del invalid["route"][1]["SOC"]
+    batch_planner.update({0: planned_route(), 1: invalid, 2: {"error": "ValueError: unknown city"}})
+    events = collect_batch([batch_request(i) for i in range(3)])
+
+    assert events[-1] == {"event": "done"}
+    ends = {event["index"]: event for event in events if event["event"] in ("summary", "error")}
+    assert sorted(ends) == [0, 1, 2]
+    assert ends[0]["event"] == "error" and ends[0]["error"].startswith("KeyError")
+    assert ends[1]["event"] == "error" and ends[1]["error"].startswith("ValidationError")
+    assert ends[2] == {"event": "error", "index": 2, "error": "ValueError: unknown city"}
+    assert [event["index"] for event in events if event["event"] == "route"] == [0]
+
+
+def test_slow_routing_times_out(batch_planner, monkeypatch):
+    async def stalled_geometry(route, request, routing_client):
+        await asyncio.sleep(60)
+        yield 1, {}
+
+    monkeypatch.setattr(streaming, "stream_geometry", stalled_geometry)
+    monkeypatch.setattr(streaming, "routing_stage_timeout", 0.05)
+    batch_planner[0] = planned_route()
+    events = collect_batch([batch_request(0)])
+    assert [event["event"] for event in events] == ["route", "error", "done"]
+    assert events[1] == {"event": "error", "index": 0, "error": "Routing service timed out"}
+
+    async def run():
+        request = RouteRequest(origin="A", stops=["B"], start_time="09:00", truck_model="T")
+        return [json.loads(line) async for line in stream_route(planned_route(), request, None)]
+
+    assert asyncio.run(asyncio.wait_for(run(), 5))[-1] == {"event": "error", "error": "Routing service timed out"}
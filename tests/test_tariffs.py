@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tariffs import SLOTS_PER_DAY, TariffTable, build_tariffs, load_tariffs, slot_of
+
+
+def day_prices(night=0.3, day=0.6):
+    """ One station: `night` from 22:00 to 06:00, `day` otherwise """
+    prices = np.full(SLOTS_PER_DAY, day)
+    prices[slot_of("22:00"):] = night
+    prices[:slot_of("06:00")] = night
+    return prices
+
+
+def test_average_price_over_time_of_use_windows():
+    table = TariffTable.from_prices([day_prices(), np.full(SLOTS_PER_DAY, 0.5)])
+    # plan minutes count from 09:00
+    assert table.average_price(0, 0, 60) == pytest.approx(0.6)
+    # 21:30 - 22:30: half day price, half night price
+    assert table.average_price(0, 12 * 60 + 30, 60) == pytest.approx(0.45)
+    # across midnight and into the next day, the table repeats daily
+    assert table.average_price(0, 15 * 60, 120) == pytest.approx(0.3)
+    assert table.average_price(0, 15 * 60 + 24 * 60, 120) == pytest.approx(0.3)
+    # 05:00 - 07:00 of the next day
+    assert table.average_price(0, 20 * 60, 120) == pytest.approx(0.45)
+    # sessions of no length get the price at their start, arrays broadcast
+    assert table.average_price(0, 13 * 60, 0) == pytest.approx(0.3)
+    np.testing.assert_allclose(table.average_price([0, 1], 12 * 60 + 30, 60), [0.45, 0.5], rtol=1e-6)
+
+
+def test_for_stations_selects_rows():
+    table = TariffTable.from_prices([np.full(SLOTS_PER_DAY, 0.1), np.full(SLOTS_PER_DAY, 0.2)])
+    subset = table.for_stations({7: 0, 9: 1}, [9])
+    assert subset.average_price(0, 0, 30) == pytest.approx(0.2)
+
+
+def test_slot_of():
+    assert slot_of("00:00") == 0 and slot_of("24:00") == SLOTS_PER_DAY and slot_of("09:15") == 37
+    with pytest.raises(ValueError):
+        slot_of("09:10")
+
+
+def test_build_and_load_tariffs(tmp_path):
+    pd.DataFrame({"ID": [1, 2, 3], "latitude": [50.0, 51.0, 52.0], "longitude": [10.0, 11.0, 12.0], "max_power_kW": 150,
+                  "price_€/kWh": [0.6, 0.7, 0.8], "source": ["Public", "Depot", "Public"]}).to_csv(tmp_path / "combined_charge_points.csv", index=False)
+    pd.DataFrame({"ID": [None, 3, 99], "source": ["Public", None, None], "from": ["22:00", "00:00", "00:00"], "to": ["06:00", "12:00", "24:00"],
+                  "price_€/kWh": [0.3, 0.1, 0.2]}).to_csv(tmp_path / "tariffs.csv", index=False)
+    assert build_tariffs(tmp_path / "tariffs.csv", tmp_path) == 2
+
+    # station 4 is not in the file and keeps its static price
+    table = load_tariffs(tmp_path, np.array([1, 2, 3, 4]), [0.6, 0.7, 0.8, 0.9])
+    assert table.average_price(0, 14 * 60, 60) == pytest.approx(0.3)   # 23:00
+    assert table.average_price(0, 0, 60) == pytest.approx(0.6)         # 09:00
+    assert table.average_price(1, 14 * 60, 60) == pytest.approx(0.7)
+    assert table.average_price(2, 16 * 60, 60) == pytest.approx(0.1)   # 01:00, the later row overrides the source one
+    assert table.average_price(2, 13 * 60, 60) == pytest.approx(0.3)   # 22:00
+    assert table.average_price(3, 0, 60) == pytest.approx(0.9)
+    assert load_tariffs(tmp_path / "missing", np.array([1]), [0.6]) is None
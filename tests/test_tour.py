@@ -0,0 +1,63 @@
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tour import held_karp, or_opt, plan_tour, solve_tour, tour_length, two_opt
+
+
+def random_distances(n, rng, symmetric=True):
+    if symmetric:
+        points = rng.uniform(0, 500, (n, 2))
+        return np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    distances = rng.uniform(1, 500, (n, n))
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def brute_force(distances):
+    return min(tour_length(distances, order) for order in itertools.permutations(range(1, len(distances))))
+
+
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_held_karp_matches_brute_force(symmetric):
+    rng = np.random.default_rng(0)
+    for n in range(2, 9):
+        distances = random_distances(n, rng, symmetric)
+        order = held_karp(distances)
+        assert sorted(order) == list(range(1, n))
+        assert tour_length(distances, order) == pytest.approx(brute_force(distances))
+
+
+@pytest.mark.parametrize("move", [two_opt, or_opt])
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_moves_shorten_the_tour(move, symmetric):
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        n = int(rng.integers(5, 12))
+        distances = random_distances(n, rng, symmetric)
+        route = np.array([0, *rng.permutation(np.arange(1, n)), 0], dtype=np.intp)
+        length = tour_length(distances, route[1:-1])
+        while move(distances, route, time.perf_counter() + 10):
+            assert sorted(route[1:-1]) == list(range(1, n))
+            shorter = tour_length(distances, route[1:-1])
+            assert shorter < length
+            length = shorter
+
+
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_heuristic_tour_visits_every_stop(symmetric):
+    distances = random_distances(40, np.random.default_rng(2), symmetric)
+    order = solve_tour(distances, time_budget=0.2)
+    assert sorted(order) == list(range(1, 40))
+    assert tour_length(distances, order) <= tour_length(distances, list(range(1, 40)))
+
+
+def test_plan_tour_returns_labels():
+    labels = ["Depot", "A", "B", "C", 17]
+    distances = pd.DataFrame(random_distances(5, np.random.default_rng(3)), index=labels, columns=labels)
+    tour = plan_tour(distances, "Depot", ["C", "A", "B"])
+    assert tour[0] == tour[-1] == "Depot"
+    assert sorted(tour[1:-1]) == ["A", "B", "C"]
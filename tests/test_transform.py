@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.brain import PlanStep, ticks
+from app.Matrix_data_process import transform
+from app.reference_data import station_row_index
+
+
+@pytest.fixture
+def stations():
+    return pd.DataFrame({"ID": [905, 12, 377], "latitude": [50.1, 49.2, 48.3], "longitude": [11.1, 10.2, 9.3],
+                         "max_power_kW": [150, 400, 50], "price_€/kWh": [0.5, 0.6, 0.7], "source": "Public"})
+
+
+city_choices = {"Depot": [52.0, 13.0], "Customer": [48.7, 9.2]}
+
+
+def test_charger_and_customer_steps_and_totals(stations):
+    plan = [
+        PlanStep("Start", "", "Depot", 0, 0, 500.0, 0, 0),
+        PlanStep("drive_to_charger", "Depot", 12, 0, ticks(150), 200.0, 200.0, 10.0),
+        PlanStep("charging", 12, 12, ticks(150), ticks(180), 480.0, np.nan, 168.0),
+        PlanStep("drive_to_load/unload", 12, "Customer", ticks(180), ticks(270), 340.4, 120.0, 6.0),
+    ]
+    result = transform(plan, city_choices, stations, station_row_index(stations["ID"]))
+
+    route = result["route"]
+    assert [p["action"] for p in route] == ["Start", "drive_to_charger", "charging", "drive_to_load/unload"]
+    assert [p["location"] for p in route] == ["Depot", "12", "12", "Customer"]
+    # the charger is looked up by its ID, not by its row
+    assert (route[1]["latitude"], route[1]["longitude"]) == (49.2, 10.2)
+    assert (route[2]["latitude"], route[2]["longitude"]) == (49.2, 10.2)
+    assert (route[3]["latitude"], route[3]["longitude"]) == (48.7, 9.2)
+    assert [p["SOC"] for p in route] == [500, 200, 480, 340]
+    # totals cover the drive steps only, not the charging time
+    assert result["total_distance"] == pytest.approx(320.0)
+    assert result["total_duration"] == pytest.approx(4.0)
+
+
+def test_station_rows_default_to_the_station_table(stations):
+    plan = [PlanStep("charging", 377, 377, 0, ticks(10), 480.0, np.nan, 1.0)]
+    result = transform(plan, city_choices, stations)
+    assert (result["route"][0]["latitude"], result["route"][0]["longitude"]) == (48.3, 9.3)
+    assert result["total_distance"] == 0
+    assert result["total_duration"] == 0